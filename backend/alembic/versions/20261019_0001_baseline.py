@@ -0,0 +1,267 @@
+"""Baseline: schema as created by create_all and migrate.py before Alembic
+
+Existing databases brought up to date by migrate.py should be stamped at
+this revision (alembic stamp 0001); on an empty database it creates the
+same tables, indexes and full-text search index. The DDL is written out
+rather than taken from the models, so later model changes never alter it.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+PG_SEARCH_INDEX = (
+    "CREATE INDEX ix_conversations_search ON conversations USING GIN (("
+    "setweight(to_tsvector('english', coalesce(user_message, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(tool_selected, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(final_response, '')), 'B')))"
+)
+
+SQLITE_SEARCH_TABLE = [
+    """CREATE VIRTUAL TABLE conversations_fts USING fts5(
+        user_message, final_response, tool_selected,
+        content='conversations', content_rowid='id'
+    )""",
+    """CREATE TRIGGER conversations_fts_insert AFTER INSERT ON conversations BEGIN
+        INSERT INTO conversations_fts(rowid, user_message, final_response, tool_selected)
+        VALUES (new.id, new.user_message, new.final_response, new.tool_selected);
+    END""",
+    """CREATE TRIGGER conversations_fts_delete AFTER DELETE ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, user_message, final_response, tool_selected)
+        VALUES ('delete', old.id, old.user_message, old.final_response, old.tool_selected);
+    END""",
+    """CREATE TRIGGER conversations_fts_update AFTER UPDATE ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, user_message, final_response, tool_selected)
+        VALUES ('delete', old.id, old.user_message, old.final_response, old.tool_selected);
+        INSERT INTO conversations_fts(rowid, user_message, final_response, tool_selected)
+        VALUES (new.id, new.user_message, new.final_response, new.tool_selected);
+    END""",
+]
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("email", sa.String, nullable=False),
+        sa.Column("hashed_password", sa.String, nullable=False),
+        sa.Column("public_key", sa.String, nullable=False, unique=True),
+        sa.Column("encrypted_private_key", sa.Text, nullable=False),
+        sa.Column("wallet_address", sa.String(42)),
+        sa.Column("groq_api_key", sa.Text),
+        sa.Column("is_admin", sa.Boolean),
+        sa.Column("created_at", sa.DateTime)
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "tools",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("name", sa.String, nullable=False),
+        sa.Column("description", sa.Text, nullable=False),
+        sa.Column("api_url", sa.String, nullable=False),
+        sa.Column("api_method", sa.String),
+        sa.Column("api_headers", sa.Text),
+        sa.Column("api_body_template", sa.Text),
+        sa.Column("metadata_hash", sa.String, nullable=False),
+        sa.Column("price_mnee", sa.Float, nullable=False),
+        sa.Column("trigger_phrases", sa.Text),
+        sa.Column("parameter_extractors", sa.Text),
+        sa.Column("result_projection", sa.Text),
+        sa.Column("warmup_url", sa.String),
+        sa.Column("health_url", sa.String),
+        sa.Column("health_interval_seconds", sa.Integer),
+        sa.Column("keep_warm_minutes", sa.Integer),
+        sa.Column("owner_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("approved", sa.Boolean),
+        sa.Column("active", sa.Boolean),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("updated_at", sa.DateTime)
+    )
+    op.create_index("ix_tools_id", "tools", ["id"])
+    op.create_index("ix_tools_name", "tools", ["name"])
+
+    op.create_table(
+        "settlements",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("payer_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("payee_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("amount_mnee", sa.Float, nullable=False),
+        sa.Column("transaction_count", sa.Integer, nullable=False),
+        sa.Column("tx_hash", sa.String, unique=True),
+        sa.Column("status", sa.String),
+        sa.Column("error", sa.Text),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("submitted_at", sa.DateTime),
+        sa.Column("confirmed_at", sa.DateTime)
+    )
+    op.create_index("ix_settlements_id", "settlements", ["id"])
+
+    op.create_table(
+        "transactions",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("from_user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("to_user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("tool_id", sa.Integer, sa.ForeignKey("tools.id"), nullable=False),
+        sa.Column("amount_mnee", sa.Float, nullable=False),
+        sa.Column("tx_hash", sa.String, nullable=False, unique=True),
+        sa.Column("status", sa.String),
+        sa.Column("settlement_id", sa.Integer, sa.ForeignKey("settlements.id")),
+        sa.Column("block_number", sa.Integer),
+        sa.Column("gas_used", sa.Integer),
+        sa.Column("confirmed_at", sa.DateTime),
+        sa.Column("created_at", sa.DateTime)
+    )
+    op.create_index("ix_transactions_id", "transactions", ["id"])
+    op.create_index("ix_transactions_settlement_id", "transactions", ["settlement_id"])
+    op.create_index("ix_transactions_to_user_id_id", "transactions", ["to_user_id", "id"])
+    op.create_index("ix_transactions_from_user_id_id", "transactions", ["from_user_id", "id"])
+
+    op.create_table(
+        "conversations",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("user_message", sa.Text, nullable=False),
+        sa.Column("tool_selected", sa.String),
+        sa.Column("tool_result", sa.Text),
+        sa.Column("final_response", sa.Text, nullable=False),
+        sa.Column("created_at", sa.DateTime)
+    )
+    op.create_index("ix_conversations_id", "conversations", ["id"])
+
+    op.create_table(
+        "routing_decisions",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("conversation_id", sa.Integer, sa.ForeignKey("conversations.id")),
+        sa.Column("user_message", sa.Text, nullable=False),
+        sa.Column("strategy", sa.String, nullable=False),
+        sa.Column("tool_id", sa.Integer),
+        sa.Column("confidence", sa.Float),
+        sa.Column("matched_rule", sa.String),
+        sa.Column("shadow_checked", sa.Boolean),
+        sa.Column("shadow_llm_tool_id", sa.Integer),
+        sa.Column("latency_ms", sa.Float, nullable=False),
+        sa.Column("created_at", sa.DateTime)
+    )
+    op.create_index("ix_routing_decisions_id", "routing_decisions", ["id"])
+
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("kind", sa.String, nullable=False),
+        sa.Column("payload", sa.Text, nullable=False),
+        sa.Column("status", sa.String),
+        sa.Column("result", sa.Text),
+        sa.Column("error", sa.Text),
+        sa.Column("attempts", sa.Integer),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("started_at", sa.DateTime),
+        sa.Column("finished_at", sa.DateTime)
+    )
+    op.create_index("ix_jobs_user_id", "jobs", ["user_id"])
+    op.create_index("ix_jobs_status", "jobs", ["status"])
+
+    op.create_table(
+        "tool_result_archive",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("tool_id", sa.Integer, sa.ForeignKey("tools.id"), nullable=False),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("raw_result", sa.Text, nullable=False),
+        sa.Column("created_at", sa.DateTime)
+    )
+    op.create_index("ix_tool_result_archive_id", "tool_result_archive", ["id"])
+
+    op.create_table(
+        "tool_health",
+        sa.Column("tool_id", sa.Integer, sa.ForeignKey("tools.id"), primary_key=True),
+        sa.Column("status", sa.String),
+        sa.Column("last_checked_at", sa.DateTime),
+        sa.Column("last_up_at", sa.DateTime),
+        sa.Column("last_latency_ms", sa.Float),
+        sa.Column("cold_start_latency_ms", sa.Float),
+        sa.Column("consecutive_failures", sa.Integer),
+        sa.Column("checks_total", sa.Integer),
+        sa.Column("checks_failed", sa.Integer),
+        sa.Column("last_error", sa.Text)
+    )
+
+    op.create_table(
+        "user_balances",
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("earned_mnee", sa.Float, nullable=False),
+        sa.Column("spent_mnee", sa.Float, nullable=False),
+        sa.Column("updated_at", sa.DateTime)
+    )
+
+    op.create_table(
+        "credit_accounts",
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("balance_mnee", sa.Float, nullable=False),
+        sa.Column("updated_at", sa.DateTime)
+    )
+
+    op.create_table(
+        "credit_deposits",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("tx_hash", sa.String, nullable=False, unique=True),
+        sa.Column("amount_mnee", sa.Float, nullable=False),
+        sa.Column("block_number", sa.Integer),
+        sa.Column("status", sa.String),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("confirmed_at", sa.DateTime)
+    )
+    op.create_index("ix_credit_deposits_id", "credit_deposits", ["id"])
+    op.create_index("ix_credit_deposits_user_id", "credit_deposits", ["user_id"])
+
+    op.create_table(
+        "credit_withdrawals",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("to_address", sa.String(42), nullable=False),
+        sa.Column("amount_mnee", sa.Float, nullable=False),
+        sa.Column("tx_hash", sa.String, unique=True),
+        sa.Column("status", sa.String),
+        sa.Column("error", sa.Text),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("submitted_at", sa.DateTime),
+        sa.Column("confirmed_at", sa.DateTime)
+    )
+    op.create_index("ix_credit_withdrawals_id", "credit_withdrawals", ["id"])
+    op.create_index("ix_credit_withdrawals_user_id", "credit_withdrawals", ["user_id"])
+
+    # Full-text search over conversations (app.conversation_search)
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute(PG_SEARCH_INDEX)
+    elif dialect == "sqlite":
+        for statement in SQLITE_SEARCH_TABLE:
+            op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("DROP INDEX ix_conversations_search")
+    elif dialect == "sqlite":
+        for trigger in ("insert", "delete", "update"):
+            op.execute(f"DROP TRIGGER conversations_fts_{trigger}")
+        op.execute("DROP TABLE conversations_fts")
+
+    for table in (
+        "credit_withdrawals", "credit_deposits", "credit_accounts", "user_balances", "tool_health",
+        "tool_result_archive", "jobs", "routing_decisions", "conversations", "transactions",
+        "settlements", "tools", "users"
+    ):
+        op.drop_table(table)
@@ -0,0 +1,66 @@
+"""Composite indexes for the hot transaction, tool and conversation queries
+
+Built with CREATE INDEX CONCURRENTLY on Postgres so payments keep flowing
+while they build. Each index is named after the query it serves; run
+python -m app.query_plans afterwards to confirm the planner uses them.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+from sqlalchemy import text
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# (name, table, columns)
+INDEXES = [
+    # Earnings / spending pages: WHERE to_user_id (from_user_id) = ? ORDER BY id DESC
+    ("ix_transactions_to_user_id_id", "transactions", "to_user_id, id"),
+    ("ix_transactions_from_user_id_id", "transactions", "from_user_id, id"),
+    # Earnings / spending totals, balance ledger rebuilds and outstanding debits:
+    # user + status filter summing amount_mnee, answered from the index alone
+    ("ix_transactions_to_user_status_amount", "transactions", "to_user_id, status, amount_mnee"),
+    ("ix_transactions_from_user_status_amount", "transactions", "from_user_id, status, amount_mnee"),
+    # Agent chat: the user's latest payment for a tool
+    ("ix_transactions_from_user_tool_created", "transactions", "from_user_id, tool_id, created_at"),
+    # Confirmation tracker and settlement netting: WHERE status = ? AND id > ? ORDER BY id
+    ("ix_transactions_status_id", "transactions", "status, id"),
+    # Tool health keep-warm: recent calls per tool
+    ("ix_transactions_created_tool", "transactions", "created_at, tool_id"),
+    # My tools
+    ("ix_tools_owner_id", "tools", "owner_id"),
+    # Conversation history: WHERE user_id = ? ORDER BY created_at DESC
+    ("ix_conversations_user_created", "conversations", "user_id, created_at"),
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        for name, table, columns in INDEXES:
+            op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+        return
+
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            # A previously interrupted concurrent build leaves an INVALID index behind
+            invalid = bind.execute(text("""
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :name AND NOT i.indisvalid
+            """), {"name": name}).first()
+            if invalid:
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def downgrade():
+    concurrently = "CONCURRENTLY " if op.get_bind().dialect.name == "postgresql" else ""
+    with op.get_context().autocommit_block():
+        for name, _, _ in INDEXES:
+            op.execute(f"DROP INDEX {concurrently}IF EXISTS {name}")
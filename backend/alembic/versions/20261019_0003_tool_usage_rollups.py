@@ -0,0 +1,55 @@
+"""Hourly and daily tool usage rollups
+
+Adds tool_usage_rollups and its refresh watermark, plus an index on
+transactions.confirmed_at so the aggregator finds finalized payments
+without a scan. The rollups fill on the aggregator's first run.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "tool_usage_rollups",
+        sa.Column("tool_id", sa.Integer, sa.ForeignKey("tools.id"), primary_key=True),
+        sa.Column("granularity", sa.String(8), primary_key=True),
+        sa.Column("bucket_start", sa.DateTime, primary_key=True),
+        sa.Column("owner_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("calls", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("gross_mnee", sa.Float, nullable=False, server_default="0"),
+        sa.Column("unique_payers", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("failures", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime)
+    )
+    op.create_index(
+        "ix_tool_usage_rollups_owner_bucket", "tool_usage_rollups", ["owner_id", "granularity", "bucket_start"]
+    )
+    op.create_table(
+        "rollup_watermarks",
+        sa.Column("name", sa.String, primary_key=True),
+        sa.Column("last_transaction_id", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("last_run_at", sa.DateTime)
+    )
+
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_transactions_confirmed_at ON transactions (confirmed_at)")
+    else:
+        op.execute("CREATE INDEX IF NOT EXISTS ix_transactions_confirmed_at ON transactions (confirmed_at)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_transactions_confirmed_at")
+    op.drop_table("rollup_watermarks")
+    op.drop_index("ix_tool_usage_rollups_owner_bucket", table_name="tool_usage_rollups")
+    op.drop_table("tool_usage_rollups")
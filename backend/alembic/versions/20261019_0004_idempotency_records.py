@@ -0,0 +1,35 @@
+"""Idempotency records for payment and paid-execution endpoints
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "idempotency_records",
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("key", sa.String(255), primary_key=True),
+        sa.Column("scope", sa.String, nullable=False),
+        sa.Column("fingerprint", sa.String(64), nullable=False),
+        sa.Column("status", sa.String, server_default="in_progress"),
+        sa.Column("response_status", sa.Integer),
+        sa.Column("response_body", sa.Text),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("expires_at", sa.DateTime, nullable=False)
+    )
+    op.create_index("ix_idempotency_records_expires_at", "idempotency_records", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("ix_idempotency_records_expires_at", table_name="idempotency_records")
+    op.drop_table("idempotency_records")
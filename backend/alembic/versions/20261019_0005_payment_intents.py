@@ -0,0 +1,41 @@
+"""Payment intents for the queued on-chain payment pipeline
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "payment_intents",
+        sa.Column("id", sa.String, primary_key=True),
+        sa.Column("payer_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("payee_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("tool_id", sa.Integer, sa.ForeignKey("tools.id"), nullable=False),
+        sa.Column("recipient", sa.String(42), nullable=False),
+        sa.Column("amount_mnee", sa.Float, nullable=False),
+        sa.Column("status", sa.String, server_default="queued"),
+        sa.Column("attempts", sa.Integer, server_default="0"),
+        sa.Column("tx_hash", sa.String),
+        sa.Column("transaction_id", sa.Integer, sa.ForeignKey("transactions.id")),
+        sa.Column("error", sa.Text),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("updated_at", sa.DateTime)
+    )
+    op.create_index("ix_payment_intents_payer_id", "payment_intents", ["payer_id"])
+    op.create_index("ix_payment_intents_status_created", "payment_intents", ["status", "created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_payment_intents_status_created", table_name="payment_intents")
+    op.drop_index("ix_payment_intents_payer_id", table_name="payment_intents")
+    op.drop_table("payment_intents")
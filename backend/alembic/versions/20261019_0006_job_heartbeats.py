@@ -0,0 +1,22 @@
+"""Heartbeat column for leasing jobs across worker processes
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("jobs", sa.Column("heartbeat_at", sa.DateTime))
+
+
+def downgrade():
+    op.drop_column("jobs", "heartbeat_at")
@@ -0,0 +1,34 @@
+"""Last-change timestamp on transactions
+
+Adds transactions.updated_at so the usage aggregator sees every status
+change (failed, dropped, refunded, settled), not only those that set
+confirmed_at. Existing rows are backfilled from their last known change.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("transactions", sa.Column("updated_at", sa.DateTime))
+    op.execute("UPDATE transactions SET updated_at = COALESCE(confirmed_at, created_at)")
+
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.execute("CREATE INDEX CONCURRENTLY ix_transactions_updated_at ON transactions (updated_at)")
+    else:
+        op.create_index("ix_transactions_updated_at", "transactions", ["updated_at"])
+
+
+def downgrade():
+    op.drop_index("ix_transactions_updated_at", table_name="transactions")
+    op.drop_column("transactions", "updated_at")
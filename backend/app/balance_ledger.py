@@ -0,0 +1,206 @@
+"""
+Per-User Balance Ledger
+Keeps user_balances in step with the transactions table inside the same
+database transaction as every payment insert or status change, so a
+balance read is a primary-key lookup; reconcile_balances rebuilds it from
+the raw transaction log
+"""
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from sqlalchemy import event, func, inspect, update, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import Transaction, User, UserBalance
+
+settings = get_settings()
+
+# Statuses that count towards a balance (failed/dropped payments never moved funds;
+# off-chain payments count from the moment they accrue)
+COUNTED_STATUSES = ("confirmed", "completed", "pending", "accrued", "settling", "settled")
+
+# Simulated starting balance for the demo
+STARTING_BALANCE_MNEE = 1000.0
+
+# Float drift tolerated before reconciliation rewrites a row
+TOLERANCE = 1e-9
+
+
+def _contribution(from_user_id: int, to_user_id: int, amount: float, status: Optional[str]) -> Dict[int, Tuple[float, float]]:
+    """user_id -> (earned, spent) a single transaction contributes"""
+    if status not in COUNTED_STATUSES or from_user_id == to_user_id or not amount:
+        return {}
+    return {to_user_id: (amount, 0.0), from_user_id: (0.0, amount)}
+
+
+def _previous(tx: Transaction, name: str):
+    history = inspect(tx).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(tx, name)
+
+
+def _collect_deltas(session: Session) -> Dict[int, list]:
+    deltas: Dict[int, list] = defaultdict(lambda: [0.0, 0.0])
+
+    def apply(contribution: Dict[int, Tuple[float, float]], sign: int):
+        for user_id, (earned, spent) in contribution.items():
+            deltas[user_id][0] += sign * earned
+            deltas[user_id][1] += sign * spent
+
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            apply(_contribution(obj.from_user_id, obj.to_user_id, obj.amount_mnee, obj.status), 1)
+    for obj in session.dirty:
+        if isinstance(obj, Transaction) and session.is_modified(obj):
+            apply(_contribution(
+                _previous(obj, "from_user_id"), _previous(obj, "to_user_id"),
+                _previous(obj, "amount_mnee"), _previous(obj, "status")
+            ), -1)
+            apply(_contribution(obj.from_user_id, obj.to_user_id, obj.amount_mnee, obj.status), 1)
+    for obj in session.deleted:
+        if isinstance(obj, Transaction):
+            apply(_contribution(
+                _previous(obj, "from_user_id"), _previous(obj, "to_user_id"),
+                _previous(obj, "amount_mnee"), _previous(obj, "status")
+            ), -1)
+    return {user_id: delta for user_id, delta in deltas.items() if delta[0] or delta[1]}
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _update_balances(session: Session, flush_context):
+    """Apply balance deltas for the flushed transactions on the flush's own connection"""
+    connection = session.connection()
+    now = datetime.utcnow()
+
+    for obj in session.new:
+        if isinstance(obj, User):
+            connection.execute(insert(UserBalance).values(user_id=obj.id, earned_mnee=0.0, spent_mnee=0.0, updated_at=now))
+
+    # Lock rows in user_id order, so concurrent A->B and B->A payments cannot deadlock
+    for user_id, (earned, spent) in sorted(_collect_deltas(session).items()):
+        result = connection.execute(
+            update(UserBalance).where(UserBalance.user_id == user_id).values(
+                earned_mnee=UserBalance.earned_mnee + earned,
+                spent_mnee=UserBalance.spent_mnee + spent,
+                updated_at=now
+            )
+        )
+        if result.rowcount == 0:
+            # User predates the ledger and reconciliation has not reached them yet. A
+            # concurrent first payment may create the row meanwhile: then add our delta
+            # to it (its totals already cover everything committed before it)
+            earned_total, spent_total = compute_totals(session, user_id)
+            dialect_insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+            statement = dialect_insert(UserBalance).values(
+                user_id=user_id, earned_mnee=earned_total, spent_mnee=spent_total, updated_at=now
+            )
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[UserBalance.user_id],
+                set_={
+                    "earned_mnee": UserBalance.earned_mnee + earned,
+                    "spent_mnee": UserBalance.spent_mnee + spent,
+                    "updated_at": now
+                }
+            ))
+
+
+def compute_totals(db: Session, user_id: int) -> Tuple[float, float]:
+    """(earned, spent) for one user straight from the transaction log"""
+    earned = db.query(func.sum(Transaction.amount_mnee)).filter(
+        Transaction.to_user_id == user_id,
+        Transaction.from_user_id != user_id,
+        Transaction.status.in_(COUNTED_STATUSES)
+    ).scalar() or 0.0
+    spent = db.query(func.sum(Transaction.amount_mnee)).filter(
+        Transaction.from_user_id == user_id,
+        Transaction.to_user_id != user_id,
+        Transaction.status.in_(COUNTED_STATUSES)
+    ).scalar() or 0.0
+    return float(earned), float(spent)
+
+
+def get_balance(db: Session, user_id: int) -> UserBalance:
+    """The user's ledger row, built from the log if it does not exist yet"""
+    balance = db.get(UserBalance, user_id)
+    if balance is None:
+        earned, spent = compute_totals(db, user_id)
+        balance = UserBalance(user_id=user_id, earned_mnee=earned, spent_mnee=spent)
+        db.add(balance)
+        db.commit()
+    return balance
+
+
+def reconcile_balances(db: Session) -> Dict[str, int]:
+    """
+    Rebuild user_balances from the transactions table
+
+    Returns:
+        Counts of rows checked, corrected and created
+    """
+    # Lock the ledger first: payments flushing meanwhile wait for this commit and then
+    # apply their delta on top, while anything already committed is in the sums below
+    # (in user_id order, the same order payments lock rows in)
+    existing = {row.user_id: row for row in db.query(UserBalance).order_by(UserBalance.user_id).with_for_update()}
+
+    totals: Dict[int, list] = defaultdict(lambda: [0.0, 0.0])
+    counted = db.query(Transaction.to_user_id, Transaction.from_user_id, func.sum(Transaction.amount_mnee)).filter(
+        Transaction.from_user_id != Transaction.to_user_id,
+        Transaction.status.in_(COUNTED_STATUSES)
+    ).group_by(Transaction.to_user_id, Transaction.from_user_id)
+    for to_user_id, from_user_id, amount in counted:
+        totals[to_user_id][0] += amount or 0.0
+        totals[from_user_id][1] += amount or 0.0
+
+    checked = corrected = created = 0
+    for (user_id,) in db.query(User.id):
+        checked += 1
+        earned, spent = totals.get(user_id, (0.0, 0.0))
+        row = existing.get(user_id)
+        if row is None:
+            db.add(UserBalance(user_id=user_id, earned_mnee=earned, spent_mnee=spent))
+            created += 1
+        elif abs(row.earned_mnee - earned) > TOLERANCE or abs(row.spent_mnee - spent) > TOLERANCE:
+            print(f"Balance drift for user {user_id}: ledger ({row.earned_mnee}, {row.spent_mnee}) vs log ({earned}, {spent})")
+            row.earned_mnee = earned
+            row.spent_mnee = spent
+            corrected += 1
+    db.commit()
+    return {"checked": checked, "corrected": corrected, "created": created}
+
+
+class BalanceReconciler:
+    """Periodically rebuilds the ledger to catch writes that bypassed the ORM"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if settings.balance_reconcile_interval_seconds > 0:
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.balance_reconcile_interval_seconds)
+            db = SessionLocal()
+            try:
+                result = await asyncio.to_thread(reconcile_balances, db)
+                if result["corrected"] or result["created"]:
+                    print(f"Balance reconciliation: {result}")
+            except Exception as e:
+                print(f"Balance reconciliation failed: {e}")
+            finally:
+                db.close()
+
+
+balance_reconciler = BalanceReconciler()
@@ -0,0 +1,145 @@
+"""
+Batched On-Chain Balance Reads
+Reads MNEE balances for many addresses with Multicall3 aggregate3 calls
+(or JSON-RPC batches where no Multicall contract is deployed, e.g. on a
+local chain), pinned to one block and cached for the lifetime of that block
+"""
+
+import asyncio
+import json
+import time
+from decimal import Decimal
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from app.config import get_settings
+from app.chain import (
+    get_web3, get_token_decimals, rpc_batch, metadata_cache, to_checksum, balance_of_calldata
+)
+
+settings = get_settings()
+
+MULTICALL3_ABI = json.loads('''[
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"}
+                ],
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"}
+                ],
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]''')
+
+
+@dataclass
+class BalanceSnapshot:
+    block_number: int
+    source: str  # multicall, rpc_batch or cache
+    balances: Dict[str, int]  # Checksummed address -> smallest units (MNEE Decimal from get_mnee_balances)
+
+
+class BalanceReader:
+    """Per-block cache in front of multicall / batched eth_call balance reads"""
+
+    def __init__(self):
+        self.block_number: Optional[int] = None
+        self.balances: Dict[str, int] = {}
+        # Monotonic time until which multicall is assumed missing on this chain
+        self.multicall_unavailable_until = 0.0
+
+    async def current_block(self) -> int:
+        async def load():
+            return await (await get_web3()).eth.block_number
+        return await metadata_cache.get("block_number", settings.block_number_ttl_seconds, load)
+
+    async def _multicall(self, addresses: List[str], block: int) -> Dict[str, int]:
+        w3 = await get_web3()
+        multicall = w3.eth.contract(address=to_checksum(settings.multicall_address), abi=MULTICALL3_ABI)
+        token = to_checksum(settings.mnee_contract_address)
+
+        async def chunk(part: List[str]) -> Dict[str, int]:
+            calls = [(token, True, balance_of_calldata(address)) for address in part]
+            results = await multicall.functions.aggregate3(calls).call(block_identifier=block)
+            return {
+                address: int.from_bytes(data, "big")
+                for address, (success, data) in zip(part, results)
+                if success and len(data) == 32
+            }
+
+        size = settings.multicall_batch_size
+        parts = await asyncio.gather(*(chunk(addresses[i:i + size]) for i in range(0, len(addresses), size)))
+        return {address: balance for part in parts for address, balance in part.items()}
+
+    async def _rpc_batch(self, addresses: List[str], block: int) -> Dict[str, int]:
+        token = settings.mnee_contract_address
+        results = await rpc_batch([
+            ("eth_call", [{"to": token, "data": "0x" + balance_of_calldata(address).hex()}, hex(block)])
+            for address in addresses
+        ])
+        return {address: int(result, 16) for address, result in zip(addresses, results) if result}
+
+    async def get_balances(self, addresses: List[str]) -> BalanceSnapshot:
+        """
+        MNEE balances for the given addresses at the latest block
+
+        Args:
+            addresses: Ethereum addresses, any case
+
+        Returns:
+            Snapshot whose balances omit addresses whose call failed
+        """
+        addresses = list(dict.fromkeys(to_checksum(address) for address in addresses))
+        block = await self.current_block()
+        if block != self.block_number:
+            self.block_number = block
+            self.balances = {}
+
+        missing = [address for address in addresses if address not in self.balances]
+        source = "cache"
+        if missing:
+            fetched = None
+            if time.monotonic() >= self.multicall_unavailable_until:
+                try:
+                    fetched = await self._multicall(missing, block)
+                    source = "multicall"
+                except Exception as e:
+                    # No Multicall3 on this chain (or it reverted): use plain batches for a while
+                    print(f"Multicall balance read failed, falling back to RPC batches: {e}")
+                    self.multicall_unavailable_until = time.monotonic() + settings.multicall_retry_seconds
+            if fetched is None:
+                fetched = await self._rpc_batch(missing, block)
+                source = "rpc_batch"
+            # Only cache if the head did not move while we were reading
+            if block == self.block_number:
+                self.balances.update(fetched)
+            known = {**self.balances, **fetched}
+        else:
+            known = self.balances
+        return BalanceSnapshot(block, source, {address: known[address] for address in addresses if address in known})
+
+
+balance_reader = BalanceReader()
+
+
+async def get_mnee_balances(addresses: List[str]) -> BalanceSnapshot:
+    """Balances in MNEE (as Decimal) for many addresses in as few round trips as possible"""
+    snapshot, decimals = await asyncio.gather(balance_reader.get_balances(addresses), get_token_decimals())
+    snapshot.balances = {address: Decimal(balance) / (10 ** decimals) for address, balance in snapshot.balances.items()}
+    return snapshot
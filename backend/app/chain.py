@@ -0,0 +1,351 @@
+"""
+Chain Access Layer
+One pooled, non-blocking Web3 connection, one MNEE contract object,
+short-lived caches for chain metadata and gas estimates, and a background
+fee oracle, so payments only spend RPC round trips on calls that actually
+change between requests and never block the event loop while waiting on
+the node
+"""
+
+import asyncio
+import json
+import time
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import aiohttp
+from web3 import AsyncWeb3, Web3
+from web3.contract import AsyncContract
+from eth_account import Account
+from app.config import get_settings
+from app.nonce_manager import NonceManager, is_nonce_error
+from app.fee_oracle import FeeOracle, FeeSuggestion
+
+settings = get_settings()
+
+TRANSFER_SELECTOR = bytes.fromhex("a9059cbb")
+BALANCE_OF_SELECTOR = bytes.fromhex("70a08231")
+
+# MNEE ERC-20 ABI (the subset the marketplace uses)
+MNEE_ABI = json.loads('''[
+    {
+        "constant": false,
+        "inputs": [
+            {"name": "_to", "type": "address"},
+            {"name": "_value", "type": "uint256"}
+        ],
+        "name": "transfer",
+        "outputs": [{"name": "", "type": "bool"}],
+        "type": "function"
+    },
+    {
+        "constant": true,
+        "inputs": [{"name": "_owner", "type": "address"}],
+        "name": "balanceOf",
+        "outputs": [{"name": "balance", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": true,
+        "inputs": [],
+        "name": "decimals",
+        "outputs": [{"name": "", "type": "uint8"}],
+        "type": "function"
+    }
+]''')
+
+
+class InsufficientBalance(Exception):
+    def __init__(self, required: int, available: int, decimals: int):
+        super().__init__(f"Insufficient MNEE balance: required {required}, available {available}")
+        self.required = required
+        self.available = available
+        self.available_mnee = Decimal(available) / (10 ** decimals)
+
+
+class RPCError(Exception):
+    pass
+
+
+class TTLCache:
+    """Cache of coroutine results that expire after a fixed age; concurrent misses share one load"""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[float, Any]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def get(self, key: str, ttl: float, loader: Callable[[], Awaitable[Any]]) -> Any:
+        cached = self._values.get(key)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            cached = self._values.get(key)
+            if cached and time.monotonic() - cached[0] < ttl:
+                return cached[1]
+            value = await loader()
+            self._values[key] = (time.monotonic(), value)
+            return value
+
+    def clear(self):
+        self._values.clear()
+
+
+metadata_cache = TTLCache()
+
+_web3: Optional[AsyncWeb3] = None
+_session: Optional[aiohttp.ClientSession] = None
+_contract: Optional[AsyncContract] = None
+_web3_lock = asyncio.Lock()
+
+
+async def get_web3() -> AsyncWeb3:
+    """Process-wide async Web3 client on a pooled keep-alive aiohttp session"""
+    global _web3, _session
+    if _web3 is None:
+        async with _web3_lock:
+            if _web3 is None:
+                provider = AsyncWeb3.AsyncHTTPProvider(settings.ethereum_rpc_url)
+                _session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=settings.rpc_pool_size),
+                    timeout=aiohttp.ClientTimeout(total=settings.rpc_timeout_seconds)
+                )
+                await provider.cache_async_session(_session)
+                _web3 = AsyncWeb3(provider)
+    return _web3
+
+
+async def close_web3():
+    global _web3, _session, _contract
+    if _session is not None:
+        await _session.close()
+    _web3 = None
+    _session = None
+    _contract = None
+
+
+async def _rpc_post(payload: Any) -> Any:
+    await get_web3()
+    async with _session.post(settings.ethereum_rpc_url, json=payload) as response:
+        response.raise_for_status()
+        return await response.json(content_type=None)
+
+
+async def rpc_batch(calls: List[Tuple[str, list]]) -> List[Any]:
+    """
+    Send several JSON-RPC calls in one HTTP round trip
+
+    Args:
+        calls: (method, params) pairs
+
+    Returns:
+        Results in call order. Falls back to one request per call if the
+        node rejects batches.
+
+    Raises:
+        RPCError: If the node answered any call with an error
+    """
+    if not calls:
+        return []
+    payload = [{"jsonrpc": "2.0", "id": i, "method": method, "params": params} for i, (method, params) in enumerate(calls)]
+    responses = await _rpc_post(payload)
+
+    if not isinstance(responses, list):
+        # Batch requests unsupported: the node answered with a single error object
+        responses = await asyncio.gather(*(_rpc_post(call) for call in payload))
+
+    results: List[Any] = [None] * len(calls)
+    for response in responses:
+        if "error" in response:
+            raise RPCError(f"{calls[response['id']][0]} failed: {response['error']}")
+        results[response["id"]] = response.get("result")
+    return results
+
+
+@lru_cache(maxsize=4096)
+def to_checksum(address: str) -> str:
+    return Web3.to_checksum_address(address)
+
+
+async def get_mnee_contract() -> AsyncContract:
+    global _contract
+    if _contract is None:
+        w3 = await get_web3()
+        _contract = w3.eth.contract(address=to_checksum(settings.mnee_contract_address), abi=MNEE_ABI)
+    return _contract
+
+
+async def get_chain_id() -> int:
+    async def load():
+        return await (await get_web3()).eth.chain_id
+    return await metadata_cache.get("chain_id", settings.chain_metadata_ttl_seconds, load)
+
+
+async def get_token_decimals() -> int:
+    async def load():
+        return await (await get_mnee_contract()).functions.decimals().call()
+    return await metadata_cache.get("decimals", settings.chain_metadata_ttl_seconds, load)
+
+
+fee_oracle = FeeOracle(
+    rpc_batch,
+    settings.fee_tier_percentiles,
+    settings.fee_history_blocks,
+    settings.fee_base_fee_multiplier,
+    settings.fee_min_priority_fee_wei,
+    settings.fee_refresh_seconds,
+    settings.fee_max_age_seconds
+)
+
+
+async def get_fees(tier: Optional[str] = None) -> FeeSuggestion:
+    """Fee suggestion for a speed tier (settings.fee_default_tier if omitted), served from memory"""
+    return await fee_oracle.get(tier or settings.fee_default_tier)
+
+
+def to_token_units(amount_mnee: float, decimals: int) -> int:
+    """Convert an MNEE amount to the token's smallest unit"""
+    return int(Decimal(str(amount_mnee)) * (10 ** decimals))
+
+
+async def _pending_count(address: str) -> int:
+    return await (await get_web3()).eth.get_transaction_count(to_checksum(address), "pending")
+
+
+nonce_manager = NonceManager(_pending_count, settings.nonce_resync_seconds)
+
+
+async def get_mnee_balance(address: str) -> int:
+    return await (await get_mnee_contract()).functions.balanceOf(to_checksum(address)).call()
+
+
+def transfer_calldata(recipient: str, amount: int) -> bytes:
+    """ERC-20 transfer(address,uint256) calldata, laid out directly instead of ABI-encoded"""
+    return TRANSFER_SELECTOR + bytes(12) + bytes.fromhex(recipient[2:]) + amount.to_bytes(32, "big")
+
+
+def balance_of_calldata(address: str) -> bytes:
+    return BALANCE_OF_SELECTOR + bytes.fromhex(address[2:].lower().rjust(64, "0"))
+
+
+async def _transfer_balances(sender: str, recipient: str) -> Tuple[int, int]:
+    """Sender and recipient MNEE balances in one round trip"""
+    token = to_checksum(settings.mnee_contract_address)
+    results = await rpc_batch([
+        ("eth_call", [{"to": token, "data": "0x" + balance_of_calldata(address).hex()}, "latest"])
+        for address in (sender, recipient)
+    ])
+    return int(results[0], 16), int(results[1], 16)
+
+
+async def estimate_transfer_gas(sender: str, recipient: str, amount: int, recipient_balance: int) -> int:
+    """
+    Gas limit for a token transfer, estimated once per token and recipient type
+
+    Transfer cost hardly depends on who sends or how much, but a recipient
+    with no balance yet pays for a fresh storage slot, so new and existing
+    holders are estimated separately. Falls back to settings.transfer_gas_limit
+    (uncached) if the estimate fails.
+    """
+    token = to_checksum(settings.mnee_contract_address)
+    recipient_type = "holder" if recipient_balance else "new"
+
+    async def load():
+        estimate = await (await get_web3()).eth.estimate_gas({
+            "from": to_checksum(sender),
+            "to": token,
+            "data": transfer_calldata(to_checksum(recipient), amount)
+        })
+        return int(estimate * settings.gas_estimate_multiplier)
+
+    try:
+        return await metadata_cache.get(f"transfer_gas:{token}:{recipient_type}", settings.gas_estimate_ttl_seconds, load)
+    except Exception as e:
+        print(f"Gas estimate failed, using {settings.transfer_gas_limit}: {e}")
+        return settings.transfer_gas_limit
+
+
+async def send_transfer(
+    sender: str,
+    sign: Callable[[Dict[str, Any]], Awaitable[bytes]],
+    recipient: str,
+    amount_mnee: float,
+    tier: Optional[str] = None,
+    on_signed: Optional[Callable[[str], Awaitable[None]]] = None
+) -> str:
+    """
+    Build, sign and broadcast an MNEE transfer
+
+    Args:
+        sender: Sending address
+        sign: Signs a transaction dict and returns the raw signed transaction
+        recipient: Recipient address
+        amount_mnee: Amount in MNEE
+        tier: Fee speed tier (settings.fee_default_tier if omitted)
+        on_signed: Called with the transaction hash just before each broadcast
+            attempt; raising from it aborts the transfer unsent
+
+    Returns:
+        Transaction hash (hex)
+
+    Raises:
+        InsufficientBalance: If the sender cannot cover the amount
+    """
+    w3 = await get_web3()
+
+    # Independent reads in one round trip; fees come from the oracle's memory,
+    # and cached metadata and a warm nonce cost nothing
+    (balance, recipient_balance), decimals, chain_id, fees, _ = await asyncio.gather(
+        _transfer_balances(sender, recipient),
+        get_token_decimals(),
+        get_chain_id(),
+        get_fees(tier),
+        nonce_manager.prime(sender)
+    )
+    amount = to_token_units(amount_mnee, decimals)
+    if balance < amount:
+        raise InsufficientBalance(amount, balance, decimals)
+
+    # Everything but the nonce is fixed across retries
+    transaction = {
+        "to": to_checksum(settings.mnee_contract_address),
+        "value": 0,
+        "data": transfer_calldata(to_checksum(recipient), amount),
+        "chainId": chain_id,
+        "gas": await estimate_transfer_gas(sender, recipient, amount, recipient_balance),
+        **fees.transaction_fields()
+    }
+    for attempt in range(settings.nonce_max_attempts):
+        try:
+            async with nonce_manager.reserve(sender) as nonce:
+                raw = await sign({**transaction, "nonce": nonce})
+                if on_signed is not None:
+                    await on_signed(Web3.keccak(raw).hex())
+                return (await w3.eth.send_raw_transaction(raw)).hex()
+        except Exception as e:
+            # A stale nonce has already been resynced from the chain; try again with a fresh one
+            if not is_nonce_error(e) or attempt == settings.nonce_max_attempts - 1:
+                raise
+            print(f"Nonce conflict for {sender}, retrying: {e}")
+
+
+async def transfer_mnee(
+    private_key: str,
+    recipient: str,
+    amount_mnee: float,
+    tier: Optional[str] = None,
+    on_signed: Optional[Callable[[str], Awaitable[None]]] = None
+) -> str:
+    """
+    Sign and broadcast an MNEE transfer from a raw key's account (e.g. the escrow);
+    user wallets go through app.signer, which caches their decrypted accounts
+    (on_signed as for send_transfer)
+
+    Returns:
+        Transaction hash (hex)
+    """
+    account = Account.from_key(private_key)
+
+    async def sign(transaction: Dict[str, Any]) -> bytes:
+        return (await asyncio.to_thread(account.sign_transaction, transaction)).rawTransaction
+
+    return await send_transfer(account.address, sign, recipient, amount_mnee, tier, on_signed)
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Dict
 
 # setting up the contract
 
@@ -12,6 +13,125 @@ class Settings(BaseSettings):
     admin_email: str
     frontend_url: str = "http://localhost:3000"
     
+    # How paid tool calls are charged: onchain (one transfer per call),
+    # ledger (instant off-chain accrual, netted and settled periodically) or
+    # credit (instant debit of prepaid credit deposited to the escrow address)
+    payment_mode: str = "onchain"
+    settlement_interval_seconds: float = 300.0
+    settlement_min_mnee: float = 0.0  # Smaller net positions keep accruing
+    
+    # Prepaid credit escrow (the key signs withdrawals; its address receives deposits)
+    escrow_private_key: str = ""
+    deposit_poll_seconds: float = 15.0
+    deposit_lookback_blocks: int = 5000  # Scanned for deposits on first start
+    deposit_log_chunk_blocks: int = 2000  # Block range per eth_getLogs request
+    
+    # Chain access
+    rpc_pool_size: int = 20
+    rpc_timeout_seconds: float = 30.0
+    chain_metadata_ttl_seconds: float = 3600.0
+    transfer_gas_limit: int = 100000  # Used only when eth_estimateGas fails
+    gas_estimate_ttl_seconds: float = 3600.0  # Transfer gas estimates are cached per token and recipient type
+    gas_estimate_multiplier: float = 1.2
+    nonce_resync_seconds: float = 60.0  # Re-read an idle account's nonce from the chain after this long
+    nonce_max_attempts: int = 3
+    
+    # Fee oracle: EIP-1559 suggestions from eth_feeHistory (gasPrice on legacy chains)
+    fee_refresh_seconds: float = 6.0  # Background refresh (0 = refresh on demand only)
+    fee_max_age_seconds: float = 30.0  # Older suggestions are refreshed before use
+    fee_history_blocks: int = 10
+    fee_tier_percentiles: Dict[str, float] = {"slow": 10.0, "standard": 50.0, "fast": 90.0}
+    fee_default_tier: str = "standard"
+    fee_base_fee_multiplier: float = 2.0  # Headroom for base fee rises before inclusion
+    fee_min_priority_fee_wei: int = 0
+    
+    # Transfer signing for user wallets
+    signer_workers: int = 4
+    signer_cache_size: int = 1000  # Decrypted accounts kept in memory
+    signer_cache_ttl_seconds: float = 600.0
+    
+    # On-chain payment pipeline (payment_mode onchain)
+    payment_workers: int = 8  # Payers are sharded across workers, so each payer's transfers stay in order
+    payment_queue_size: int = 1000  # Per worker
+    payment_rpc_rate_per_second: float = 20.0  # Broadcasts per second toward the RPC (0 = unlimited)
+    payment_rpc_burst: float = 40.0
+    payment_wait_seconds: float = 120.0  # How long a synchronous payment waits for its broadcast
+    payment_lease_seconds: float = 300.0  # Queued/sending intents untouched this long are recovered
+    payment_recovery_seconds: float = 60.0  # 0 disables recovery (single-use processes such as replays)
+    
+    # Batched balance reads (Multicall3 is deployed at this address on most chains)
+    multicall_address: str = "0xcA11bde05977b3631167028862bE2a173976CA11"
+    multicall_batch_size: int = 500
+    multicall_retry_seconds: float = 300.0  # After a failed multicall, use RPC batches this long
+    block_number_ttl_seconds: float = 2.0
+    bulk_balance_max_addresses: int = 1000
+    
+    # Background payment confirmation tracking
+    confirmation_enabled: bool = True
+    confirmation_poll_seconds: float = 10.0
+    confirmation_depth: int = 3  # Blocks (including the inclusion block) before a payment is final
+    confirmation_batch_size: int = 100
+    confirmation_drop_after_seconds: float = 1800.0  # Pending this long and unknown to the node = dropped
+    
+    # Rebuild the per-user balance ledger from the transaction log (0 disables)
+    balance_reconcile_interval_seconds: float = 3600.0
+    
+    # Hourly/daily tool usage rollups (0 disables the aggregator)
+    rollup_interval_seconds: float = 60.0
+    rollup_max_hourly_range_days: int = 31
+    
+    # Idempotency-Key handling for payment and paid-execution endpoints
+    idempotency_ttl_seconds: float = 86400.0  # Stored responses are replayed this long
+    idempotency_lock_seconds: float = 300.0  # An unfinished attempt older than this is treated as dead
+    idempotency_wait_seconds: float = 60.0  # How long a duplicate waits for the first attempt
+    idempotency_poll_seconds: float = 0.5
+    idempotency_purge_interval_seconds: float = 600.0
+    
+    # Streaming CSV/NDJSON exports
+    export_chunk_rows: int = 1000  # Rows fetched per cursor round trip and written per chunk
+    
+    # Fast-path tool routing
+    fast_path_enabled: bool = True
+    fast_path_min_confidence: float = 0.85
+    fast_path_shadow_rate: float = 0.0  # Fraction of fast-path hits also checked against the LLM
+    
+    # Gemini tool selection retries on unparseable or failed responses
+    selection_max_attempts: int = 2
+    
+    # Speculative pre-warming of likely tool hosts during LLM selection
+    prewarm_enabled: bool = True
+    prewarm_max_hosts: int = 3
+    prewarm_concurrency: int = 3
+    prewarm_budget_seconds: float = 3.0
+    
+    # Async job worker pool
+    job_workers: int = 4
+    job_queue_size: int = 1000
+    job_poll_interval_seconds: float = 1.0
+    job_heartbeat_seconds: float = 15.0
+    job_lease_seconds: float = 60.0  # Unfinished jobs without a heartbeat this long are recovered
+    job_recovery_seconds: float = 30.0  # 0 disables recovery
+    
+    # Keep unprojected tool results in tool_result_archive
+    archive_raw_tool_results: bool = False
+    
+    # WebSocket agent sessions
+    ws_auth_timeout_seconds: float = 10.0
+    ws_idle_timeout_seconds: float = 300.0
+    ws_max_pending_messages: int = 4
+    ws_catalog_ttl_seconds: float = 60.0
+    
+    # Background tool health probing and keep-warm
+    health_probe_enabled: bool = True
+    health_probe_tick_seconds: float = 15.0
+    health_probe_concurrency: int = 10
+    health_probe_timeout_seconds: float = 60.0
+    health_default_interval_seconds: int = 300
+    health_min_interval_seconds: int = 30
+    keep_warm_interval_seconds: int = 240  # Under Render's 15 minute idle spin-down
+    keep_warm_popular_window_minutes: int = 60
+    keep_warm_popular_min_calls: int = 5
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -0,0 +1,168 @@
+"""
+Payment Confirmation Tracker
+Background worker that loads pending payment transactions in bulk, fetches
+their receipts with batched JSON-RPC calls and finalizes them as confirmed,
+failed or dropped once they are deep enough in the chain
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import Transaction, User, Settlement
+from app.chain import rpc_batch, nonce_manager
+from app.settlement import finalize_settlement, release_settlement
+
+settings = get_settings()
+
+
+def is_chain_hash(tx_hash: str) -> bool:
+    """Only real 32-byte hashes are tracked (demo/mock payments use placeholders)"""
+    return tx_hash.startswith("0x") and len(tx_hash) == 66
+
+
+async def transfer_receipts(transfers: List[Tuple[str, datetime]]) -> List[Tuple[Optional[str], Optional[dict]]]:
+    """
+    Final outcome and receipt of broadcast transfers, in one receipt batch
+
+    Args:
+        transfers: (tx hash, broadcast time) pairs
+
+    Returns:
+        (outcome, receipt) per transfer: outcome is confirmed, failed or dropped,
+        or None while it is not final yet; receipt is None until mined
+    """
+    results = await rpc_batch(
+        [("eth_blockNumber", [])] + [("eth_getTransactionReceipt", [tx_hash]) for tx_hash, _ in transfers]
+    )
+    head = int(results[0], 16)
+    now = datetime.utcnow()
+
+    outcomes: List[Tuple[Optional[str], Optional[dict]]] = [(None, receipt) for receipt in results[1:]]
+    unmined = []
+    for index, ((tx_hash, sent_at), receipt) in enumerate(zip(transfers, results[1:])):
+        if receipt is None:
+            if now - sent_at > timedelta(seconds=settings.confirmation_drop_after_seconds):
+                unmined.append(index)
+            continue
+        if head - int(receipt["blockNumber"], 16) + 1 >= settings.confirmation_depth:
+            outcomes[index] = ("confirmed" if int(receipt["status"], 16) == 1 else "failed", receipt)
+
+    if unmined:
+        # Long-pending and no receipt: dropped if the node no longer knows the transaction
+        known = await rpc_batch([("eth_getTransactionByHash", [transfers[index][0]]) for index in unmined])
+        for index, found in zip(unmined, known):
+            if found is None:
+                outcomes[index] = ("dropped", None)
+    return outcomes
+
+
+async def transfer_outcomes(transfers: List[Tuple[str, datetime]]) -> List[Optional[str]]:
+    """confirmed, failed or dropped per (tx hash, broadcast time), or None while not final yet"""
+    return [outcome for outcome, _ in await transfer_receipts(transfers)]
+
+
+class ConfirmationTracker:
+    """Polls receipts for pending transactions on a fixed interval"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if settings.confirmation_enabled:
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Confirmation round failed: {e}")
+            await asyncio.sleep(settings.confirmation_poll_seconds)
+
+    async def run_once(self) -> int:
+        """Check every pending transaction and submitted settlement once; returns how many were finalized"""
+        finalized = await self._check_settlements()
+        last_id = 0
+        while True:
+            db = SessionLocal()
+            try:
+                rows: List[Tuple[Transaction, str]] = db.query(Transaction, User.public_key).join(
+                    User, Transaction.from_user_id == User.id
+                ).filter(
+                    Transaction.status == "pending",
+                    Transaction.id > last_id
+                ).order_by(Transaction.id).limit(settings.confirmation_batch_size).all()
+                if not rows:
+                    return finalized
+
+                last_id = rows[-1][0].id
+                finalized += await self._check_batch(rows)
+                db.commit()
+            finally:
+                db.close()
+
+            if len(rows) < settings.confirmation_batch_size:
+                return finalized
+
+    async def _check_batch(self, rows: List[Tuple[Transaction, str]]) -> int:
+        rows = [(tx, sender) for tx, sender in rows if is_chain_hash(tx.tx_hash)]
+        if not rows:
+            return 0
+
+        results = await transfer_receipts([(tx.tx_hash, tx.created_at) for tx, _ in rows])
+        finalized = 0
+        now = datetime.utcnow()
+        for (tx, sender), (outcome, receipt) in zip(rows, results):
+            if receipt is not None:
+                tx.block_number = int(receipt["blockNumber"], 16)
+                tx.gas_used = int(receipt["gasUsed"], 16)
+            if outcome is None:
+                continue
+            tx.status = outcome
+            tx.confirmed_at = now
+            finalized += 1
+            if outcome == "dropped":
+                # Its nonce may be free again; let the next payment read it from the chain
+                nonce_manager.invalidate(sender)
+        return finalized
+
+    async def _check_settlements(self) -> int:
+        """Finalize submitted settlement transfers and the off-chain payments they settle"""
+        db = SessionLocal()
+        try:
+            rows = db.query(Settlement, User.public_key).join(
+                User, Settlement.payer_id == User.id
+            ).filter(
+                Settlement.status == "submitted"
+            ).order_by(Settlement.id).limit(settings.confirmation_batch_size).all()
+            if not rows:
+                return 0
+
+            outcomes = await transfer_outcomes([(s.tx_hash, s.submitted_at) for s, _ in rows])
+            finalized = 0
+            for (settlement, sender), outcome in zip(rows, outcomes):
+                if outcome == "confirmed":
+                    finalize_settlement(db, settlement)
+                elif outcome == "failed":
+                    release_settlement(db, settlement, "Settlement transfer reverted")
+                elif outcome == "dropped":
+                    release_settlement(db, settlement, "Settlement transfer dropped")
+                    nonce_manager.invalidate(sender)
+                else:
+                    continue
+                finalized += 1
+            db.commit()
+            return finalized
+        finally:
+            db.close()
+
+
+confirmation_tracker = ConfirmationTracker()
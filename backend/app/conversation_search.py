@@ -0,0 +1,203 @@
+"""
+Conversation History Search
+Full-text search over a user's conversations, backed by a tsvector GIN index
+on PostgreSQL and an FTS5 table on SQLite (LIKE scan on anything else)
+"""
+
+import base64
+import html
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text, bindparam, DateTime, Float, Integer, String
+from sqlalchemy.orm import Session
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+
+# The database brackets matches with these private-use characters; the text is
+# HTML-escaped before they become <mark> tags, so message text is never markup
+MATCH_START = "\ue000"
+MATCH_STOP = "\ue001"
+
+# Must stay identical to the indexed expression for the planner to use the index
+PG_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(user_message, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(tool_selected, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(final_response, '')), 'B')"
+)
+
+# The index itself is created by alembic revision 0001 (and migrate.py for pre-Alembic databases)
+PG_INDEX_DDL = f"CREATE INDEX IF NOT EXISTS ix_conversations_search ON conversations USING GIN (({PG_DOCUMENT}))"
+
+
+def encode_cursor(rank: float, conversation_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([rank, conversation_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    rank, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return float(rank), int(conversation_id)
+
+
+def _fts5_query(query: str) -> str:
+    """Quote each term so user input cannot inject FTS5 query syntax"""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def _filters(start: Optional[datetime], end: Optional[datetime], tool: Optional[str], alias: str) -> str:
+    clauses = []
+    if start:
+        clauses.append(f"{alias}.created_at >= :start")
+    if end:
+        clauses.append(f"{alias}.created_at < :end")
+    if tool:
+        clauses.append(f"{alias}.tool_selected = :tool")
+    return "".join(f" AND {clause}" for clause in clauses)
+
+
+def _highlight(fragment: Optional[str]) -> Optional[str]:
+    """HTML-escape a matched fragment, then turn the match markers into <mark> tags"""
+    if fragment is None:
+        return None
+    escaped = html.escape(fragment)
+    return escaped.replace(MATCH_START, HIGHLIGHT_START).replace(MATCH_STOP, HIGHLIGHT_STOP)
+
+
+def _postgres_sql(filters: str, keyset: str) -> str:
+    return f"""
+        SELECT hit.*,
+               ts_headline('english', hit.user_message, query, :headline_options) AS message_highlight,
+               ts_headline('english', hit.final_response, query, :headline_options) AS response_highlight
+        FROM (
+            SELECT c.id, c.user_message, c.tool_selected, c.final_response, c.created_at,
+                   ts_rank_cd({PG_DOCUMENT}, query) AS rank
+            FROM conversations c, websearch_to_tsquery('english', :q) query
+            WHERE c.user_id = :user_id AND ({PG_DOCUMENT}) @@ query{filters}
+        ) hit, websearch_to_tsquery('english', :q) query
+        WHERE TRUE{keyset}
+        ORDER BY hit.rank DESC, hit.id DESC
+        LIMIT :limit
+    """
+
+
+def _sqlite_sql(filters: str, keyset: str) -> str:
+    return f"""
+        SELECT * FROM (
+            SELECT c.id, c.user_message, c.tool_selected, c.final_response, c.created_at,
+                   -bm25(conversations_fts, 1.0, 0.5, 1.0) AS rank,
+                   highlight(conversations_fts, 0, :match_start, :match_stop) AS message_highlight,
+                   highlight(conversations_fts, 1, :match_start, :match_stop) AS response_highlight
+            FROM conversations_fts
+            JOIN conversations c ON c.id = conversations_fts.rowid
+            WHERE conversations_fts MATCH :q AND c.user_id = :user_id{filters}
+        ) hit
+        WHERE 1 = 1{keyset}
+        ORDER BY hit.rank DESC, hit.id DESC
+        LIMIT :limit
+    """
+
+
+def _fallback_sql(filters: str, keyset: str) -> str:
+    return f"""
+        SELECT * FROM (
+            SELECT c.id, c.user_message, c.tool_selected, c.final_response, c.created_at,
+                   0.0 AS rank, c.user_message AS message_highlight, c.final_response AS response_highlight
+            FROM conversations c
+            WHERE c.user_id = :user_id
+              AND (lower(c.user_message) LIKE :q OR lower(c.final_response) LIKE :q
+                   OR lower(coalesce(c.tool_selected, '')) LIKE :q){filters}
+        ) hit
+        WHERE 1 = 1{keyset}
+        ORDER BY hit.rank DESC, hit.id DESC
+        LIMIT :limit
+    """
+
+
+def search_conversations(
+    db: Session,
+    user_id: int,
+    query: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    tool: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Ranked full-text search over one user's conversation history
+
+    Args:
+        db: Database session
+        user_id: Owner of the conversations
+        query: Free-text search terms
+        start: Only conversations created at or after this time
+        end: Only conversations created before this time
+        tool: Only conversations where this tool was selected
+        limit: Page size
+        cursor: next_cursor from the previous page
+
+    Returns:
+        Dict with results (best match first) and next_cursor; highlights are
+        HTML-escaped text with matches wrapped in <mark>
+    """
+    dialect = db.get_bind().dialect.name
+    keyset = ""
+    params: Dict[str, Any] = {"user_id": user_id, "limit": limit + 1}
+
+    if cursor:
+        params["cursor_rank"], params["cursor_id"] = decode_cursor(cursor)
+        keyset = " AND (hit.rank < :cursor_rank OR (hit.rank = :cursor_rank AND hit.id < :cursor_id))"
+
+    filters = _filters(start, end, tool, "c")
+    if dialect == "postgresql":
+        sql = _postgres_sql(filters, keyset)
+        params["q"] = query
+        params["headline_options"] = f'StartSel="{MATCH_START}", StopSel="{MATCH_STOP}", MaxFragments=2'
+    elif dialect == "sqlite":
+        sql = _sqlite_sql(filters, keyset)
+        params["q"] = _fts5_query(query)
+        params["match_start"], params["match_stop"] = MATCH_START, MATCH_STOP
+    else:
+        sql = _fallback_sql(filters, keyset)
+        params["q"] = f"%{query.lower()}%"
+
+    bind = [bindparam("user_id", type_=Integer), bindparam("limit", type_=Integer)]
+    if start:
+        bind.append(bindparam("start", type_=DateTime))
+        params["start"] = start
+    if end:
+        bind.append(bindparam("end", type_=DateTime))
+        params["end"] = end
+    if tool:
+        bind.append(bindparam("tool", type_=String))
+        params["tool"] = tool
+    if cursor:
+        bind += [bindparam("cursor_rank", type_=Float), bindparam("cursor_id", type_=Integer)]
+
+    statement = text(sql).bindparams(*bind).columns(created_at=DateTime, rank=Float)
+    rows = db.execute(statement, params).mappings().all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    results: List[Dict[str, Any]] = [
+        {
+            "id": row["id"],
+            "user_message": row["user_message"],
+            "tool_selected": row["tool_selected"],
+            "final_response": row["final_response"],
+            "created_at": row["created_at"].isoformat() if row["created_at"] else None,
+            "rank": row["rank"],
+            "highlights": {
+                "user_message": _highlight(row["message_highlight"]),
+                "final_response": _highlight(row["response_highlight"])
+            }
+        }
+        for row in rows
+    ]
+
+    return {
+        "results": results,
+        "next_cursor": encode_cursor(rows[-1]["rank"], rows[-1]["id"]) if has_more and rows else None
+    }
@@ -0,0 +1,413 @@
+"""
+Prepaid Credit Escrow
+Users fund a credit account with an MNEE transfer to the platform escrow
+address. The deposit watcher credits it once the transfer is final. Paid
+tool calls then move credit from payer to tool owner with a conditional
+UPDATE in the database, with no chain round trip. Withdrawals pay the
+remaining credit back out of escrow.
+"""
+
+import asyncio
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, List, Optional
+from eth_account import Account
+from sqlalchemy import func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import CreditAccount, CreditDeposit, CreditWithdrawal, Tool, Transaction, User
+from app.signer import signer
+from app.chain import InsufficientBalance, rpc_batch, transfer_mnee, get_token_decimals, to_checksum, nonce_manager
+from app.confirmation_tracker import transfer_outcomes
+
+settings = get_settings()
+
+# keccak("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+
+class InsufficientCredit(InsufficientBalance):
+    def __init__(self, required_mnee: float, available_mnee: float):
+        Exception.__init__(self, f"Insufficient credit: required {required_mnee}, available {available_mnee}")
+        self.required = required_mnee
+        self.available = available_mnee
+        self.available_mnee = Decimal(str(available_mnee))
+
+
+class EscrowNotConfigured(Exception):
+    pass
+
+
+@lru_cache()
+def escrow_address() -> str:
+    """Checksummed address deposits are sent to"""
+    if not settings.escrow_private_key:
+        raise EscrowNotConfigured("Credit escrow is not configured")
+    return Account.from_key(settings.escrow_private_key).address
+
+
+def credit_balance(db: Session, user_id: int) -> float:
+    balance = db.query(CreditAccount.balance_mnee).filter(CreditAccount.user_id == user_id).scalar()
+    return balance or 0.0
+
+
+def debit_credit(db: Session, user_id: int, amount: float):
+    """
+    Take amount from the user's credit in one conditional UPDATE (not committed)
+
+    Raises:
+        InsufficientCredit: If the account does not hold amount (nothing was
+            changed; the caller's other session work is left for it to commit or roll back)
+    """
+    if amount <= 0:
+        return
+    result = db.execute(
+        update(CreditAccount).where(
+            CreditAccount.user_id == user_id,
+            CreditAccount.balance_mnee >= amount
+        ).values(
+            balance_mnee=CreditAccount.balance_mnee - amount,
+            updated_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        raise InsufficientCredit(amount, credit_balance(db, user_id))
+
+
+def add_credit(db: Session, user_id: int, amount: float):
+    """Give amount to the user's credit, opening the account on first use (not committed)"""
+    if amount <= 0:
+        return
+    result = db.execute(
+        update(CreditAccount).where(CreditAccount.user_id == user_id).values(
+            balance_mnee=CreditAccount.balance_mnee + amount,
+            updated_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.add(CreditAccount(user_id=user_id, balance_mnee=amount))
+        db.flush()
+
+
+def charge_credit(db: Session, payer_id: int, tool: Tool) -> Transaction:
+    """
+    Pay for one tool call from prepaid credit
+
+    Args:
+        db: Database session (committed on success)
+        payer_id: User calling the tool
+        tool: Tool being paid for; its owner is credited
+
+    Returns:
+        The recorded Transaction (status completed)
+
+    Raises:
+        InsufficientCredit: If the payer's credit does not cover the price
+    """
+    debit_credit(db, payer_id, tool.price_mnee)
+    add_credit(db, tool.owner_id, tool.price_mnee)
+    transaction = Transaction(
+        from_user_id=payer_id,
+        to_user_id=tool.owner_id,
+        tool_id=tool.id,
+        amount_mnee=tool.price_mnee,
+        tx_hash=f"credit-{uuid.uuid4()}",
+        status="completed"
+    )
+    db.add(transaction)
+    db.commit()
+    db.refresh(transaction)
+    return transaction
+
+
+def refund_credit_charge(db: Session, transaction: Transaction) -> bool:
+    """
+    Reverse a credit charge for a tool call that did not complete
+
+    Returns:
+        Whether the charge was refunded. A refund is rejected (and the charge
+        left completed) if the tool owner has already withdrawn the payment,
+        so their balance never goes negative.
+    """
+    if transaction.status != "completed":
+        return False
+    try:
+        debit_credit(db, transaction.to_user_id, transaction.amount_mnee)
+    except InsufficientCredit:
+        print(f"Refund of credit charge {transaction.id} rejected: owner {transaction.to_user_id} no longer holds it")
+        return False
+    add_credit(db, transaction.from_user_id, transaction.amount_mnee)
+    transaction.status = "refunded"
+    transaction.confirmed_at = datetime.utcnow()
+    db.commit()
+    return True
+
+
+async def start_deposit(db: Session, user: User, amount_mnee: float) -> CreditDeposit:
+    """
+    Transfer MNEE from the user's platform wallet into escrow
+
+    The deposit is credited by the deposit watcher once the transfer is final.
+    Transfers to the escrow address from the user's own wallet_address are
+    credited the same way without calling this.
+    """
+    tx_hash = await signer.sign_transfer(user, escrow_address(), amount_mnee)
+    deposit = CreditDeposit(user_id=user.id, tx_hash=tx_hash, amount_mnee=amount_mnee, status="pending")
+    db.add(deposit)
+    db.commit()
+    db.refresh(deposit)
+    return deposit
+
+
+async def withdraw_credit(db: Session, user: User, amount_mnee: Optional[float], to_address: str) -> CreditWithdrawal:
+    """
+    Pay credit back out of escrow
+
+    Args:
+        db: Database session
+        user: Account owner
+        amount_mnee: Amount to withdraw (None withdraws the whole balance)
+        to_address: Recipient address
+
+    Returns:
+        The withdrawal: submitted; failed, with the credit restored, if the
+        node rejected it or it was never signed; or submitting if the broadcast
+        may have gone through (the deposit watcher settles it from the chain)
+
+    Raises:
+        InsufficientCredit: If the account does not hold the amount
+        ValueError: If to_address is not a valid address
+    """
+    to_address = to_checksum(to_address)
+    if amount_mnee is None:
+        amount_mnee = credit_balance(db, user.id)
+    if amount_mnee <= 0:
+        raise InsufficientCredit(amount_mnee, 0.0)
+
+    # Take the credit before broadcasting so concurrent withdrawals cannot overdraw it
+    debit_credit(db, user.id, amount_mnee)
+    withdrawal = CreditWithdrawal(user_id=user.id, to_address=to_address, amount_mnee=amount_mnee)
+    db.add(withdrawal)
+    db.commit()
+
+    async def record_hash(tx_hash: str):
+        # Persisted before the broadcast, so an ambiguous failure can be checked on chain
+        withdrawal.tx_hash = tx_hash
+        withdrawal.status = "submitting"
+        withdrawal.submitted_at = datetime.utcnow()
+        db.commit()
+
+    try:
+        withdrawal.tx_hash = await transfer_mnee(
+            settings.escrow_private_key, withdrawal.to_address, amount_mnee, on_signed=record_hash
+        )
+        withdrawal.status = "submitted"
+    except Exception as e:
+        print(f"Credit withdrawal {withdrawal.id} failed to submit: {e}")
+        # web3 raises ValueError for a JSON-RPC error response: the node rejected it.
+        # A timeout or dropped connection may have come after the node accepted it
+        if withdrawal.tx_hash is None or isinstance(e, ValueError):
+            fail_withdrawal(db, withdrawal, str(e))
+        else:
+            withdrawal.error = str(e)
+    db.commit()
+    db.refresh(withdrawal)
+    return withdrawal
+
+
+def fail_withdrawal(db: Session, withdrawal: CreditWithdrawal, error: str) -> bool:
+    """
+    Mark an unfinished withdrawal failed and restore its credit (not committed)
+
+    Returns:
+        False if the withdrawal had already been finalized elsewhere (nothing changed)
+    """
+    failed = db.query(CreditWithdrawal).filter(
+        CreditWithdrawal.id == withdrawal.id,
+        CreditWithdrawal.status.in_(["pending", "submitting", "submitted"])
+    ).update({"status": "failed", "error": error}, synchronize_session=False)
+    if failed == 0:
+        return False
+    add_credit(db, withdrawal.user_id, withdrawal.amount_mnee)
+    return True
+
+
+class DepositWatcher:
+    """Credits final escrow deposits from Transfer logs and finalizes withdrawals"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.scanned_block: Optional[int] = None
+
+    async def start(self):
+        if settings.payment_mode == "credit" and settings.escrow_private_key:
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Deposit watch round failed: {e}")
+            await asyncio.sleep(settings.deposit_poll_seconds)
+
+    async def run_once(self) -> Dict[str, int]:
+        db = SessionLocal()
+        try:
+            credited = await self._scan_deposits(db)
+            failed = await self._check_pending_deposits(db)
+            withdrawn = await self._check_withdrawals(db)
+            return {"credited": credited, "failed": failed, "withdrawals": withdrawn}
+        finally:
+            db.close()
+
+    async def _scan_deposits(self, db: Session) -> int:
+        head = int((await rpc_batch([("eth_blockNumber", [])]))[0], 16)
+        # Only blocks at confirmation depth are scanned, so a logged deposit is final
+        safe = head - settings.confirmation_depth + 1
+        if self.scanned_block is None:
+            last = db.query(func.max(CreditDeposit.block_number)).filter(CreditDeposit.status == "confirmed").scalar()
+            # Re-scanning the last credited block is harmless: credited hashes are skipped
+            self.scanned_block = last - 1 if last else max(safe - settings.deposit_lookback_blocks, -1)
+
+        escrow_topic = "0x" + escrow_address()[2:].lower().rjust(64, "0")
+        decimals = await get_token_decimals()
+        credited = 0
+        while self.scanned_block < safe:
+            to_block = min(safe, self.scanned_block + settings.deposit_log_chunk_blocks)
+            logs = (await rpc_batch([("eth_getLogs", [{
+                "fromBlock": hex(self.scanned_block + 1),
+                "toBlock": hex(to_block),
+                "address": settings.mnee_contract_address,
+                "topics": [TRANSFER_TOPIC, None, escrow_topic]
+            }])]))[0]
+            credited += self._credit_logs(db, logs or [], decimals)
+            self.scanned_block = to_block
+        return credited
+
+    def _credit_logs(self, db: Session, logs: List[dict], decimals: int) -> int:
+        # tx hash -> [sender, amount in smallest units, block]
+        transfers: Dict[str, list] = defaultdict(lambda: [None, 0, 0])
+        for log in logs:
+            if log.get("removed"):
+                continue
+            transfer = transfers[log["transactionHash"]]
+            transfer[0] = "0x" + log["topics"][1][-40:]
+            transfer[1] += int(log["data"], 16)
+            transfer[2] = int(log["blockNumber"], 16)
+        if not transfers:
+            return 0
+
+        senders = {sender for sender, _, _ in transfers.values()}
+        users = db.query(User).filter(or_(
+            func.lower(User.public_key).in_(senders),
+            func.lower(User.wallet_address).in_(senders)
+        )).all()
+        owner = {}
+        for user in users:
+            owner[user.public_key.lower()] = user.id
+            if user.wallet_address:
+                owner.setdefault(user.wallet_address.lower(), user.id)
+        deposits = dict(
+            db.query(CreditDeposit.tx_hash, CreditDeposit.user_id).filter(CreditDeposit.tx_hash.in_(list(transfers)))
+        )
+
+        credited = 0
+        now = datetime.utcnow()
+        for tx_hash, (sender, amount, block) in transfers.items():
+            user_id = deposits.get(tx_hash) or owner.get(sender)
+            if user_id is None:
+                print(f"Escrow transfer {tx_hash} from unknown address {sender} not credited")
+                continue
+            amount_mnee = float(Decimal(amount) / (10 ** decimals))
+            if tx_hash not in deposits:
+                try:
+                    with db.begin_nested():
+                        db.add(CreditDeposit(user_id=user_id, tx_hash=tx_hash, amount_mnee=amount_mnee, status="pending"))
+                except IntegrityError:
+                    # Recorded concurrently (another watcher or start_deposit); the claim below decides
+                    user_id = db.query(CreditDeposit.user_id).filter(CreditDeposit.tx_hash == tx_hash).scalar()
+            # Claim with a conditional UPDATE, so a deposit is credited once across watchers
+            claimed = db.query(CreditDeposit).filter(
+                CreditDeposit.tx_hash == tx_hash,
+                CreditDeposit.status != "confirmed"
+            ).update({
+                "amount_mnee": amount_mnee,
+                "block_number": block,
+                "status": "confirmed",
+                "confirmed_at": now
+            }, synchronize_session=False)
+            if claimed == 0:
+                continue
+            add_credit(db, user_id, amount_mnee)
+            credited += 1
+        db.commit()
+        return credited
+
+    async def _check_pending_deposits(self, db: Session) -> int:
+        """Close deposits whose transfer reverted or was dropped (successful ones are credited from logs)"""
+        rows = db.query(CreditDeposit, User.public_key).join(
+            User, CreditDeposit.user_id == User.id
+        ).filter(
+            CreditDeposit.status == "pending"
+        ).order_by(CreditDeposit.id).limit(settings.confirmation_batch_size).all()
+        if not rows:
+            return 0
+
+        outcomes = await transfer_outcomes([(deposit.tx_hash, deposit.created_at) for deposit, _ in rows])
+        closed = 0
+        for (deposit, sender), outcome in zip(rows, outcomes):
+            if outcome in ("failed", "dropped"):
+                # Conditional, so a deposit credited from logs meanwhile is left alone
+                if not db.query(CreditDeposit).filter(
+                    CreditDeposit.id == deposit.id,
+                    CreditDeposit.status == "pending"
+                ).update({"status": outcome, "confirmed_at": datetime.utcnow()}, synchronize_session=False):
+                    continue
+                if outcome == "dropped":
+                    nonce_manager.invalidate(sender)
+                closed += 1
+        db.commit()
+        return closed
+
+    async def _check_withdrawals(self, db: Session) -> int:
+        """Finalize broadcast withdrawals, including ones whose broadcast outcome was unknown"""
+        withdrawals = db.query(CreditWithdrawal).filter(
+            CreditWithdrawal.status.in_(["submitting", "submitted"])
+        ).order_by(CreditWithdrawal.id).limit(settings.confirmation_batch_size).all()
+        if not withdrawals:
+            return 0
+
+        outcomes = await transfer_outcomes([(w.tx_hash, w.submitted_at) for w in withdrawals])
+        finalized = 0
+        for withdrawal, outcome in zip(withdrawals, outcomes):
+            if outcome == "confirmed":
+                done = db.query(CreditWithdrawal).filter(
+                    CreditWithdrawal.id == withdrawal.id,
+                    CreditWithdrawal.status.in_(["submitting", "submitted"])
+                ).update({"status": "confirmed", "confirmed_at": datetime.utcnow()}, synchronize_session=False)
+            elif outcome == "failed":
+                done = fail_withdrawal(db, withdrawal, "Withdrawal transfer reverted")
+            elif outcome == "dropped":
+                done = fail_withdrawal(db, withdrawal, "Withdrawal transfer dropped")
+                nonce_manager.invalidate(escrow_address())
+            else:
+                continue
+            if done:
+                finalized += 1
+        db.commit()
+        return finalized
+
+
+deposit_watcher = DepositWatcher()
@@ -0,0 +1,136 @@
+"""
+Streaming Exports
+CSV and NDJSON exports of a user's transactions and conversations. Rows are
+read through a server-side cursor in id order and written out in fixed-size
+chunks, so memory stays flat however large the export is. Each row carries
+its id, and passing the last id received as the cursor resumes an
+interrupted export.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Callable, Iterator, Optional, Sequence
+from sqlalchemy import or_
+from sqlalchemy.orm import Query, Session
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import Conversation, Tool, Transaction
+
+settings = get_settings()
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson"
+}
+
+TRANSACTION_EXPORT_COLUMNS = (
+    Transaction.id,
+    Transaction.created_at,
+    Transaction.from_user_id,
+    Transaction.to_user_id,
+    Transaction.tool_id,
+    Tool.name.label("tool_name"),
+    Transaction.amount_mnee,
+    Transaction.status,
+    Transaction.tx_hash,
+    Transaction.block_number,
+    Transaction.gas_used,
+    Transaction.confirmed_at,
+    Transaction.settlement_id
+)
+
+CONVERSATION_EXPORT_COLUMNS = (
+    Conversation.id,
+    Conversation.created_at,
+    Conversation.user_message,
+    Conversation.tool_selected,
+    Conversation.tool_result,
+    Conversation.final_response
+)
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream_export(
+    build_query: Callable[[Session], Query],
+    id_column,
+    fmt: str,
+    cursor: Optional[int] = None
+) -> Iterator[str]:
+    """
+    Serialize the rows of a query in id order, one chunk of rows at a time
+
+    Args:
+        build_query: Builds the filtered column query on the export's own session
+            (the request session is closed before the response body is sent)
+        id_column: Column used as the keyset cursor
+        fmt: csv or ndjson
+        cursor: Only rows with a larger id (resumes an earlier export; the CSV header is omitted)
+
+    Yields:
+        Text chunks of settings.export_chunk_rows rows each
+    """
+    db = SessionLocal()
+    try:
+        query = build_query(db)
+        if cursor is not None:
+            query = query.filter(id_column > cursor)
+        rows = query.order_by(id_column).execution_options(stream_results=True).yield_per(settings.export_chunk_rows)
+
+        names: Sequence[str] = [column["name"] for column in query.column_descriptions]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv" and cursor is None:
+            writer.writerow(names)
+
+        pending = 0
+        for row in rows:
+            if fmt == "csv":
+                writer.writerow(["" if value is None else _value(value) for value in row])
+            else:
+                buffer.write(json.dumps({name: _value(value) for name, value in zip(names, row)}))
+                buffer.write("\n")
+            pending += 1
+            if pending >= settings.export_chunk_rows:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        db.close()
+
+
+def transaction_export(user_id: int, start: Optional[datetime], end: Optional[datetime]) -> Callable[[Session], Query]:
+    """Query builder for every payment the user sent or received, with the tool name"""
+    def build(db: Session) -> Query:
+        query = db.query(*TRANSACTION_EXPORT_COLUMNS).outerjoin(Tool, Transaction.tool_id == Tool.id).filter(
+            or_(Transaction.from_user_id == user_id, Transaction.to_user_id == user_id)
+        )
+        if start:
+            query = query.filter(Transaction.created_at >= start)
+        if end:
+            query = query.filter(Transaction.created_at < end)
+        return query
+    return build
+
+
+def conversation_export(user_id: int, start: Optional[datetime], end: Optional[datetime]) -> Callable[[Session], Query]:
+    """Query builder for the user's conversations"""
+    def build(db: Session) -> Query:
+        query = db.query(*CONVERSATION_EXPORT_COLUMNS).filter(Conversation.user_id == user_id)
+        if start:
+            query = query.filter(Conversation.created_at >= start)
+        if end:
+            query = query.filter(Conversation.created_at < end)
+        return query
+    return build
+
+
+def export_filename(kind: str, fmt: str) -> str:
+    return f"miraipay-{kind}-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.{fmt}"
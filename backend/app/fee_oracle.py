@@ -0,0 +1,128 @@
+"""
+Fee Oracle
+Keeps EIP-1559 fee suggestions in memory, refreshed in the background from
+eth_feeHistory, so building a transfer needs no fee RPC. Each speed tier
+takes its priority fee from a reward percentile of recent blocks. Chains
+without EIP-1559 fall back to a legacy eth_gasPrice for every tier.
+"""
+
+import asyncio
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+RpcBatch = Callable[[List[Tuple[str, list]]], Awaitable[List[Any]]]
+
+
+@dataclass
+class FeeSuggestion:
+    tier: str
+    max_fee_per_gas: Optional[int] = None  # None on legacy chains
+    max_priority_fee_per_gas: Optional[int] = None
+    gas_price: Optional[int] = None  # Legacy chains only
+
+    def transaction_fields(self) -> Dict[str, int]:
+        """Fee fields for a transaction dict (dynamic-fee when available, else gasPrice)"""
+        if self.max_fee_per_gas is None:
+            return {"gasPrice": self.gas_price}
+        return {
+            "maxFeePerGas": self.max_fee_per_gas,
+            "maxPriorityFeePerGas": self.max_priority_fee_per_gas
+        }
+
+
+class FeeOracle:
+    """
+    In-memory fee suggestions per speed tier
+
+    The background loop refreshes every refresh_seconds. A suggestion older
+    than max_age_seconds (the loop is not running, or the node was down) is
+    refreshed inline by the first caller that needs it.
+    """
+
+    def __init__(
+        self,
+        rpc: RpcBatch,
+        tier_percentiles: Dict[str, float],
+        history_blocks: int,
+        base_fee_multiplier: float,
+        min_priority_fee: int,
+        refresh_seconds: float,
+        max_age_seconds: float
+    ):
+        self.rpc = rpc
+        self.tier_percentiles = tier_percentiles
+        self.history_blocks = history_blocks
+        self.base_fee_multiplier = base_fee_multiplier
+        self.min_priority_fee = min_priority_fee
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.fees: Dict[str, FeeSuggestion] = {}
+        self.refreshed_at = 0.0
+        self.task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        if self.refresh_seconds > 0:
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Fee oracle refresh failed: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    async def refresh(self):
+        """Recompute every tier from the latest fee history (or gas price on legacy chains)"""
+        # eth_feeHistory wants percentiles in ascending order
+        tiers = sorted(self.tier_percentiles.items(), key=lambda item: item[1])
+        percentiles = [percentile for _, percentile in tiers]
+        try:
+            history = (await self.rpc([("eth_feeHistory", [hex(self.history_blocks), "latest", percentiles])]))[0]
+        except Exception:
+            history = None
+
+        base_fees = [int(fee, 16) for fee in (history or {}).get("baseFeePerGas") or []]
+        if not base_fees or not any(base_fees):
+            gas_price = int((await self.rpc([("eth_gasPrice", [])]))[0], 16)
+            fees = {tier: FeeSuggestion(tier, gas_price=gas_price) for tier, _ in tiers}
+        else:
+            # The last entry is the base fee of the next block
+            max_base_fee = int(base_fees[-1] * self.base_fee_multiplier)
+            rewards = [block for block in history.get("reward") or [] if block]
+            fees = {}
+            for index, (tier, _) in enumerate(tiers):
+                samples = [int(block[index], 16) for block in rewards]
+                priority = max(int(statistics.median(samples)) if samples else 0, self.min_priority_fee)
+                fees[tier] = FeeSuggestion(
+                    tier,
+                    max_fee_per_gas=max_base_fee + priority,
+                    max_priority_fee_per_gas=priority
+                )
+
+        self.fees = fees
+        self.refreshed_at = time.monotonic()
+
+    async def get(self, tier: str) -> FeeSuggestion:
+        """
+        Current suggestion for a speed tier, from memory unless stale
+
+        Raises:
+            ValueError: If the tier is not configured
+        """
+        if tier not in self.tier_percentiles:
+            raise ValueError(f"Unknown fee tier {tier!r}, expected one of {sorted(self.tier_percentiles)}")
+        if time.monotonic() - self.refreshed_at >= self.max_age_seconds:
+            async with self._lock:
+                if time.monotonic() - self.refreshed_at >= self.max_age_seconds:
+                    await self.refresh()
+        return self.fees[tier]
@@ -3,11 +3,77 @@ Google Gemini LLM Integration Service
 Handles tool formatting, LLM calls, and response generation
 """
 
+import asyncio
 import json
-from typing import List, Dict, Any, Optional
-import google.generativeai as genai
+import threading
+from typing import List, Dict, Any, Optional, AsyncIterator
+from google import genai
+from google.genai import types as genai_types
+from app.config import get_settings
 from app.models import Tool
 from app.crypto import decrypt_data
+from app.json_stream import IncrementalJSONParser, JSONStreamError
+
+settings = get_settings()
+
+
+class GeminiClient:
+    """Gemini access bound to one user's decrypted API key"""
+    
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        # A Client carries its own key, so concurrent users (e.g. shadow routing
+        # checks on a worker thread) share no SDK state
+        self.client = genai.Client(api_key=api_key)
+    
+    @classmethod
+    def from_encrypted(cls, encrypted_api_key: str, encryption_key: bytes) -> "GeminiClient":
+        return cls(decrypt_data(encrypted_api_key, encryption_key))
+    
+    def generate(self, model: str, generation_config: Dict[str, Any], prompt: str, stream: bool = False):
+        config = genai_types.GenerateContentConfig(**generation_config)
+        if stream:
+            return self.client.models.generate_content_stream(model=model, contents=prompt, config=config)
+        return self.client.models.generate_content(model=model, contents=prompt, config=config)
+    
+    async def stream(self, model: str, generation_config: Dict[str, Any], prompt: str) -> AsyncIterator[str]:
+        """
+        Stream response text chunks without blocking the event loop
+        
+        The blocking SDK iterator runs on a worker thread; closing this
+        generator early stops reading the remaining chunks.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+        
+        def produce():
+            try:
+                response = self.generate(model, generation_config, prompt, stream=True)
+                for chunk in response:
+                    if stop.is_set():
+                        break
+                    text = chunk.text
+                    if not text:
+                        # Chunks carrying only finish metadata have no text parts
+                        continue
+                    loop.call_soon_threadsafe(queue.put_nowait, text)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+        
+        loop.run_in_executor(None, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
 
 
 def format_tools_for_llm(tools: List[Tool]) -> str:
@@ -56,29 +122,67 @@ Available Tools:
 
 User Request: {user_message}
 
-Analyze the user's request and select the most appropriate tool. Respond ONLY with a JSON object in this exact format:
+Analyze the user's request and select the most appropriate tool. Respond ONLY with a JSON object in this exact format and key order:
 {{
     "tool_id": <selected_tool_id>,
     "tool_name": "<selected_tool_name>",
-    "reasoning": "<brief explanation of why this tool was selected>",
-    "parameters": {{<any parameters needed for the tool>}}
+    "parameters": {{<any parameters needed for the tool>}},
+    "reasoning": "<brief explanation of why this tool was selected>"
 }}
 
 If no tool is appropriate, respond with:
 {{
     "tool_id": null,
     "tool_name": null,
-    "reasoning": "<explanation of why no tool fits>",
-    "parameters": {{}}
+    "parameters": {{}},
+    "reasoning": "<explanation of why no tool fits>"
 }}"""
 
 
+SELECTION_SYSTEM_PROMPT = "You are a helpful AI assistant that selects the best tool for user requests. You MUST respond with ONLY valid JSON. Do NOT use markdown code blocks. Do NOT add explanations. Just pure JSON.\n\n"
+
+# JSON output mode; the incremental parser still tolerates stray fences
+SELECTION_GENERATION_CONFIG = {
+    "temperature": 0.3,
+    "max_output_tokens": 2048,
+    "response_mime_type": "application/json",
+}
+
+# Fields needed to dispatch a tool; "reasoning" is emitted last and not waited for
+DISPATCH_FIELDS = ("tool_id", "tool_name", "parameters")
+
+
+def _selection_error(reasoning: str, error: str) -> Dict[str, Any]:
+    return {
+        "tool_id": None,
+        "tool_name": None,
+        "reasoning": reasoning,
+        "parameters": {},
+        "error": error
+    }
+
+
+def _normalize_selection(fields: Dict[str, Any]) -> Dict[str, Any]:
+    if "tool_id" not in fields:
+        raise JSONStreamError("Selection is missing tool_id")
+    parameters = fields.get("parameters") or {}
+    if not isinstance(parameters, dict):
+        raise JSONStreamError("Selection parameters must be an object")
+    return {
+        "tool_id": fields.get("tool_id"),
+        "tool_name": fields.get("tool_name"),
+        "reasoning": fields.get("reasoning", ""),
+        "parameters": parameters
+    }
+
+
 def call_gemini_for_tool_selection(
     user_message: str,
     tools_json: str,
     encrypted_api_key: str,
     encryption_key: bytes,
-    model: str = "gemini-2.5-flash"
+    model: str = "gemini-2.5-flash",
+    client: Optional[GeminiClient] = None
 ) -> Dict[str, Any]:
     """
     Call Google Gemini LLM to select appropriate tool
@@ -89,93 +193,80 @@ def call_gemini_for_tool_selection(
         encrypted_api_key: User's encrypted Gemini API key
         encryption_key: Encryption key for decryption
         model: Gemini model to use
+        client: Client with the key already decrypted (e.g. a WebSocket session's)
         
     Returns:
         Dict with tool selection info: {tool_id, tool_name, reasoning, parameters}
     """
     try:
         # Decrypt API key
-        api_key = decrypt_data(encrypted_api_key, encryption_key)
-        
-        # Configure Gemini
-        genai.configure(api_key=api_key)
-        
-        # Create prompt
-        prompt = create_tool_selection_prompt(user_message, tools_json)
-        
-        # Initialize model with increased token limit
-        gemini_model = genai.GenerativeModel(
-            model_name=model,
-            generation_config={
-                "temperature": 0.3,
-                "max_output_tokens": 2048,
-            }
-        )
-        
-        # Call Gemini with strict JSON instruction
-        full_prompt = "You are a helpful AI assistant that selects the best tool for user requests. You MUST respond with ONLY valid JSON. Do NOT use markdown code blocks. Do NOT add explanations. Just pure JSON.\n\n" + prompt
-        response = gemini_model.generate_content(full_prompt)
-        
-        # Parse response
-        response_text = response.text.strip()
-        
-        # Check if response looks incomplete
-        if not response_text.endswith('}'):
-            print(f"=== WARNING: Response may be truncated ===")
-            print(f"Response: {response_text}")
-            print("===========================================")
-            # Try to find the last complete JSON object
-            try:
-                # Find last complete opening brace
-                depth = 0
-                last_valid_pos = -1
-                for i, char in enumerate(response_text):
-                    if char == '{':
-                        depth += 1
-                    elif char == '}':
-                        depth -= 1
-                        if depth == 0:
-                            last_valid_pos = i + 1
-                
-                if last_valid_pos > 0:
-                    response_text = response_text[:last_valid_pos]
-            except:
-                pass
-        
-        # Debug log
-        print(f"=== Gemini Raw Response ===")
-        print(response_text)
-        print("===========================")
-        
-        # Extract JSON from response (handle markdown code blocks)
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        selection = json.loads(response_text)
-        return selection
-        
-    except json.JSONDecodeError as e:
-        print(f"=== JSON Decode Error ===")
-        print(f"Error: {str(e)}")
-        print(f"Raw text: {response_text if 'response_text' in locals() else 'N/A'}")
-        print("=========================")
-        return {
-            "tool_id": None,
-            "tool_name": None,
-            "reasoning": f"Failed to parse LLM response: {str(e)}",
-            "parameters": {},
-            "error": "json_decode_error"
-        }
+        if client is None:
+            client = GeminiClient.from_encrypted(encrypted_api_key, encryption_key)
     except Exception as e:
-        return {
-            "tool_id": None,
-            "tool_name": None,
-            "reasoning": f"Error calling Groq: {str(e)}",
-            "parameters": {},
-            "error": "gemini_api_error"
-        }
+        return _selection_error(f"Error calling Gemini: {str(e)}", "gemini_api_error")
+    
+    full_prompt = SELECTION_SYSTEM_PROMPT + create_tool_selection_prompt(user_message, tools_json)
+    
+    failure = None
+    for attempt in range(1, settings.selection_max_attempts + 1):
+        try:
+            response = client.generate(model, SELECTION_GENERATION_CONFIG, full_prompt)
+            parser = IncrementalJSONParser()
+            parser.feed(response.text or "")
+            return _normalize_selection(parser.result())
+        except JSONStreamError as e:
+            print(f"Selection attempt {attempt} returned unusable JSON: {e}")
+            failure = _selection_error(f"Failed to parse LLM response: {str(e)}", "json_decode_error")
+        except Exception as e:
+            print(f"Selection attempt {attempt} failed: {e}")
+            failure = _selection_error(f"Error calling Gemini: {str(e)}", "gemini_api_error")
+    return failure
+
+
+async def stream_tool_selection(
+    user_message: str,
+    tools_json: str,
+    encrypted_api_key: str,
+    encryption_key: bytes,
+    model: str = "gemini-2.5-flash",
+    client: Optional[GeminiClient] = None
+) -> Dict[str, Any]:
+    """
+    Streaming variant of call_gemini_for_tool_selection
+    
+    The response is parsed incrementally and returned as soon as tool_id,
+    tool_name and parameters are complete, so the tool can be dispatched
+    while Gemini is still writing its reasoning. Unparseable or failed
+    responses are retried up to selection_max_attempts times.
+    
+    Returns:
+        Dict with tool selection info: {tool_id, tool_name, reasoning, parameters}
+    """
+    try:
+        if client is None:
+            client = GeminiClient.from_encrypted(encrypted_api_key, encryption_key)
+    except Exception as e:
+        return _selection_error(f"Error calling Gemini: {str(e)}", "gemini_api_error")
+    
+    full_prompt = SELECTION_SYSTEM_PROMPT + create_tool_selection_prompt(user_message, tools_json)
+    
+    failure = None
+    for attempt in range(1, settings.selection_max_attempts + 1):
+        parser = IncrementalJSONParser()
+        try:
+            async for chunk in client.stream(model, SELECTION_GENERATION_CONFIG, full_prompt):
+                parser.feed(chunk)
+                # A null tool_id needs the reasoning, so only dispatch early on a real selection
+                if parser.has(*DISPATCH_FIELDS) and parser.fields["tool_id"] is not None:
+                    return _normalize_selection(parser.fields)
+            return _normalize_selection(parser.result())
+        except JSONStreamError as e:
+            print(f"Selection attempt {attempt} returned unusable JSON: {e}")
+            failure = _selection_error(f"Failed to parse LLM response: {str(e)}", "json_decode_error")
+        except Exception as e:
+            print(f"Selection attempt {attempt} failed: {e}")
+            failure = _selection_error(f"Error calling Gemini: {str(e)}", "gemini_api_error")
+    return failure
 
 
 def generate_final_response(
@@ -185,7 +276,8 @@ def generate_final_response(
     encrypted_api_key: str,
     encryption_key: bytes,
     error_message: Optional[str] = None,
-    model: str = "gemini-2.5-flash"
+    model: str = "gemini-2.5-flash",
+    client: Optional[GeminiClient] = None
 ) -> str:
     """
     Generate final natural language response based on tool execution
@@ -198,16 +290,15 @@ def generate_final_response(
         encryption_key: Encryption key for decryption
         error_message: Optional error message if tool failed
         model: Gemini model to use
+        client: Client with the key already decrypted
         
     Returns:
         Natural language response string
     """
     try:
         # Decrypt API key
-        api_key = decrypt_data(encrypted_api_key, encryption_key)
-        
-        # Configure Gemini
-        genai.configure(api_key=api_key)
+        if client is None:
+            client = GeminiClient.from_encrypted(encrypted_api_key, encryption_key)
         
         # Create context prompt
         if error_message:
@@ -237,18 +328,18 @@ Unfortunately, we don't have an appropriate tool to handle this request.
 
 Please politely inform the user that we cannot help with this specific request at the moment, and suggest they try a different query."""
         
-        # Initialize model
-        gemini_model = genai.GenerativeModel(
-            model_name=model,
-            generation_config={
+        # Call Gemini for final response
+        full_prompt = "You are a helpful AI assistant. Provide clear, concise, and friendly responses.\n\n" + context
+        response = client.generate(
+            model,
+            {
                 "temperature": 0.7,
                 "max_output_tokens": 1000,
-            }
+            },
+            full_prompt
         )
-        
-        # Call Gemini for final response
-        full_prompt = "You are a helpful AI assistant. Provide clear, concise, and friendly responses.\n\n" + context
-        response = gemini_model.generate_content(full_prompt)
+        if not response.text:
+            raise ValueError("Gemini returned no text")
         
         return response.text
         
@@ -273,13 +364,12 @@ def validate_gemini_api_key(api_key: str) -> tuple[bool, str]:
         Tuple of (is_valid, message)
     """
     try:
-        genai.configure(api_key=api_key)
-        
-        # Initialize model
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        
         # Make a simple test call
-        response = model.generate_content("Say 'OK' if you can read this.")
+        response = GeminiClient(api_key).generate(
+            "gemini-2.5-flash",
+            {},
+            "Say 'OK' if you can read this."
+        )
         
         return True, "API key is valid"
         
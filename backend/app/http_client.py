@@ -0,0 +1,31 @@
+"""
+Shared Outbound HTTP Client
+One pooled httpx.AsyncClient for tool calls, so keep-alive connections
+(including ones opened speculatively by the pre-warmer) are reused
+"""
+
+from typing import Optional
+import httpx
+
+# 120s timeout for cold starts on Render
+TOOL_TIMEOUT = httpx.Timeout(120.0, connect=30.0)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide client, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=TOOL_TIMEOUT,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=60.0)
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,250 @@
+"""
+Idempotency Keys
+Lets clients retry payment and paid-execution requests safely. The first
+request with a given Idempotency-Key runs and its response is stored with a
+fingerprint of the request. Retries with the same key replay that response
+instead of paying again. A retry that arrives while the first attempt is
+still running waits for it. Records expire after a TTL.
+
+The handler marks the point where its payment is made (attempt.commit()).
+Successful responses, and any failure raised after that point, are stored
+and replayed; a failure before it releases the key, so a retry of a
+transient error runs again.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import IdempotencyRecord
+
+settings = get_settings()
+
+MAX_KEY_LENGTH = 255
+
+# (user_id, key) -> set when the local attempt finishes, so waiters wake immediately
+_local_attempts: Dict[Tuple[int, str], asyncio.Event] = {}
+_last_purge = 0.0
+
+
+class IdempotentAttempt:
+    """Passed to the handler, which marks when its side effect is committed"""
+
+    def __init__(self):
+        self.committed = False
+
+    def commit(self):
+        """Call right after the side effect (the charge) is made: later failures are replayed"""
+        self.committed = True
+
+    def release(self):
+        """Call once the side effect has been undone (refunded): later failures release the key"""
+        self.committed = False
+
+
+def request_fingerprint(scope: str, params: Dict[str, Any]) -> str:
+    """SHA-256 over the endpoint and its parameters"""
+    payload = json.dumps({"scope": scope, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _replay(record: IdempotencyRecord) -> JSONResponse:
+    return JSONResponse(
+        status_code=record.response_status,
+        content=json.loads(record.response_body),
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+
+def _purge_expired():
+    """Delete expired records, at most once per purge interval"""
+    global _last_purge
+    if time.monotonic() - _last_purge < settings.idempotency_purge_interval_seconds:
+        return
+    _last_purge = time.monotonic()
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.expires_at < datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _claim(user_id: int, key: str, scope: str, fingerprint: str) -> Optional[IdempotencyRecord]:
+    """
+    Insert an in-progress record for the key
+
+    Returns:
+        None if this request now owns the key, otherwise the live record holding it
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        existing = db.get(IdempotencyRecord, (user_id, key))
+        abandoned = (
+            existing is not None
+            and existing.status == "in_progress"
+            and now - existing.created_at > timedelta(seconds=settings.idempotency_lock_seconds)
+        )
+        if existing is not None and (existing.expires_at < now or abandoned):
+            # Expired, or its attempt died without finishing: the key is free again
+            db.delete(existing)
+            db.flush()
+            existing = None
+        if existing is not None:
+            return existing
+
+        db.add(IdempotencyRecord(
+            user_id=user_id,
+            key=key,
+            scope=scope,
+            fingerprint=fingerprint,
+            status="in_progress",
+            expires_at=now + timedelta(seconds=settings.idempotency_ttl_seconds)
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another attempt claimed it between our read and insert
+            db.rollback()
+            return db.get(IdempotencyRecord, (user_id, key))
+        return None
+    finally:
+        db.close()
+
+
+def _finish(user_id: int, key: str, response_status: Optional[int], body: Any):
+    """Store the response for replay (response_status None releases the key instead)"""
+    db = SessionLocal()
+    try:
+        record = db.get(IdempotencyRecord, (user_id, key))
+        if record is None:
+            return
+        if response_status is None:
+            db.delete(record)
+        else:
+            record.status = "completed"
+            record.response_status = response_status
+            record.response_body = json.dumps(body)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _wait_for(user_id: int, key: str) -> IdempotencyRecord:
+    """Wait for the attempt holding the key to finish and return its record"""
+    deadline = time.monotonic() + settings.idempotency_wait_seconds
+    while time.monotonic() < deadline:
+        event = _local_attempts.get((user_id, key))
+        timeout = min(settings.idempotency_poll_seconds, max(deadline - time.monotonic(), 0))
+        if event:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            # Held by another process: poll the record
+            await asyncio.sleep(timeout)
+
+        db = SessionLocal()
+        try:
+            record = db.get(IdempotencyRecord, (user_id, key))
+        finally:
+            db.close()
+        if record is None or record.status == "completed":
+            return record
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is still in progress"
+    )
+
+
+async def run_idempotent(
+    user_id: int,
+    key: Optional[str],
+    scope: str,
+    params: Dict[str, Any],
+    handler: Callable[[IdempotentAttempt], Awaitable[Any]]
+) -> Any:
+    """
+    Run handler at most once per (user, Idempotency-Key)
+
+    Args:
+        user_id: Caller (keys are scoped per user)
+        key: Idempotency-Key header value (None runs handler directly)
+        scope: Endpoint name, part of the fingerprint
+        params: Request parameters, part of the fingerprint
+        handler: Performs the request and returns its response; it must call
+            attempt.commit() as soon as its side effect is made
+
+    Returns:
+        The handler's response, or a replay of the stored one
+
+    Raises:
+        HTTPException: 422 if the key was used for a different request, 409 if the
+            first attempt is still running after idempotency_wait_seconds
+    """
+    attempt = IdempotentAttempt()
+    if key is None:
+        return await handler(attempt)
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"
+        )
+
+    fingerprint = request_fingerprint(scope, params)
+    await asyncio.to_thread(_purge_expired)
+
+    while True:
+        record = await asyncio.to_thread(_claim, user_id, key, scope, fingerprint)
+        if record is None:
+            break
+        if record.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used for a different request"
+            )
+        if record.status == "in_progress":
+            record = await _wait_for(user_id, key)
+            if record is None:
+                continue  # The first attempt failed and released the key: try to claim it
+        return _replay(record)
+
+    event = _local_attempts[(user_id, key)] = asyncio.Event()
+    try:
+        try:
+            result = await handler(attempt)
+        except BaseException as e:
+            if not attempt.committed:
+                # Failed before any side effect: let a retry run again
+                await asyncio.to_thread(_finish, user_id, key, None, None)
+            elif isinstance(e, HTTPException):
+                # The request paid before failing: replay its error rather than paying again
+                await asyncio.to_thread(_finish, user_id, key, e.status_code, {"detail": e.detail})
+            else:
+                # Crashed or cancelled after paying: same, with a generic error
+                await asyncio.to_thread(
+                    _finish, user_id, key, status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    {"detail": "Request failed after its payment was made"}
+                )
+            raise
+
+        if isinstance(result, Response):
+            await asyncio.to_thread(_finish, user_id, key, result.status_code, json.loads(result.body))
+        else:
+            await asyncio.to_thread(_finish, user_id, key, status.HTTP_200_OK, jsonable_encoder(result))
+        return result
+    finally:
+        event.set()
+        _local_attempts.pop((user_id, key), None)
@@ -0,0 +1,351 @@
+"""
+Asynchronous Job Service
+Runs long tool executions on a bounded worker pool with state persisted
+in the jobs table, so HTTP requests can return a job id immediately
+
+Workers claim a job with a conditional UPDATE and renew its heartbeat while
+it runs, so several processes can share the table. Jobs whose heartbeat is
+older than job_lease_seconds belong to a dead process and are recovered by
+whichever process notices first.
+"""
+
+import asyncio
+import json
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from fastapi import HTTPException, status
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import Job
+
+settings = get_settings()
+
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled"}
+
+JobHandler = Callable[[Dict[str, Any], Session], Awaitable[Dict[str, Any]]]
+
+
+@dataclass
+class RegisteredHandler:
+    handler: JobHandler
+    retry_on_restart: bool
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobRunner:
+    """Bounded asyncio worker pool that executes persisted jobs"""
+
+    def __init__(self, workers: int, queue_size: int):
+        self.worker_count = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.handlers: Dict[str, RegisteredHandler] = {}
+        self.workers: list[asyncio.Task] = []
+        self.running: Dict[str, asyncio.Task] = {}
+        self.queued: Set[str] = set()  # Job ids waiting in this process's queue
+        self.updates: Dict[str, asyncio.Event] = {}
+
+    def register(self, kind: str, handler: JobHandler, retry_on_restart: bool = True):
+        """
+        Register the coroutine that executes jobs of a given kind
+
+        Args:
+            kind: Job kind stored on the row (e.g. "agent_chat")
+            handler: async fn(payload, db) -> result dict; raise to fail the job
+            retry_on_restart: Re-run jobs that were mid-flight when the worker died.
+                Disable for handlers with side effects that must not repeat.
+        """
+        self.handlers[kind] = RegisteredHandler(handler, retry_on_restart)
+
+    async def start(self):
+        """Recover jobs left behind by dead processes and start the workers and the recovery loop"""
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        if settings.job_recovery_seconds > 0:
+            try:
+                self.recover()
+            except Exception as e:
+                print(f"Job recovery failed: {e}")
+            self.workers.append(asyncio.create_task(self._recovery_loop()))
+
+    async def stop(self):
+        """Stop the workers; in-flight jobs stay 'running' and are recovered once their lease runs out"""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def _recovery_loop(self):
+        while True:
+            await asyncio.sleep(settings.job_recovery_seconds)
+            try:
+                self.recover()
+            except Exception as e:
+                print(f"Job recovery failed: {e}")
+
+    def recover(self) -> int:
+        """
+        Requeue or fail unfinished jobs whose heartbeat is older than job_lease_seconds
+
+        Running jobs are re-run only if their handler allows retry_on_restart.
+        Each change is a conditional UPDATE on the stale heartbeat, so only one
+        process recovers a given job. Jobs waiting in this process's queue are
+        heartbeated first, so a backlog is not recovered (and queued twice).
+
+        Returns:
+            How many jobs were recovered
+        """
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=settings.job_lease_seconds)
+        stale = or_(Job.heartbeat_at < cutoff, and_(Job.heartbeat_at.is_(None), Job.created_at < cutoff))
+        db = SessionLocal()
+        try:
+            held = self.queued | set(self.running)
+            if self.queued:
+                db.query(Job).filter(Job.id.in_(list(self.queued)), Job.status == "queued").update(
+                    {"heartbeat_at": now}, synchronize_session=False
+                )
+                db.commit()
+            unfinished = [
+                row for row in db.query(Job.id, Job.kind, Job.status).filter(
+                    Job.status.in_(["queued", "running"]),
+                    stale
+                ).order_by(Job.created_at)
+                if row.id not in held
+            ]
+
+            requeued = []
+            failed = 0
+            for job_id, kind, job_status in unfinished:
+                registered = self.handlers.get(kind)
+                condition = db.query(Job).filter(Job.id == job_id, Job.status == job_status, stale)
+                if job_status == "running" and (not registered or not registered.retry_on_restart):
+                    failed += condition.update({
+                        "status": "failed",
+                        "error": "Interrupted by worker restart",
+                        "finished_at": now
+                    }, synchronize_session=False)
+                elif condition.update({"status": "queued", "heartbeat_at": now}, synchronize_session=False):
+                    requeued.append(job_id)
+                db.commit()
+        finally:
+            db.close()
+
+        for job_id in requeued:
+            try:
+                self._enqueue(job_id)
+            except asyncio.QueueFull:
+                print(f"Job queue full during recovery, job {job_id} left queued")
+                break
+        if requeued or failed:
+            print(f"Recovered {len(requeued)} unfinished jobs, failed {failed} interrupted jobs")
+        return len(requeued) + failed
+
+    def submit(self, db: Session, user_id: int, kind: str, payload: Dict[str, Any]) -> Job:
+        """Persist a new job and hand it to the worker pool"""
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind {kind}")
+        if self.queue.full():
+            raise JobQueueFull()
+
+        job = Job(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            kind=kind,
+            payload=json.dumps(payload),
+            status="queued",
+            heartbeat_at=datetime.utcnow()
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        self._enqueue(job.id)
+        return job
+
+    def _enqueue(self, job_id: str):
+        self.queue.put_nowait(job_id)
+        self.queued.add(job_id)
+
+    def cancel(self, db: Session, job: Job) -> Job:
+        """
+        Cancel a queued or running job
+
+        Raises:
+            HTTPException: 409 if the job already finished (possibly just now)
+        """
+        cancelled = db.query(Job).filter(
+            Job.id == job.id,
+            Job.status.in_(["queued", "running"])
+        ).update({"status": "cancelled", "finished_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        db.refresh(job)
+        if not cancelled:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Job already {job.status}"
+            )
+
+        task = self.running.get(job.id)
+        if task:
+            task.cancel()
+        self._notify(job.id)
+        return job
+
+    async def wait_for_update(self, job_id: str, timeout: float):
+        """Wait until the job changes in this process, or the timeout elapses"""
+        event = self.updates.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _notify(self, job_id: str):
+        event = self.updates.pop(job_id, None)
+        if event:
+            event.set()
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            self.queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"Job worker error on {job_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job_id: str):
+        db = SessionLocal()
+        try:
+            # Claim with a conditional UPDATE: only one worker in any process gets past this
+            now = datetime.utcnow()
+            claimed = db.query(Job).filter(Job.id == job_id, Job.status == "queued").update({
+                "status": "running",
+                "attempts": func.coalesce(Job.attempts, 0) + 1,
+                "started_at": now,
+                "heartbeat_at": now
+            }, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                return
+            job = db.query(Job).filter(Job.id == job_id).first()
+            self._notify(job_id)
+
+            registered = self.handlers[job.kind]
+            task = asyncio.create_task(registered.handler(json.loads(job.payload), db))
+            self.running[job_id] = task
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            try:
+                result = await task
+                job.status = "succeeded"
+                job.result = json.dumps(result)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    # Worker shutdown: the job stays 'running' and is recovered on restart
+                    raise
+                # Cancelled through the API, which already persisted the status
+                db.rollback()
+                return
+            except HTTPException as e:
+                db.rollback()
+                job.status = "failed"
+                job.error = str(e.detail)
+            except Exception as e:
+                db.rollback()
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                heartbeat.cancel()
+                self.running.pop(job_id, None)
+
+            # Respect a cancellation that landed while the handler was finishing
+            if _current_status(db, job_id) == "cancelled":
+                return
+
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+            self._notify(job_id)
+
+
+    async def _heartbeat(self, job_id: str):
+        """Renew a running job's lease (on its own session; the handler owns the job's)"""
+        while True:
+            await asyncio.sleep(settings.job_heartbeat_seconds)
+            db = SessionLocal()
+            try:
+                db.query(Job).filter(Job.id == job_id, Job.status == "running").update(
+                    {"heartbeat_at": datetime.utcnow()}, synchronize_session=False
+                )
+                db.commit()
+            except Exception as e:
+                print(f"Job heartbeat failed for {job_id}: {e}")
+            finally:
+                db.close()
+
+
+def _current_status(db: Session, job_id: str) -> Optional[str]:
+    row = db.query(Job.status).filter(Job.id == job_id).first()
+    return row[0] if row else None
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    """Public representation of a job for polling and SSE"""
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def get_user_job(db: Session, job_id: str, user_id: int) -> Job:
+    """Load a job owned by the user or raise 404"""
+    job = db.query(Job).filter(Job.id == job_id, Job.user_id == user_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+async def job_event_stream(job_id: str, user_id: int):
+    """
+    Server-sent events for a job: one 'status' event per state change and a
+    final 'result' event once the job reaches a terminal state
+    """
+    last_status = None
+    while True:
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id, Job.user_id == user_id).first()
+            if not job:
+                yield "event: error\ndata: {\"detail\": \"Job not found\"}\n\n"
+                return
+            payload = job_to_dict(job)
+        finally:
+            db.close()
+
+        if payload["status"] != last_status:
+            last_status = payload["status"]
+            event = "result" if last_status in TERMINAL_STATUSES else "status"
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        if last_status in TERMINAL_STATUSES:
+            return
+
+        # Woken immediately by local workers; the timeout covers other processes
+        await job_runner.wait_for_update(job_id, timeout=settings.job_poll_interval_seconds)
+
+
+job_runner = JobRunner(workers=settings.job_workers, queue_size=settings.job_queue_size)
@@ -0,0 +1,146 @@
+"""
+Incremental JSON Object Parser
+Consumes an LLM response chunk by chunk and reports each top-level field
+of the first JSON object as soon as that field's value is complete
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    """
+    Streaming parser for a single top-level JSON object
+
+    Anything before the first '{' (e.g. a markdown fence) and after its
+    matching '}' is ignored. Nested values are only decoded once complete.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self._text = []
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expecting = "key"  # key, colon, value, comma (only tracked at depth 1)
+        self._token_start: Optional[int] = None
+        self._current_key: Optional[str] = None
+        self._value_is_string = False
+
+    def has(self, *keys: str) -> bool:
+        return all(key in self.fields for key in keys)
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """Consume the next chunk and return the fields completed so far"""
+        for char in chunk:
+            if self.complete:
+                break
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._text.append(char)
+                continue
+            self._text.append(char)
+            self._consume(char, len(self._text) - 1)
+        return self.fields
+
+    def _span(self, end: int) -> str:
+        return "".join(self._text[self._token_start:end])
+
+    def _decode(self, raw: str) -> Any:
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise JSONStreamError(f"Invalid JSON value {raw[:40]!r}: {e}")
+
+    def _finish_value(self, end: int):
+        self.fields[self._current_key] = self._decode(self._span(end).strip())
+        self._token_start = None
+        self._current_key = None
+        self._value_is_string = False
+        self._expecting = "comma"
+
+    def _consume(self, char: str, position: int):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._depth == 1:
+                    if self._expecting == "key":
+                        self._current_key = self._decode(self._span(position + 1))
+                        self._token_start = None
+                        self._expecting = "colon"
+                    elif self._expecting == "value" and self._value_is_string:
+                        self._finish_value(position + 1)
+            return
+
+        if self._depth > 1:
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._finish_value(position + 1)
+            return
+
+        # Depth 1: directly inside the top-level object
+        if self._expecting == "value" and self._token_start is not None and not self._value_is_string:
+            # Inside a bare literal (number, true, false, null)
+            if char in _WHITESPACE or char in ",}":
+                self._finish_value(position)
+                if char == ",":
+                    self._expecting = "key"
+                elif char == "}":
+                    self.complete = True
+            return
+
+        if char in _WHITESPACE:
+            return
+
+        if self._expecting == "key":
+            if char == '"':
+                self._in_string = True
+                self._token_start = position
+            elif char == "}" and not self.fields:
+                self.complete = True
+            else:
+                raise JSONStreamError(f"Expected object key, got {char!r}")
+        elif self._expecting == "colon":
+            if char != ":":
+                raise JSONStreamError(f"Expected ':', got {char!r}")
+            self._expecting = "value"
+        elif self._expecting == "value":
+            self._token_start = position
+            self._value_is_string = char == '"'
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+        elif self._expecting == "comma":
+            if char == ",":
+                self._expecting = "key"
+            elif char == "}":
+                self.complete = True
+            else:
+                raise JSONStreamError(f"Expected ',' or '}}', got {char!r}")
+
+    def result(self) -> Dict[str, Any]:
+        """All fields of a fully parsed object; raises if the object never closed"""
+        if not self.complete:
+            raise JSONStreamError("Response ended before the JSON object was complete")
+        return self.fields
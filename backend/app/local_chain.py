@@ -0,0 +1,290 @@
+"""
+Local Chain Stand-In
+In-memory JSON-RPC node that understands just enough of Ethereum and the
+MNEE token for the payment paths: nonces, signed legacy and EIP-1559 transfers,
+fee history, receipts, Transfer logs, blocks and dropped transactions. Used for local development and load
+testing without a real RPC provider.
+
+Run:
+    uvicorn app.local_chain:app --port 8545
+    ETHEREUM_RPC_URL=http://127.0.0.1:8545 uvicorn main:app
+
+Besides the standard eth_* methods it accepts:
+    evm_mine [count]                  mine pending transactions into new blocks
+    local_mint [address, amount_hex]  credit MNEE to an address
+    local_setAutomine [bool]          mine every transaction immediately (default on)
+    local_dropTransaction [tx_hash]   evict a pending transaction from the mempool
+"""
+
+from typing import Any, Dict, List, Optional
+import rlp
+from eth_account import Account
+from eth_utils import keccak
+from fastapi import FastAPI, Request
+from app.config import get_settings
+
+settings = get_settings()
+
+TRANSFER_SELECTOR = "a9059cbb"
+BALANCE_OF_SELECTOR = "70a08231"
+DECIMALS_SELECTOR = "313ce567"
+TRANSFER_GAS_USED = 51000
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+
+class LocalChainError(Exception):
+    def __init__(self, message: str, code: int = -32000):
+        super().__init__(message)
+        self.code = code
+
+
+def _int(value: bytes) -> int:
+    return int.from_bytes(value, "big")
+
+
+def _address(value: bytes) -> Optional[str]:
+    return "0x" + value.hex() if value else None
+
+
+class LocalChain:
+    def __init__(self, chain_id: int = 31337, token_address: Optional[str] = None, decimals: int = 18):
+        self.chain_id = chain_id
+        self.token_address = (token_address or settings.mnee_contract_address).lower()
+        self.decimals = decimals
+        self.base_fee = 1_000_000_000  # Constant: blocks here are never congested
+        self.priority_fee = 100_000_000
+        self.block_number = 0
+        self.automine = True
+        self.balances: Dict[str, int] = {}
+        self.nonces: Dict[str, int] = {}  # Mined nonce count per sender
+        self.mempool: Dict[str, Dict[str, Any]] = {}
+        self.transactions: Dict[str, Dict[str, Any]] = {}
+        self.receipts: Dict[str, Dict[str, Any]] = {}
+        self.logs: List[Dict[str, Any]] = []  # Token Transfer events, in block order
+
+    # -- state changes -----------------------------------------------------
+
+    def mint(self, address: str, amount: int):
+        address = address.lower()
+        self.balances[address] = self.balances.get(address, 0) + amount
+
+    def pending_nonce(self, address: str) -> int:
+        address = address.lower()
+        queued = sum(1 for tx in self.mempool.values() if tx["from"] == address)
+        return self.nonces.get(address, 0) + queued
+
+    def send_raw_transaction(self, raw_hex: str) -> str:
+        raw = bytes.fromhex(raw_hex[2:] if raw_hex.startswith("0x") else raw_hex)
+        tx_hash = "0x" + keccak(raw).hex()
+        if tx_hash in self.transactions:
+            raise LocalChainError("already known")
+
+        if raw[0] == 2:
+            # EIP-1559: [chainId, nonce, maxPriorityFee, maxFee, gas, to, value, data, accessList, v, r, s]
+            fields = rlp.decode(raw[1:])
+            nonce, gas, to, value, data = fields[1], fields[4], fields[5], fields[6], fields[7]
+            max_fee = _int(fields[3])
+            if max_fee < self.base_fee:
+                raise LocalChainError("max fee per gas less than block base fee")
+            gas_price = min(max_fee, self.base_fee + _int(fields[2]))
+        else:
+            # Legacy: [nonce, gasPrice, gas, to, value, data, v, r, s]
+            nonce, gas_price, gas, to, value, data = rlp.decode(raw)[:6]
+            gas_price = _int(gas_price)
+
+        sender = Account.recover_transaction(raw).lower()
+        nonce = _int(nonce)
+        expected = self.pending_nonce(sender)
+        if nonce < expected:
+            raise LocalChainError("nonce too low")
+        if nonce > expected:
+            raise LocalChainError("nonce too high")
+
+        self.transactions[tx_hash] = {
+            "hash": tx_hash,
+            "from": sender,
+            "to": _address(to),
+            "nonce": nonce,
+            "gas": _int(gas),
+            "gasPrice": gas_price,  # Effective price for dynamic-fee transactions
+            "value": _int(value),
+            "input": "0x" + data.hex(),
+            "blockNumber": None
+        }
+        self.mempool[tx_hash] = self.transactions[tx_hash]
+        if self.automine:
+            self.mine()
+        return tx_hash
+
+    def _execute(self, tx: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Apply a mined transaction; returns its logs, or None if it reverted"""
+        data = tx["input"][2:]
+        if tx["to"] != self.token_address or not data.startswith(TRANSFER_SELECTOR):
+            return []
+        recipient = "0x" + data[8 + 24:8 + 64]
+        amount = int(data[8 + 64:8 + 128], 16)
+        if self.balances.get(tx["from"], 0) < amount:
+            return None
+        self.balances[tx["from"]] -= amount
+        self.mint(recipient, amount)
+        return [{
+            "address": self.token_address,
+            "topics": [TRANSFER_TOPIC, "0x" + tx["from"][2:].rjust(64, "0"), "0x" + recipient[2:].rjust(64, "0")],
+            "data": "0x" + amount.to_bytes(32, "big").hex(),
+            "blockNumber": hex(self.block_number),
+            "transactionHash": tx["hash"],
+            "logIndex": hex(len(self.logs)),
+            "removed": False
+        }]
+
+    def mine(self, count: int = 1):
+        for _ in range(count):
+            self.block_number += 1
+            for tx_hash, tx in sorted(self.mempool.items(), key=lambda item: item[1]["nonce"]):
+                logs = self._execute(tx)
+                self.logs.extend(logs or [])
+                tx["blockNumber"] = self.block_number
+                self.nonces[tx["from"]] = tx["nonce"] + 1
+                self.receipts[tx_hash] = {
+                    "transactionHash": tx_hash,
+                    "blockNumber": hex(self.block_number),
+                    "from": tx["from"],
+                    "to": tx["to"],
+                    "gasUsed": hex(TRANSFER_GAS_USED),
+                    "effectiveGasPrice": hex(tx["gasPrice"]),
+                    "status": "0x1" if logs is not None else "0x0",
+                    "logs": logs or []
+                }
+            self.mempool.clear()
+
+    def drop(self, tx_hash: str):
+        if self.mempool.pop(tx_hash, None):
+            del self.transactions[tx_hash]
+
+    # -- JSON-RPC ----------------------------------------------------------
+
+    def call(self, call: Dict[str, Any]) -> str:
+        to = (call.get("to") or "").lower()
+        data = (call.get("data") or call.get("input") or "0x")[2:]
+        if to != self.token_address:
+            # No contract code here (e.g. no Multicall deployment)
+            raise LocalChainError("execution reverted", 3)
+        if data.startswith(BALANCE_OF_SELECTOR):
+            owner = "0x" + data[8 + 24:8 + 64]
+            return "0x" + self.balances.get(owner, 0).to_bytes(32, "big").hex()
+        if data.startswith(DECIMALS_SELECTOR):
+            return "0x" + self.decimals.to_bytes(32, "big").hex()
+        raise LocalChainError("execution reverted", 3)
+
+    def get_logs(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        def block(tag, default):
+            if tag in (None, "latest", "pending", "safe", "finalized"):
+                return default
+            return 0 if tag == "earliest" else int(tag, 16)
+
+        from_block = block(query.get("fromBlock"), self.block_number)
+        to_block = block(query.get("toBlock"), self.block_number)
+        addresses = query.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {address.lower() for address in addresses or []}
+
+        matches = []
+        for log in self.logs:
+            if not from_block <= int(log["blockNumber"], 16) <= to_block:
+                continue
+            if addresses and log["address"] not in addresses:
+                continue
+            topics_match = True
+            for wanted, actual in zip(query.get("topics") or [], log["topics"]):
+                if wanted is None:
+                    continue
+                options = wanted if isinstance(wanted, list) else [wanted]
+                if actual not in (option.lower() for option in options):
+                    topics_match = False
+                    break
+            if topics_match:
+                matches.append(log)
+        return matches
+
+    def fee_history(self, block_count: Any, percentiles: List[float]) -> Dict[str, Any]:
+        count = min(int(block_count, 16) if isinstance(block_count, str) else block_count, self.block_number + 1)
+        history = {
+            "oldestBlock": hex(self.block_number - count + 1),
+            # One more base fee than blocks: the next block's
+            "baseFeePerGas": [hex(self.base_fee)] * (count + 1),
+            "gasUsedRatio": [0.5] * count
+        }
+        if percentiles:
+            history["reward"] = [[hex(self.priority_fee)] * len(percentiles) for _ in range(count)]
+        return history
+
+    def handle(self, method: str, params: List[Any]) -> Any:
+        if method == "eth_chainId":
+            return hex(self.chain_id)
+        if method == "net_version":
+            return str(self.chain_id)
+        if method == "eth_blockNumber":
+            return hex(self.block_number)
+        if method == "eth_gasPrice":
+            return hex(self.base_fee + self.priority_fee)
+        if method == "eth_maxPriorityFeePerGas":
+            return hex(self.priority_fee)
+        if method == "eth_feeHistory":
+            return self.fee_history(params[0], params[2] if len(params) > 2 else [])
+        if method == "eth_getTransactionCount":
+            address, tag = params[0], params[1] if len(params) > 1 else "latest"
+            count = self.pending_nonce(address) if tag == "pending" else self.nonces.get(address.lower(), 0)
+            return hex(count)
+        if method == "eth_call":
+            return self.call(params[0])
+        if method == "eth_estimateGas":
+            return hex(TRANSFER_GAS_USED)
+        if method == "eth_sendRawTransaction":
+            return self.send_raw_transaction(params[0])
+        if method == "eth_getTransactionReceipt":
+            return self.receipts.get(params[0])
+        if method == "eth_getLogs":
+            return self.get_logs(params[0])
+        if method == "eth_getTransactionByHash":
+            tx = self.transactions.get(params[0])
+            if tx is None:
+                return None
+            return {
+                **tx,
+                **{key: hex(tx[key]) for key in ("nonce", "gas", "gasPrice", "value")},
+                "blockNumber": hex(tx["blockNumber"]) if tx["blockNumber"] else None
+            }
+        if method == "evm_mine":
+            self.mine(int(params[0]) if params else 1)
+            return hex(self.block_number)
+        if method == "local_mint":
+            self.mint(params[0], int(params[1], 16))
+            return True
+        if method == "local_setAutomine":
+            self.automine = bool(params[0])
+            return True
+        if method == "local_dropTransaction":
+            self.drop(params[0])
+            return True
+        raise LocalChainError(f"Method {method} not supported", -32601)
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            response["result"] = self.handle(request["method"], request.get("params") or [])
+        except LocalChainError as e:
+            response["error"] = {"code": e.code, "message": str(e)}
+        return response
+
+
+chain = LocalChain()
+app = FastAPI(title="Local chain stand-in")
+
+
+@app.post("/")
+async def json_rpc(request: Request):
+    body = await request.json()
+    if isinstance(body, list):
+        return [chain.dispatch(item) for item in body]
+    return chain.dispatch(body)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -24,6 +24,9 @@ class User(Base):
 
 class Tool(Base):
     __tablename__ = "tools"
+    __table_args__ = (
+        Index("ix_tools_owner_id", "owner_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False)
@@ -34,6 +37,13 @@ class Tool(Base):
     api_body_template = Column(Text)  # JSON string template
     metadata_hash = Column(String, nullable=False)  # SHA-256 hash of API specs
     price_mnee = Column(Float, nullable=False)
+    trigger_phrases = Column(Text, nullable=True)  # JSON list of phrases that route straight to this tool
+    parameter_extractors = Column(Text, nullable=True)  # JSON {param: regex or "$rest"} for fast-path routing
+    result_projection = Column(Text, nullable=True)  # JSON {fields, max_items, max_string_length} applied to results
+    warmup_url = Column(String, nullable=True)  # Optional cheap URL pinged to wake the tool's host
+    health_url = Column(String, nullable=True)  # URL probed for availability (defaults to the api_url origin)
+    health_interval_seconds = Column(Integer, nullable=True)  # Probe interval (defaults to settings)
+    keep_warm_minutes = Column(Integer, nullable=True)  # Keep the host warm this long after the last call
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     approved = Column(Boolean, default=False)
     active = Column(Boolean, default=True)
@@ -43,9 +53,22 @@ class Tool(Base):
     # Relationships
     owner = relationship("User", back_populates="owned_tools", foreign_keys=[owner_id])
     transactions = relationship("Transaction", back_populates="tool")
+    health = relationship("ToolHealth", uselist=False, back_populates="tool")
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    # Indexes for the hot queries (see alembic revision 0002)
+    __table_args__ = (
+        Index("ix_transactions_to_user_id_id", "to_user_id", "id"),
+        Index("ix_transactions_from_user_id_id", "from_user_id", "id"),
+        Index("ix_transactions_to_user_status_amount", "to_user_id", "status", "amount_mnee"),
+        Index("ix_transactions_from_user_status_amount", "from_user_id", "status", "amount_mnee"),
+        Index("ix_transactions_from_user_tool_created", "from_user_id", "tool_id", "created_at"),
+        Index("ix_transactions_status_id", "status", "id"),
+        Index("ix_transactions_created_tool", "created_at", "tool_id"),
+        Index("ix_transactions_confirmed_at", "confirmed_at"),
+        Index("ix_transactions_updated_at", "updated_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     from_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -53,17 +76,26 @@ class Transaction(Base):
     tool_id = Column(Integer, ForeignKey("tools.id"), nullable=False)
     amount_mnee = Column(Float, nullable=False)
     tx_hash = Column(String, unique=True, nullable=False)  # Ethereum transaction hash
-    status = Column(String, default="pending")  # pending, confirmed, failed
+    status = Column(String, default="pending")  # pending, confirmed, failed, dropped; off-chain: accrued, settling, settled; credit: completed, refunded
+    settlement_id = Column(Integer, ForeignKey("settlements.id"), nullable=True, index=True)  # On-chain transfer that settled this off-chain payment
+    block_number = Column(Integer, nullable=True)  # Block the transaction was mined in
+    gas_used = Column(Integer, nullable=True)
+    confirmed_at = Column(DateTime, nullable=True)  # When the status was finalized (tracker or refund)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Last change of any kind; drives the usage rollups
     
     # Relationships
     sender = relationship("User", back_populates="transactions_sent", foreign_keys=[from_user_id])
     receiver = relationship("User", back_populates="transactions_received", foreign_keys=[to_user_id])
     tool = relationship("Tool", back_populates="transactions")
+    settlement = relationship("Settlement", back_populates="transactions")
 
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_user_created", "user_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -75,3 +107,188 @@ class Conversation(Base):
     
     # Relationships
     user = relationship("User", back_populates="conversations")
+
+
+class RoutingDecision(Base):
+    __tablename__ = "routing_decisions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=True)
+    user_message = Column(Text, nullable=False)
+    strategy = Column(String, nullable=False)  # fast_path, llm
+    tool_id = Column(Integer, nullable=True)  # Tool chosen by the strategy that was used
+    confidence = Column(Float, nullable=True)  # Fast-path confidence (null for llm)
+    matched_rule = Column(String, nullable=True)  # e.g. "tool_name" or "phrase:search movies"
+    shadow_checked = Column(Boolean, default=False)  # Fast-path hit also sent to the LLM for accuracy sampling
+    shadow_llm_tool_id = Column(Integer, nullable=True)  # LLM's choice for a shadow-checked hit
+    latency_ms = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(String(36), primary_key=True)  # UUID handed to the client
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # agent_chat, mcp_execute
+    payload = Column(Text, nullable=False)  # JSON request the job was created with
+    status = Column(String, default="queued", index=True)  # queued, running, succeeded, failed, cancelled
+    result = Column(Text, nullable=True)  # JSON result once succeeded
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # Renewed while queued/owned by a worker; stale = recoverable
+
+
+class ToolResultArchive(Base):
+    __tablename__ = "tool_result_archive"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tool_id = Column(Integer, ForeignKey("tools.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    raw_result = Column(Text, nullable=False)  # Unprojected upstream response (JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ToolHealth(Base):
+    __tablename__ = "tool_health"
+    
+    tool_id = Column(Integer, ForeignKey("tools.id"), primary_key=True)
+    status = Column(String, default="unknown")  # up, down, unknown
+    last_checked_at = Column(DateTime, nullable=True)
+    last_up_at = Column(DateTime, nullable=True)
+    last_latency_ms = Column(Float, nullable=True)
+    cold_start_latency_ms = Column(Float, nullable=True)  # Latency of the last probe that found the host asleep
+    consecutive_failures = Column(Integer, default=0)
+    checks_total = Column(Integer, default=0)
+    checks_failed = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    
+    # Relationships
+    tool = relationship("Tool", back_populates="health")
+
+
+class UserBalance(Base):
+    __tablename__ = "user_balances"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    earned_mnee = Column(Float, nullable=False, default=0.0)  # Counted payments received from other users
+    spent_mnee = Column(Float, nullable=False, default=0.0)  # Counted payments sent to other users
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Settlement(Base):
+    __tablename__ = "settlements"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    payer_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # Net debtor of the pair
+    payee_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    amount_mnee = Column(Float, nullable=False)  # Net amount transferred (0 if the pair netted out)
+    transaction_count = Column(Integer, nullable=False)
+    tx_hash = Column(String, unique=True, nullable=True)  # Settlement transfer, once broadcast
+    status = Column(String, default="pending")  # pending, submitted, confirmed, failed, netted
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    submitted_at = Column(DateTime, nullable=True)
+    confirmed_at = Column(DateTime, nullable=True)
+    
+    # Relationships
+    transactions = relationship("Transaction", back_populates="settlement")
+
+
+class CreditAccount(Base):
+    __tablename__ = "credit_accounts"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    balance_mnee = Column(Float, nullable=False, default=0.0)  # Prepaid credit held in escrow for the user
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CreditDeposit(Base):
+    __tablename__ = "credit_deposits"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    tx_hash = Column(String, unique=True, nullable=False)  # Transfer into the escrow address
+    amount_mnee = Column(Float, nullable=False)  # Requested amount, replaced by the on-chain amount when credited
+    block_number = Column(Integer, nullable=True)
+    status = Column(String, default="pending")  # pending, confirmed, failed, dropped
+    created_at = Column(DateTime, default=datetime.utcnow)
+    confirmed_at = Column(DateTime, nullable=True)
+
+
+class CreditWithdrawal(Base):
+    __tablename__ = "credit_withdrawals"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    to_address = Column(String(42), nullable=False)
+    amount_mnee = Column(Float, nullable=False)
+    tx_hash = Column(String, unique=True, nullable=True)  # Transfer out of escrow, once broadcast
+    status = Column(String, default="pending")  # pending, submitting (broadcast outcome unknown), submitted, confirmed, failed
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    submitted_at = Column(DateTime, nullable=True)
+    confirmed_at = Column(DateTime, nullable=True)
+
+
+class ToolUsageRollup(Base):
+    __tablename__ = "tool_usage_rollups"
+    __table_args__ = (
+        Index("ix_tool_usage_rollups_owner_bucket", "owner_id", "granularity", "bucket_start"),
+    )
+    
+    tool_id = Column(Integer, ForeignKey("tools.id"), primary_key=True)
+    granularity = Column(String(8), primary_key=True)  # hour, day
+    bucket_start = Column(DateTime, primary_key=True)  # UTC start of the hour or day
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    calls = Column(Integer, nullable=False, default=0)
+    gross_mnee = Column(Float, nullable=False, default=0.0)  # Paid calls only (failed/dropped/refunded excluded)
+    unique_payers = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+    
+    name = Column(String, primary_key=True)
+    last_transaction_id = Column(Integer, nullable=False, default=0)  # Highest transaction id aggregated
+    last_run_at = Column(DateTime, nullable=True)
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_records"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String(255), primary_key=True)  # Client's Idempotency-Key header
+    scope = Column(String, nullable=False)  # Endpoint the key was first used on
+    fingerprint = Column(String(64), nullable=False)  # SHA-256 of the endpoint and request parameters
+    status = Column(String, default="in_progress")  # in_progress, completed
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)  # JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class PaymentIntent(Base):
+    __tablename__ = "payment_intents"
+    __table_args__ = (
+        Index("ix_payment_intents_status_created", "status", "created_at"),
+    )
+    
+    id = Column(String, primary_key=True)  # UUID
+    payer_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    payee_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    tool_id = Column(Integer, ForeignKey("tools.id"), nullable=False)
+    recipient = Column(String(42), nullable=False)  # Payee address at submit time
+    amount_mnee = Column(Float, nullable=False)
+    status = Column(String, default="queued")  # queued, sending, sent, failed
+    attempts = Column(Integer, default=0)
+    tx_hash = Column(String, nullable=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
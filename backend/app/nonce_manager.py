@@ -0,0 +1,113 @@
+"""
+Local Nonce Manager
+Hands out transaction nonces per sending account from local state, so
+concurrent payments from one wallet get consecutive nonces without a
+get_transaction_count round trip each, and resyncs from the chain when
+local state can no longer be trusted
+"""
+
+import asyncio
+import heapq
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+# Node error messages meaning our idea of the next nonce is wrong
+NONCE_ERRORS = (
+    "nonce too low",
+    "nonce too high",
+    "already known",
+    "known transaction",
+    "replacement transaction underpriced",
+)
+
+
+def is_nonce_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in NONCE_ERRORS)
+
+
+@dataclass
+class AccountNonces:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    next_nonce: Optional[int] = None  # None forces a resync on the next reservation
+    released: List[int] = field(default_factory=list)  # Reserved but never broadcast, reused first
+    in_flight: int = 0
+    synced_at: float = 0.0
+
+
+class NonceManager:
+    """
+    Per-account nonce allocator
+
+    Nonces are reserved under the account's lock and the lock is released
+    before signing/broadcasting, so several payments from the same wallet
+    can be in flight at once.
+    """
+
+    def __init__(self, fetch_pending_count: Callable[[str], Awaitable[int]], resync_seconds: float):
+        self.fetch_pending_count = fetch_pending_count
+        self.resync_seconds = resync_seconds
+        self._accounts: Dict[str, AccountNonces] = {}
+
+    def _account(self, address: str) -> AccountNonces:
+        return self._accounts.setdefault(address.lower(), AccountNonces())
+
+    def _needs_sync(self, state: AccountNonces) -> bool:
+        # Only resync an idle account on age, otherwise the pending count
+        # can miss a transaction we are broadcasting right now
+        idle = state.in_flight == 0 and time.monotonic() - state.synced_at > self.resync_seconds
+        return state.next_nonce is None or idle
+
+    async def _sync(self, address: str, state: AccountNonces):
+        # The pending count includes our own broadcast-but-unmined transactions,
+        # and drops back if the mempool evicted any of them (stuck or replaced)
+        state.next_nonce = await self.fetch_pending_count(address)
+        state.released = []
+        state.synced_at = time.monotonic()
+
+    async def prime(self, address: str):
+        """Load the account's nonce from the chain now if the next reservation would have to"""
+        state = self._account(address)
+        async with state.lock:
+            if self._needs_sync(state):
+                await self._sync(address, state)
+
+    def invalidate(self, address: str):
+        """Discard local state; the next reservation reads the nonce from the chain"""
+        self._account(address).next_nonce = None
+
+    @asynccontextmanager
+    async def reserve(self, address: str) -> AsyncIterator[int]:
+        """
+        Reserve the next nonce for address for the duration of one broadcast
+
+        Exit normally once the transaction was accepted by the node. On an
+        error the nonce is returned for reuse if the node rejected the
+        transaction, or local state is resynced if the outcome is unknown.
+        """
+        state = self._account(address)
+        async with state.lock:
+            if self._needs_sync(state):
+                await self._sync(address, state)
+            if state.released:
+                nonce = heapq.heappop(state.released)
+            else:
+                nonce = state.next_nonce
+                state.next_nonce += 1
+            state.in_flight += 1
+
+        try:
+            yield nonce
+        except Exception as e:
+            if is_nonce_error(e) or not isinstance(e, ValueError):
+                # Either our counter is wrong, or a timeout/transport error left us
+                # not knowing whether the node has the transaction
+                state.next_nonce = None
+            elif state.next_nonce is not None:
+                # The node rejected the transaction (JSON-RPC error): the nonce is unused
+                heapq.heappush(state.released, nonce)
+            raise
+        finally:
+            state.in_flight -= 1
@@ -0,0 +1,364 @@
+"""
+Payment Engine
+Single pipeline for on-chain tool payments. Each payment is persisted as a
+PaymentIntent and then queued to a worker pool. Intents are sharded by payer,
+so one sender's transfers are signed and broadcast in order. Broadcasts go
+through a token bucket that smooths bursts toward the RPC endpoint. Callers
+can await the resulting Transaction (pay) or take the intent id and track it
+(submit).
+
+Every status change is a conditional UPDATE, so several processes can share
+the table: a worker only sends an intent it moved from queued to sending.
+Intents untouched for payment_lease_seconds are recovered by whichever
+process notices first.
+"""
+
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import PaymentIntent, Tool, Transaction, User
+from app.chain import InsufficientBalance, rpc_batch
+from app.signer import signer
+
+settings = get_settings()
+
+
+class PaymentQueueFull(Exception):
+    pass
+
+
+class PaymentFailed(Exception):
+    def __init__(self, intent_id: str, error: str):
+        super().__init__(error)
+        self.intent_id = intent_id
+
+
+class PaymentPending(Exception):
+    """The payment outlived the caller's wait but a worker is already sending it"""
+
+    def __init__(self, intent: PaymentIntent):
+        super().__init__(f"Payment {intent.id} is still being sent")
+        self.intent = intent
+
+
+class TokenBucket:
+    """Allows rate operations per second on average, with bursts up to capacity (rate 0 = unlimited)"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def intent_to_dict(intent: PaymentIntent) -> dict:
+    return {
+        "id": intent.id,
+        "status": intent.status,
+        "tool_id": intent.tool_id,
+        "amount_mnee": intent.amount_mnee,
+        "tx_hash": intent.tx_hash,
+        "transaction_id": intent.transaction_id,
+        "error": intent.error,
+        "created_at": intent.created_at.isoformat() if intent.created_at else None,
+        "updated_at": intent.updated_at.isoformat() if intent.updated_at else None
+    }
+
+
+class PaymentEngine:
+    def __init__(self, workers: int, queue_size: int, rpc_rate: float, rpc_burst: float):
+        self.worker_count = workers
+        # One queue per worker: a payer always lands on the same worker
+        self.queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.workers: List[asyncio.Task] = []
+        self.recovery_task: Optional[asyncio.Task] = None
+        self.limiter = TokenBucket(rpc_rate, rpc_burst)
+        # intent id -> future resolved with the Transaction id (await-result callers)
+        self.waiters: Dict[str, asyncio.Future] = {}
+
+    def _queue_for(self, payer_id: int) -> asyncio.Queue:
+        return self.queues[payer_id % self.worker_count]
+
+    async def start(self):
+        """Recover intents whose lease ran out, then start the workers and the recovery loop"""
+        if settings.payment_recovery_seconds > 0:
+            try:
+                await self.recover()
+            except Exception as e:
+                print(f"Payment recovery failed: {e}")
+            self.recovery_task = asyncio.create_task(self._recovery_loop())
+        self.workers = [asyncio.create_task(self._worker(queue)) for queue in self.queues]
+
+    async def stop(self):
+        """Stop the workers; queued intents are recovered once their lease runs out"""
+        tasks = self.workers + ([self.recovery_task] if self.recovery_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
+        self.recovery_task = None
+
+    def submit(self, db: Session, payer: User, tool: Tool, payee: User) -> PaymentIntent:
+        """
+        Persist and queue a payment for one call of tool (fire and track)
+
+        Returns:
+            The queued intent; poll it for status, tx_hash and transaction_id
+
+        Raises:
+            PaymentQueueFull: If the payer's worker queue is full (the intent is recorded as failed)
+        """
+        intent = PaymentIntent(
+            id=str(uuid.uuid4()),
+            payer_id=payer.id,
+            payee_id=payee.id,
+            tool_id=tool.id,
+            recipient=payee.public_key,
+            amount_mnee=tool.price_mnee,
+            status="queued"
+        )
+        db.add(intent)
+        db.commit()
+        try:
+            self._queue_for(payer.id).put_nowait(intent.id)
+        except asyncio.QueueFull:
+            intent.status = "failed"
+            intent.error = "Payment queue is full"
+            db.commit()
+            raise PaymentQueueFull("Payment queue is full, try again later")
+        return intent
+
+    async def pay(self, db: Session, payer: User, tool: Tool, payee: User) -> Transaction:
+        """
+        Queue a payment and wait for it to be broadcast (await result)
+
+        Returns:
+            The recorded Transaction (status pending until confirmed on-chain)
+
+        Raises:
+            InsufficientBalance: If the payer cannot cover the price
+            PaymentFailed: If signing or broadcasting failed, or the payment was
+                still queued when the wait timed out (it is then never sent)
+            PaymentPending: If the wait timed out after a worker claimed the payment,
+                or it was broadcast but could not be recorded as sent yet
+            PaymentQueueFull: If the payer's worker queue is full
+        """
+        future = asyncio.get_running_loop().create_future()
+        intent = self.submit(db, payer, tool, payee)
+        self.waiters[intent.id] = future
+        try:
+            transaction_id = await asyncio.wait_for(asyncio.shield(future), timeout=settings.payment_wait_seconds)
+        except asyncio.TimeoutError:
+            # Withdraw the intent unless a worker has already claimed it, so a
+            # caller told the payment failed is never charged later
+            error = f"Payment {intent.id} still queued after {settings.payment_wait_seconds}s"
+            if self._transition(db, intent.id, "queued", status="failed", error=error):
+                db.commit()
+                raise PaymentFailed(intent.id, error)
+            db.commit()
+            db.refresh(intent)
+            raise PaymentPending(intent)
+        finally:
+            self.waiters.pop(intent.id, None)
+        return db.get(Transaction, transaction_id)
+
+    def _transition(self, db: Session, intent_id: str, from_status: str, **values) -> bool:
+        """Conditionally update an intent still in from_status (caller commits); False if it had moved on"""
+        values["updated_at"] = datetime.utcnow()
+        updated = db.query(PaymentIntent).filter(
+            PaymentIntent.id == intent_id,
+            PaymentIntent.status == from_status
+        ).update(values, synchronize_session=False)
+        return updated == 1
+
+    def _resolve(self, intent_id: str, result: Optional[int] = None, error: Optional[BaseException] = None):
+        future = self.waiters.get(intent_id)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            intent_id = await queue.get()
+            try:
+                await self._process(intent_id)
+            except Exception as e:
+                print(f"Payment worker error on intent {intent_id}: {e}")
+                self._resolve(intent_id, error=PaymentFailed(intent_id, str(e)))
+            finally:
+                queue.task_done()
+
+    async def _process(self, intent_id: str):
+        db = SessionLocal()
+        try:
+            await self.limiter.acquire()
+            # Claim with a conditional UPDATE: only one worker in any process gets past this
+            claimed = self._transition(db, intent_id, "queued", status="sending", attempts=PaymentIntent.attempts + 1)
+            db.commit()
+            if not claimed:
+                return
+            intent = db.get(PaymentIntent, intent_id)
+            payer = db.get(User, intent.payer_id)
+
+            async def record_hash(tx_hash: str):
+                # Recovery checks this hash on chain if we die mid-send; if recovery
+                # already gave up on the intent, abort before broadcasting
+                if not self._transition(db, intent_id, "sending", tx_hash=tx_hash):
+                    db.rollback()
+                    raise PaymentFailed(intent_id, "Payment lease expired before broadcast")
+                db.commit()
+
+            try:
+                tx_hash = await signer.sign_transfer(
+                    payer, intent.recipient, intent.amount_mnee, on_signed=record_hash
+                )
+            except Exception as e:
+                self._transition(db, intent_id, "sending", status="failed", error=str(e))
+                db.commit()
+                # Callers see insufficient balance as such; anything else as a failed payment
+                self._resolve(intent_id, error=e if isinstance(e, InsufficientBalance) else PaymentFailed(intent_id, str(e)))
+                return
+
+            transaction_id = self._record_sent(db, intent, tx_hash)
+            if transaction_id is None:
+                db.refresh(intent)
+                transaction_id = intent.transaction_id
+            if transaction_id is None and intent.status == "failed":
+                # Recovery gave up on it while the broadcast was in flight, but it went out
+                transaction_id = self._record_sent(db, intent, tx_hash, from_status="failed")
+                db.refresh(intent)
+            if transaction_id is None:
+                self._resolve(intent_id, error=PaymentPending(intent))
+                return
+            self._resolve(intent_id, result=transaction_id)
+        finally:
+            db.close()
+
+    def _record_sent(self, db: Session, intent: PaymentIntent, tx_hash: str, from_status: str = "sending") -> Optional[int]:
+        """Record the pending Transaction for a broadcast intent; None if the intent was no longer in from_status"""
+        transaction = Transaction(
+            from_user_id=intent.payer_id,
+            to_user_id=intent.payee_id,
+            tool_id=intent.tool_id,
+            amount_mnee=intent.amount_mnee,
+            tx_hash=tx_hash,
+            status="pending"
+        )
+        db.add(transaction)
+        db.flush()
+        if not self._transition(db, intent.id, from_status, status="sent", tx_hash=tx_hash, transaction_id=transaction.id, error=None):
+            db.rollback()
+            return None
+        db.commit()
+        return transaction.id
+
+    async def _recovery_loop(self):
+        while True:
+            await asyncio.sleep(settings.payment_recovery_seconds)
+            try:
+                await self.recover()
+            except Exception as e:
+                print(f"Payment recovery failed: {e}")
+
+    async def recover(self) -> int:
+        """
+        Pick up intents whose lease (settings.payment_lease_seconds) ran out
+
+        Stale queued intents are requeued here; claiming is conditional, so
+        this is safe even if their process is still alive. Stale sending
+        intents are checked on chain: a transfer the node knows about is
+        recorded as sent (the confirmation tracker finalizes it). One that
+        never got a signed hash was never broadcast and is failed. One with
+        a hash the node does not know yet may still be in flight, so it is
+        only failed once confirmation_drop_after_seconds have passed since
+        the hash was recorded; until then it is checked again on each pass.
+
+        Returns:
+            How many intents were recovered
+        """
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=settings.payment_lease_seconds)
+        drop_cutoff = now - timedelta(seconds=settings.confirmation_drop_after_seconds)
+        db = SessionLocal()
+        try:
+            stale = db.query(PaymentIntent).filter(
+                PaymentIntent.status.in_(["queued", "sending"]),
+                PaymentIntent.updated_at < cutoff
+            ).order_by(PaymentIntent.created_at).all()
+            if not stale:
+                return 0
+
+            sending = [intent for intent in stale if intent.status == "sending" and intent.tx_hash]
+            known = set()
+            if sending:
+                results = await rpc_batch(
+                    [("eth_getTransactionReceipt", [intent.tx_hash]) for intent in sending]
+                    + [("eth_getTransactionByHash", [intent.tx_hash]) for intent in sending]
+                )
+                for index, intent in enumerate(sending):
+                    if results[index] is not None or results[len(sending) + index] is not None:
+                        known.add(intent.id)
+
+            recovered = 0
+            for intent in stale:
+                if intent.status == "queued":
+                    # Renew the lease so only one process requeues it
+                    if not self._transition(db, intent.id, "queued"):
+                        continue
+                    db.commit()
+                    try:
+                        self._queue_for(intent.payer_id).put_nowait(intent.id)
+                    except asyncio.QueueFull:
+                        print(f"Payment queue full during recovery, intent {intent.id} left queued")
+                        continue
+                elif intent.id in known:
+                    transaction_id = self._record_sent(db, intent, intent.tx_hash)
+                    if transaction_id is None:
+                        continue
+                    self._resolve(intent.id, result=transaction_id)
+                elif intent.tx_hash and intent.updated_at >= drop_cutoff:
+                    # Signed but unknown to the node: the broadcast may still land
+                    continue
+                else:
+                    error = "Not broadcast before the sending worker stopped"
+                    if not self._transition(db, intent.id, "sending", status="failed", error=error):
+                        db.rollback()
+                        continue
+                    db.commit()
+                    self._resolve(intent.id, error=PaymentFailed(intent.id, error))
+                recovered += 1
+            if recovered:
+                print(f"Recovered {recovered} stale payments")
+            return recovered
+        finally:
+            db.close()
+
+
+payment_engine = PaymentEngine(
+    workers=settings.payment_workers,
+    queue_size=settings.payment_queue_size,
+    rpc_rate=settings.payment_rpc_rate_per_second,
+    rpc_burst=settings.payment_rpc_burst
+)
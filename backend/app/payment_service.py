@@ -0,0 +1,100 @@
+"""
+Tool Payment Service
+Charges a paid tool call according to the configured payment mode:
+
+    onchain  one signed MNEE transfer per call (recorded as pending), queued
+             through the payment engine so each payer's transfers go out in order
+    ledger   instant off-chain debit/credit (recorded as accrued), netted per
+             user pair and settled on-chain by the settlement scheduler
+    credit   instant debit of prepaid escrow credit (recorded as completed)
+"""
+
+import asyncio
+import uuid
+from collections import defaultdict
+from typing import Dict
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.payment_engine import payment_engine
+from app.chain import to_token_units, get_token_decimals, InsufficientBalance
+from app.balance_reader import balance_reader
+from app.credit import charge_credit
+from app.models import User, Tool, Transaction
+
+settings = get_settings()
+
+PAYMENT_MODES = ("onchain", "ledger", "credit")
+
+# Ledger charges from one payer run one at a time in this process; lock_payer
+# extends that across processes on Postgres
+_payer_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+def lock_payer(db: Session, payer_id: int):
+    """Hold a per-payer lock until the session's transaction ends (Postgres advisory lock)"""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:payer_id)"), {"payer_id": payer_id})
+
+
+def outstanding_debits(db: Session, user_id: int) -> float:
+    """Off-chain payments the user still owes on-chain"""
+    return db.query(func.sum(Transaction.amount_mnee)).filter(
+        Transaction.from_user_id == user_id,
+        Transaction.status.in_(["accrued", "settling"])
+    ).scalar() or 0.0
+
+
+async def charge_tool_call(db: Session, payer: User, tool: Tool, payee: User) -> Transaction:
+    """
+    Charge payer for one call of tool and record the payment
+
+    Args:
+        db: Database session (committed on success)
+        payer: User calling the tool
+        tool: Tool being paid for
+        payee: Tool owner
+
+    Returns:
+        The recorded Transaction
+
+    Raises:
+        InsufficientBalance: If the payer cannot cover the price
+            (InsufficientCredit in credit mode)
+        PaymentQueueFull: If the on-chain payment queue is full
+        PaymentFailed: If the on-chain transfer could not be sent
+        PaymentPending: If the on-chain transfer is still being sent; track its intent
+    """
+    if settings.payment_mode == "credit":
+        return charge_credit(db, payer.id, tool)
+
+    if settings.payment_mode == "onchain":
+        # The engine's worker records the pending Transaction once broadcast
+        return await payment_engine.pay(db, payer, tool, payee)
+
+    # Ledger: cover the call from on-chain funds not already owed to someone
+    # else (the balance read is cached per block). The check and the insert run
+    # under the payer's lock, so concurrent calls cannot both pass the check
+    async with _payer_locks[payer.id]:
+        lock_payer(db, payer.id)
+        snapshot, decimals = await asyncio.gather(
+            balance_reader.get_balances([payer.public_key]),
+            get_token_decimals()
+        )
+        onchain = next(iter(snapshot.balances.values()), 0)
+        required = to_token_units(outstanding_debits(db, payer.id) + tool.price_mnee, decimals)
+        if onchain < required:
+            raise InsufficientBalance(required, onchain, decimals)
+
+        transaction = Transaction(
+            from_user_id=payer.id,
+            to_user_id=payee.id,
+            tool_id=tool.id,
+            amount_mnee=tool.price_mnee,
+            tx_hash=f"offchain-{uuid.uuid4()}",
+            status="accrued"
+        )
+        db.add(transaction)
+        db.commit()
+    db.refresh(transaction)
+    return transaction
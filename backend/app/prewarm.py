@@ -0,0 +1,163 @@
+"""
+Speculative Connection Pre-Warming
+While Gemini is choosing a tool, resolve DNS and open pooled connections
+to the hosts of the most likely candidates (optionally hitting an
+owner-declared warm-up URL), and track how often that paid off
+"""
+
+import asyncio
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlsplit
+from app.config import get_settings
+from app.http_client import get_http_client
+from app.models import Tool
+
+settings = get_settings()
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Connections opened by a warm-up stay useful for roughly the pool keep-alive
+WARM_WINDOW_SECONDS = 60.0
+
+
+@dataclass
+class PrewarmStats:
+    rounds: int = 0
+    hosts_attempted: int = 0
+    hosts_warmed: int = 0
+    host_failures: int = 0
+    budget_exceeded: int = 0
+    # Selected tool's host was pre-warmed and ready before dispatch
+    hits: int = 0
+    # Selected tool's host was a candidate but its warm-up had not finished
+    late: int = 0
+    # Selected tool's host was not among the candidates
+    misses: int = 0
+
+    def as_dict(self) -> Dict[str, float]:
+        outcomes = self.hits + self.late + self.misses
+        return {
+            **self.__dict__,
+            "hit_rate": self.hits / outcomes if outcomes else 0.0
+        }
+
+
+stats = PrewarmStats()
+
+# origin -> monotonic time it was last warmed
+_warm_hosts: Dict[str, float] = {}
+
+
+@dataclass
+class PrewarmHandle:
+    origins: Set[str] = field(default_factory=set)
+    task: Optional[asyncio.Task] = None
+
+
+def tool_origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def on_tool_origin(url: Optional[str], api_url: str) -> bool:
+    """
+    Whether an owner-supplied auxiliary URL (warm-up, health) stays on the origin of
+    the tool's approved api_url; the server fetches these, so any other host is refused
+    """
+    return not url or tool_origin(url).lower() == tool_origin(api_url).lower()
+
+
+def mark_warm(origin: str):
+    """Record that a pooled connection to origin was just used (e.g. by the health prober)"""
+    _warm_hosts[origin] = time.monotonic()
+
+
+def rank_candidates(tools: List[Tool], message: str, limit: int) -> List[Tool]:
+    """Cheap lexical overlap between the message and each tool's name/description"""
+    words = set(_WORD.findall(message.lower()))
+    scored = []
+    for tool in tools:
+        tool_words = set(_WORD.findall(f"{tool.name} {tool.description}".lower()))
+        overlap = len(words & tool_words)
+        if overlap:
+            scored.append((overlap, tool))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [tool for _, tool in scored[:limit]]
+
+
+async def _warm_origin(origin: str, warmup_url: Optional[str], semaphore: asyncio.Semaphore):
+    async with semaphore:
+        stats.hosts_attempted += 1
+        parts = urlsplit(origin)
+        try:
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            await asyncio.get_running_loop().getaddrinfo(parts.hostname, port)
+            # Any request through the shared pool leaves a keep-alive TLS connection behind
+            client = get_http_client()
+            if warmup_url:
+                await client.get(warmup_url)
+            else:
+                await client.head(origin + "/")
+            mark_warm(origin)
+            stats.hosts_warmed += 1
+        except Exception as e:
+            stats.host_failures += 1
+            print(f"Pre-warm of {origin} failed: {e}")
+
+
+async def _warm(targets: Dict[str, Optional[str]]):
+    semaphore = asyncio.Semaphore(settings.prewarm_concurrency)
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(_warm_origin(origin, url, semaphore) for origin, url in targets.items())),
+            timeout=settings.prewarm_budget_seconds
+        )
+    except asyncio.TimeoutError:
+        stats.budget_exceeded += 1
+
+
+def start_prewarm(tools: List[Tool], message: str) -> Optional[PrewarmHandle]:
+    """
+    Kick off pre-warming for the likeliest tools' hosts in the background
+
+    Returns:
+        Handle to pass to record_prewarm_outcome, or None if nothing was started
+    """
+    if not settings.prewarm_enabled:
+        return None
+
+    candidates = rank_candidates(tools, message, settings.prewarm_max_hosts)
+    now = time.monotonic()
+    targets: Dict[str, Optional[str]] = {}
+    handle = PrewarmHandle()
+    for tool in candidates:
+        origin = tool_origin(tool.api_url)
+        handle.origins.add(origin)
+        # Skip hosts whose pooled connection is still fresh
+        if now - _warm_hosts.get(origin, 0.0) < WARM_WINDOW_SECONDS:
+            continue
+        # Rows saved before origins were enforced fall back to the origin itself
+        targets.setdefault(origin, tool.warmup_url if on_tool_origin(tool.warmup_url, tool.api_url) else None)
+
+    if not handle.origins:
+        return None
+    stats.rounds += 1
+    if targets:
+        handle.task = asyncio.create_task(_warm(targets))
+    return handle
+
+
+def record_prewarm_outcome(handle: Optional[PrewarmHandle], tool: Optional[Tool]):
+    """Classify whether pre-warming helped the tool that was actually selected"""
+    if handle is None or tool is None:
+        return
+    origin = tool_origin(tool.api_url)
+    if origin not in handle.origins:
+        stats.misses += 1
+    elif time.monotonic() - _warm_hosts.get(origin, 0.0) < WARM_WINDOW_SECONDS:
+        stats.hits += 1
+    else:
+        stats.late += 1
@@ -0,0 +1,138 @@
+"""
+Query Plan Checks
+EXPLAINs the hot queries from payments, agent, tools and the background
+workers and checks that each is served by the index built for it (alembic
+revisions 0002 and 0003) rather than a full table scan.
+
+Run:
+    python -m app.query_plans        exits 1 if any query misses its index
+
+On Postgres, sequential scans are disabled for the check, so a small table
+still shows whether an index can serve the query.
+"""
+
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+
+@dataclass
+class HotQuery:
+    name: str
+    sql: str
+    indexes: Tuple[str, ...]  # Any of these satisfies the check
+
+
+HOT_QUERIES = [
+    HotQuery(
+        "earnings page",
+        "SELECT id FROM transactions WHERE to_user_id = :user_id AND from_user_id != :user_id "
+        "AND id < :cursor ORDER BY id DESC LIMIT 101",
+        ("ix_transactions_to_user_id_id",)
+    ),
+    HotQuery(
+        "spending page",
+        "SELECT id FROM transactions WHERE from_user_id = :user_id AND to_user_id != :user_id "
+        "ORDER BY id DESC LIMIT 101",
+        ("ix_transactions_from_user_id_id",)
+    ),
+    HotQuery(
+        "earnings totals",
+        "SELECT count(id), sum(CASE WHEN status = 'confirmed' THEN amount_mnee ELSE 0 END) FROM transactions "
+        "WHERE to_user_id = :user_id AND from_user_id != :user_id",
+        ("ix_transactions_to_user_status_amount", "ix_transactions_to_user_id_id")
+    ),
+    HotQuery(
+        "outstanding debits",
+        "SELECT sum(amount_mnee) FROM transactions WHERE from_user_id = :user_id "
+        "AND status IN ('accrued', 'settling')",
+        ("ix_transactions_from_user_status_amount",)
+    ),
+    HotQuery(
+        "latest payment for tool",
+        "SELECT id FROM transactions WHERE from_user_id = :user_id AND tool_id = :tool_id "
+        "ORDER BY created_at DESC LIMIT 1",
+        ("ix_transactions_from_user_tool_created",)
+    ),
+    HotQuery(
+        "pending confirmations",
+        "SELECT id FROM transactions WHERE status = 'pending' AND id > 0 ORDER BY id LIMIT 100",
+        ("ix_transactions_status_id",)
+    ),
+    HotQuery(
+        "recent tool usage",
+        "SELECT tool_id, max(created_at) FROM transactions WHERE created_at >= :since GROUP BY tool_id",
+        ("ix_transactions_created_tool",)
+    ),
+    HotQuery(
+        "rollup refresh: changed payments",
+        "SELECT tool_id, created_at FROM transactions WHERE id BETWEEN :cursor AND :cursor + 5000 "
+        "OR created_at >= :since OR confirmed_at >= :since",
+        ("ix_transactions_confirmed_at",)
+    ),
+    HotQuery(
+        "earnings series",
+        "SELECT bucket_start, tool_id, calls, gross_mnee FROM tool_usage_rollups WHERE owner_id = :user_id "
+        "AND granularity = 'day' AND bucket_start >= :since ORDER BY bucket_start",
+        ("ix_tool_usage_rollups_owner_bucket",)
+    ),
+    HotQuery(
+        "owned tools",
+        "SELECT id FROM tools WHERE owner_id = :user_id",
+        ("ix_tools_owner_id",)
+    ),
+    HotQuery(
+        "conversation history",
+        "SELECT id FROM conversations WHERE user_id = :user_id ORDER BY created_at DESC LIMIT 20",
+        ("ix_conversations_user_created",)
+    ),
+]
+
+PARAMS: Dict[str, object] = {"user_id": 1, "tool_id": 1, "cursor": 1000000, "since": "2000-01-01"}
+
+
+def explain(conn, query: HotQuery) -> str:
+    if conn.dialect.name == "postgresql":
+        rows = conn.execute(text(f"EXPLAIN {query.sql}"), PARAMS)
+        return "\n".join(row[0] for row in rows)
+    # SQLite: (id, parent, notused, detail)
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {query.sql}"), PARAMS)
+    return "\n".join(row[-1] for row in rows)
+
+
+def check_query_plans(engine: Engine) -> List[Tuple[HotQuery, bool, str]]:
+    """
+    EXPLAIN every hot query
+
+    Returns:
+        (query, uses one of its indexes, plan text) per query
+    """
+    results = []
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for query in HOT_QUERIES:
+            plan = explain(conn, query)
+            results.append((query, any(index in plan for index in query.indexes), plan))
+        conn.rollback()
+    return results
+
+
+def main() -> int:
+    from app.database import engine
+
+    failed = 0
+    for query, ok, plan in check_query_plans(engine):
+        print(f"{'✓' if ok else '✗'} {query.name}")
+        if not ok:
+            failed += 1
+            print(f"  expected one of: {', '.join(query.indexes)}")
+            print("  " + plan.replace("\n", "\n  "))
+    print(f"\n{len(HOT_QUERIES) - failed}/{len(HOT_QUERIES)} queries use their index")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Tool Result Projection
+Compiles a tool owner's declarative projection (JSONPath-style field
+selection plus array/string limits) and applies it to upstream results
+before they are prompted to the LLM or stored in conversation history
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from app.models import Tool
+
+# A path is dotted keys with optional [n], [*] or [start:end] selectors,
+# e.g. "booking.seats[*].number" or "results[0:5].title"
+_PATH_TOKEN = re.compile(r"\.?([^.\[\]]+)|\[(\*|-?\d+|-?\d*:-?\d*)\]")
+
+_MISSING = object()
+
+
+class ProjectionError(ValueError):
+    pass
+
+
+class _ListSelection(dict):
+    """Selected list elements keyed by original index, so paths merge element-wise"""
+
+
+def parse_path(path: str) -> List[Tuple[str, Any]]:
+    """Parse a projection path into (kind, arg) steps"""
+    steps = []
+    position = 0
+    while position < len(path):
+        match = _PATH_TOKEN.match(path, position)
+        if not match or match.end() == position:
+            raise ProjectionError(f"Invalid projection path '{path}' at position {position}")
+        key, selector = match.groups()
+        if key is not None:
+            steps.append(("key", key))
+        elif selector == "*":
+            steps.append(("slice", slice(None)))
+        elif ":" in selector:
+            start, end = selector.split(":")
+            steps.append(("slice", slice(int(start) if start else None, int(end) if end else None)))
+        else:
+            steps.append(("index", int(selector)))
+        position = match.end()
+    if not steps:
+        raise ProjectionError("Projection paths cannot be empty")
+    return steps
+
+
+def _select(value: Any, steps: List[Tuple[str, Any]]) -> Any:
+    if not steps:
+        return value
+    kind, arg = steps[0]
+    rest = steps[1:]
+
+    if kind == "key":
+        if not isinstance(value, dict) or arg not in value:
+            return _MISSING
+        selected = _select(value[arg], rest)
+        return _MISSING if selected is _MISSING else {arg: selected}
+
+    if not isinstance(value, list):
+        return _MISSING
+    if kind == "index":
+        indexes = [arg if arg >= 0 else len(value) + arg]
+        indexes = [i for i in indexes if 0 <= i < len(value)]
+    else:
+        indexes = list(range(len(value)))[arg]
+
+    selection = _ListSelection()
+    for i in indexes:
+        selected = _select(value[i], rest)
+        if selected is not _MISSING:
+            selection[i] = selected
+    return selection if selection else _MISSING
+
+
+def _merge(left: Any, right: Any) -> Any:
+    if isinstance(left, _ListSelection) and isinstance(right, _ListSelection):
+        merged = _ListSelection(left)
+        for i, item in right.items():
+            merged[i] = _merge(merged[i], item) if i in merged else item
+        return merged
+    if isinstance(left, dict) and isinstance(right, dict):
+        merged = dict(left)
+        for key, item in right.items():
+            merged[key] = _merge(merged[key], item) if key in merged else item
+        return merged
+    return right
+
+
+def _finalize(value: Any, max_items: Optional[int], max_string_length: Optional[int]) -> Any:
+    """Turn list selections back into lists and enforce size limits"""
+    if isinstance(value, _ListSelection):
+        value = [value[i] for i in sorted(value)]
+    if isinstance(value, list):
+        items = value[:max_items] if max_items is not None else value
+        return [_finalize(item, max_items, max_string_length) for item in items]
+    if isinstance(value, dict):
+        return {key: _finalize(item, max_items, max_string_length) for key, item in value.items()}
+    if isinstance(value, str) and max_string_length is not None and len(value) > max_string_length:
+        return value[:max_string_length] + "..."
+    return value
+
+
+class CompiledProjection:
+    """
+    Projection spec, e.g.
+        {"fields": ["booking_id", "seats[*].number"], "max_items": 10, "max_string_length": 500}
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        if not isinstance(spec, dict):
+            raise ProjectionError("result_projection must be a JSON object")
+        fields = spec.get("fields") or []
+        if not isinstance(fields, list) or not all(isinstance(f, str) for f in fields):
+            raise ProjectionError("fields must be a list of path strings")
+        self.paths = [parse_path(field) for field in fields]
+        self.max_items = self._limit(spec, "max_items")
+        self.max_string_length = self._limit(spec, "max_string_length")
+
+    @staticmethod
+    def _limit(spec: Dict[str, Any], name: str) -> Optional[int]:
+        value = spec.get(name)
+        if value is None:
+            return None
+        if not isinstance(value, int) or value < 0:
+            raise ProjectionError(f"{name} must be a non-negative integer")
+        return value
+
+    def apply(self, result: Any) -> Any:
+        if self.paths:
+            projected = _MISSING
+            for steps in self.paths:
+                selected = _select(result, steps)
+                if selected is _MISSING:
+                    continue
+                projected = selected if projected is _MISSING else _merge(projected, selected)
+            # Never hand the LLM an empty result just because the upstream shape changed
+            if projected is _MISSING:
+                projected = result
+            result = projected
+        return _finalize(result, self.max_items, self.max_string_length)
+
+
+def compile_projection(raw: str) -> CompiledProjection:
+    """Compile a result_projection JSON string, raising ProjectionError if invalid"""
+    try:
+        spec = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ProjectionError(f"result_projection is not valid JSON: {e}")
+    return CompiledProjection(spec)
+
+
+# Compiled projections keyed by tool id and version
+_projection_cache: Dict[int, Tuple[tuple, Optional[CompiledProjection]]] = {}
+
+
+def get_tool_projection(tool: Tool) -> Optional[CompiledProjection]:
+    """Compiled projection for the tool's current version, or None if it declares none"""
+    version = (tool.updated_at, tool.result_projection)
+    cached = _projection_cache.get(tool.id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    compiled = None
+    if tool.result_projection:
+        try:
+            compiled = compile_projection(tool.result_projection)
+        except ProjectionError as e:
+            print(f"Ignoring invalid result_projection on tool {tool.name}: {e}")
+    _projection_cache[tool.id] = (version, compiled)
+    return compiled
+
+
+def project_tool_result(tool: Tool, result: Any) -> Any:
+    """Apply the tool's projection to an upstream result (identity if none declared)"""
+    projection = get_tool_projection(tool)
+    return projection.apply(result) if projection else result
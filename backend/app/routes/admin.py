@@ -1,11 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy import func, case
 from typing import List
 from app.database import get_db
-from app.models import User, Tool
+from app.models import User, Tool, RoutingDecision
 from app.schemas import ToolResponse, UserResponse
 from app.security import get_current_admin_user
 from app.crypto import verify_metadata_hash
+from app.prewarm import stats as prewarm_stats
+from app.balance_ledger import reconcile_balances
+from app.balance_reader import get_mnee_balances
+from app.chain import to_checksum
+from app.settlement import settlement_scheduler
+from app.usage_rollups import rollup_aggregator
 
 router = APIRouter()
 
@@ -74,12 +81,27 @@ async def reject_tool(
 
 @router.get("/users", response_model=List[UserResponse])
 async def list_users(
+    include_onchain_balances: bool = False,
     db: Session = Depends(get_db),
     admin: User = Depends(get_current_admin_user)
 ):
-    """List all users"""
+    """List all users, optionally with their on-chain MNEE balances (read in one batch)"""
     users = db.query(User).all()
-    return [UserResponse.from_orm(user) for user in users]
+    responses = [UserResponse.from_orm(user) for user in users]
+    
+    if include_onchain_balances and users:
+        try:
+            snapshot = await get_mnee_balances([user.public_key for user in users])
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Balance read failed: {str(e)}"
+            )
+        for response in responses:
+            balance = snapshot.balances.get(to_checksum(response.public_key))
+            response.onchain_balance_mnee = float(balance) if balance is not None else None
+    
+    return responses
 
 @router.post("/make-admin/{user_id}", response_model=UserResponse)
 async def make_user_admin(
@@ -101,3 +123,67 @@ async def make_user_admin(
     db.refresh(user)
     
     return UserResponse.from_orm(user)
+
+@router.get("/routing-stats")
+async def routing_stats(
+    db: Session = Depends(get_db),
+    admin: User = Depends(get_current_admin_user)
+):
+    """Fast-path router hit rate, shadow-checked accuracy and latency per strategy"""
+    rows = db.query(
+        RoutingDecision.strategy,
+        func.count(RoutingDecision.id),
+        func.avg(RoutingDecision.latency_ms),
+        func.sum(case((RoutingDecision.shadow_checked == True, 1), else_=0)),
+        func.sum(case(
+            (
+                (RoutingDecision.shadow_checked == True) &
+                (RoutingDecision.shadow_llm_tool_id == RoutingDecision.tool_id),
+                1
+            ),
+            else_=0
+        ))
+    ).group_by(RoutingDecision.strategy).all()
+    
+    strategies = {
+        strategy: {
+            "decisions": count,
+            "avg_latency_ms": float(avg_latency or 0.0),
+            "shadow_checked": int(checked or 0),
+            "shadow_agreed": int(agreed or 0)
+        }
+        for strategy, count, avg_latency, checked, agreed in rows
+    }
+    total = sum(s["decisions"] for s in strategies.values())
+    fast_path = strategies.get("fast_path", {})
+    checked = fast_path.get("shadow_checked", 0)
+    
+    return {
+        "total_decisions": total,
+        "fast_path_hit_rate": fast_path.get("decisions", 0) / total if total else 0.0,
+        "fast_path_accuracy": fast_path.get("shadow_agreed", 0) / checked if checked else None,
+        "strategies": strategies
+    }
+
+@router.get("/prewarm-stats")
+async def get_prewarm_stats(admin: User = Depends(get_current_admin_user)):
+    """How often speculative host pre-warming was ready for the selected tool (this process)"""
+    return prewarm_stats.as_dict()
+
+@router.post("/reconcile-balances")
+async def reconcile_user_balances(
+    db: Session = Depends(get_db),
+    admin: User = Depends(get_current_admin_user)
+):
+    """Rebuild the per-user balance ledger from the transaction log"""
+    return reconcile_balances(db)
+
+@router.post("/settle-now")
+async def settle_now(admin: User = Depends(get_current_admin_user)):
+    """Run a settlement round immediately (net accrued payments and submit transfers)"""
+    return await settlement_scheduler.run_once()
+
+@router.post("/refresh-rollups")
+async def refresh_usage_rollups(admin: User = Depends(get_current_admin_user)):
+    """Bring the tool usage rollups up to date now"""
+    return await rollup_aggregator.run_once()
@@ -3,25 +3,41 @@ AI Agent Orchestration Routes
 Handles user interactions with AI agent for tool selection and execution
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+import asyncio
 import json
+import random
+import time
 import httpx
 from datetime import datetime
 
-from app.database import get_db
-from app.models import User, Tool, Transaction, Conversation
-from app.security import get_current_user
+from app.config import get_settings
+from app.database import get_db, SessionLocal
+from app.models import User, Tool, Transaction, Conversation, RoutingDecision, ToolResultArchive
+from app.security import get_current_user, get_user_from_token
 from app.crypto import get_encryption_key, decrypt_data
 from app.groq_service import (
+    GeminiClient,
     format_tools_for_llm,
     call_gemini_for_tool_selection,
+    stream_tool_selection,
     generate_final_response
 )
+from app.tool_router import get_fast_path_router
+from app.http_client import get_http_client
+from app.prewarm import start_prewarm, record_prewarm_outcome
+from app.result_projection import project_tool_result
+from app.conversation_search import search_conversations
+from app.job_service import job_runner, job_to_dict, get_user_job, job_event_stream, JobQueueFull
+from app.credit import InsufficientCredit, charge_credit, refund_credit_charge
+from app.exports import EXPORT_FORMATS, stream_export, conversation_export, export_filename
 
 router = APIRouter()
+settings = get_settings()
 
 
 class AgentChatRequest(BaseModel):
@@ -38,6 +54,20 @@ class AgentChatResponse(BaseModel):
     conversation_id: int
 
 
+def shape_tool_result(tool: Tool, result: Any, user: User, db: Session) -> Any:
+    """
+    Apply the tool's result projection as soon as the upstream response
+    arrives, archiving the raw result first when archive_raw_tool_results is on
+    """
+    if settings.archive_raw_tool_results:
+        db.add(ToolResultArchive(
+            tool_id=tool.id,
+            user_id=user.id,
+            raw_result=json.dumps(result)
+        ))
+    return project_tool_result(tool, result)
+
+
 async def execute_tool(
     tool: Tool,
     parameters: Dict[str, Any],
@@ -56,10 +86,41 @@ async def execute_tool(
     Returns:
         Tuple of (result_dict, error_message)
     """
-    try:
-        # TODO: Check user's MNEE balance before execution
-        # This would require web3 integration to check balance
+    charge = None
+    if settings.payment_mode == "credit":
+        # Debit prepaid credit up front (a single UPDATE) and refund if the call fails
+        try:
+            charge = charge_credit(db, user.id, tool)
+        except InsufficientCredit as e:
+            return None, f"Insufficient credit. Required: {tool.price_mnee}, Available: {e.available_mnee}"
+    
+    result, error = await call_tool_api(tool, parameters, user, db, charge)
+    if error and charge:
+        refund_credit_charge(db, charge)
+    return result, error
+
+
+async def call_tool_api(
+    tool: Tool,
+    parameters: Dict[str, Any],
+    user: User,
+    db: Session,
+    charge: Optional[Transaction] = None
+) -> tuple[Dict[str, Any], Optional[str]]:
+    """
+    Call the tool's API, paying per X402 if it asks for payment
+    
+    Args:
+        tool: Tool object to execute
+        parameters: Parameters for the tool
+        user: Current user making the request
+        db: Database session
+        charge: Credit payment already taken for this call, used as the payment proof
         
+    Returns:
+        Tuple of (result_dict, error_message)
+    """
+    try:
         # Prepare API request
         headers = json.loads(tool.api_headers) if tool.api_headers else {}
         body_template = json.loads(tool.api_body_template) if tool.api_body_template else {}
@@ -84,17 +145,17 @@ async def execute_tool(
         print(f"===========================\n")
         
         # Make API request (120s timeout for cold starts on Render)
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            if tool.api_method.upper() == "GET":
-                response = await client.get(tool.api_url, headers=headers, params=parameters)
-            elif tool.api_method.upper() == "POST":
-                response = await client.post(tool.api_url, headers=headers, json=body)
-            elif tool.api_method.upper() == "PUT":
-                response = await client.put(tool.api_url, headers=headers, json=body)
-            elif tool.api_method.upper() == "DELETE":
-                response = await client.delete(tool.api_url, headers=headers)
-            else:
-                return None, f"Unsupported HTTP method: {tool.api_method}"
+        client = get_http_client()
+        if tool.api_method.upper() == "GET":
+            response = await client.get(tool.api_url, headers=headers, params=parameters)
+        elif tool.api_method.upper() == "POST":
+            response = await client.post(tool.api_url, headers=headers, json=body)
+        elif tool.api_method.upper() == "PUT":
+            response = await client.put(tool.api_url, headers=headers, json=body)
+        elif tool.api_method.upper() == "DELETE":
+            response = await client.delete(tool.api_url, headers=headers)
+        else:
+            return None, f"Unsupported HTTP method: {tool.api_method}"
         
         response.raise_for_status()
         
@@ -103,20 +164,22 @@ async def execute_tool(
             result = response.json()
         except:
             result = {"response": response.text}
+        result = shape_tool_result(tool, result, user, db)
         
         # Create transaction record for successful payment
-        tx_hash = f"0x{'0' * 64}"  # Placeholder transaction hash
-        
-        transaction = Transaction(
-            from_user_id=user.id,
-            to_user_id=tool.owner_id,
-            tool_id=tool.id,
-            amount_mnee=tool.price_mnee,
-            tx_hash=tx_hash,
-            status="confirmed"
-        )
-        db.add(transaction)
-        db.commit()
+        if charge is None:
+            tx_hash = f"0x{'0' * 64}"  # Placeholder transaction hash
+            
+            transaction = Transaction(
+                from_user_id=user.id,
+                to_user_id=tool.owner_id,
+                tool_id=tool.id,
+                amount_mnee=tool.price_mnee,
+                tx_hash=tx_hash,
+                status="confirmed"
+            )
+            db.add(transaction)
+            db.commit()
         
         return result, None
         
@@ -130,23 +193,27 @@ async def execute_tool(
                 payment_info = e.response.json()
                 print(f"Payment details: {payment_info}")
                 
-                # Create proper mock transaction hash (66 chars: 0x + 64 hex)
-                import hashlib
-                hash_input = f"{user.id}{tool.id}{int(datetime.utcnow().timestamp())}"
-                tx_hash = "0x" + hashlib.sha256(hash_input.encode()).hexdigest()
-                print(f"Mock transaction hash: {tx_hash}")
-                
-                transaction = Transaction(
-                    from_user_id=user.id,
-                    to_user_id=tool.owner_id,
-                    tool_id=tool.id,
-                    amount_mnee=tool.price_mnee,
-                    tx_hash=tx_hash,
-                    status="confirmed"
-                )
-                db.add(transaction)
-                db.commit()
-                print(f"Transaction recorded in database")
+                if charge is not None:
+                    # Already paid from prepaid credit
+                    tx_hash = charge.tx_hash
+                else:
+                    # Create proper mock transaction hash (66 chars: 0x + 64 hex)
+                    import hashlib
+                    hash_input = f"{user.id}{tool.id}{int(datetime.utcnow().timestamp())}"
+                    tx_hash = "0x" + hashlib.sha256(hash_input.encode()).hexdigest()
+                    print(f"Mock transaction hash: {tx_hash}")
+                    
+                    transaction = Transaction(
+                        from_user_id=user.id,
+                        to_user_id=tool.owner_id,
+                        tool_id=tool.id,
+                        amount_mnee=tool.price_mnee,
+                        tx_hash=tx_hash,
+                        status="confirmed"
+                    )
+                    db.add(transaction)
+                    db.commit()
+                    print(f"Transaction recorded in database")
                 
                 # Add payment proof to request body and header
                 body['payment_proof'] = tx_hash
@@ -159,16 +226,16 @@ async def execute_tool(
                 print(f"Retrying request with payment proof: {tx_hash}")
                 
                 # Retry with same extended timeout for cold starts
-                async with httpx.AsyncClient(timeout=120.0) as client:
-                    if tool.api_method.upper() == "POST":
-                        retry_response = await client.post(tool.api_url, headers=headers, json=body)
-                    elif tool.api_method.upper() == "GET":
-                        retry_response = await client.get(tool.api_url, headers=headers, params=body)
-                    else:
-                        retry_response = await client.request(tool.api_method, tool.api_url, headers=headers, json=body)
+                client = get_http_client()
+                if tool.api_method.upper() == "POST":
+                    retry_response = await client.post(tool.api_url, headers=headers, json=body)
+                elif tool.api_method.upper() == "GET":
+                    retry_response = await client.get(tool.api_url, headers=headers, params=body)
+                else:
+                    retry_response = await client.request(tool.api_method, tool.api_url, headers=headers, json=body)
                 
                 retry_response.raise_for_status()
-                result = retry_response.json()
+                result = shape_tool_result(tool, retry_response.json(), user, db)
                 print(f"Success! Booking completed")
                 print(f"===========================\n")
                 
@@ -193,159 +260,512 @@ async def execute_tool(
         return None, error_detail
 
 
-@router.post("/chat", response_model=AgentChatResponse)
-async def agent_chat(
-    request: AgentChatRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+def shadow_check_routing(
+    decision_id: int,
+    user_message: str,
+    tools_json: str,
+    encrypted_api_key: str,
+    model: str
 ):
     """
-    Main AI agent chat endpoint
+    Ask Gemini for its choice on a fast-path hit and store it next to the
+    routing decision, so fast-path accuracy can be measured
+    """
+    selection = call_gemini_for_tool_selection(
+        user_message=user_message,
+        tools_json=tools_json,
+        encrypted_api_key=encrypted_api_key,
+        encryption_key=get_encryption_key(),
+        model=model
+    )
+    if selection.get("error"):
+        return
+    
+    db = SessionLocal()
+    try:
+        decision = db.query(RoutingDecision).filter(RoutingDecision.id == decision_id).first()
+        if decision:
+            decision.shadow_checked = True
+            decision.shadow_llm_tool_id = selection.get("tool_id")
+            db.commit()
+    finally:
+        db.close()
+
+
+async def run_agent_chat(
+    request: AgentChatRequest,
+    db: Session,
+    current_user: User,
+    tools: Optional[List[Tool]] = None,
+    llm_client: Optional[GeminiClient] = None,
+    on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+) -> AgentChatResponse:
+    """
+    Run one agent turn for a user
+    
+    Args:
+        request: Chat message and model
+        db: Database session
+        current_user: User making the request
+        tools: Catalog snapshot to use instead of querying approved tools
+        llm_client: Gemini client to reuse instead of decrypting the key per call
+        on_event: Callback receiving partial results (selection, tool_result)
     
     Flow:
     1. Check if user has Gemini API key configured
     2. Fetch all approved/active tools
-    3. Format tools for LLM
-    4. Call Gemini to select appropriate tool
+    3. Try the deterministic fast-path router
+    4. Otherwise stream Gemini's tool selection, returning as soon as the
+       tool and parameters are known
     5. Execute selected tool with payment
     6. Call Gemini again with result to generate final response
     7. Save conversation history
     8. Return response to user
     """
-    try:
-        # Step 1: Verify Gemini API key
-        if not current_user.groq_api_key:
-            raise HTTPException(
-                status_code=400,
-                detail="Gemini API key not configured. Please set your API key in settings."
-            )
-        
-        encryption_key = get_encryption_key()
-        
-        # Step 2: Fetch approved tools
+    # Step 1: Verify Gemini API key
+    if not current_user.groq_api_key:
+        raise HTTPException(
+            status_code=400,
+            detail="Gemini API key not configured. Please set your API key in settings."
+        )
+    
+    encryption_key = get_encryption_key()
+    
+    # Step 2: Fetch approved tools
+    if tools is None:
         tools = db.query(Tool).filter(
             Tool.approved == True,
             Tool.active == True
         ).all()
+    
+    if not tools:
+        # No tools available
+        final_response = "I apologize, but there are no tools available at the moment. Please check back later."
         
-        if not tools:
-            # No tools available
-            final_response = "I apologize, but there are no tools available at the moment. Please check back later."
-            
-            conversation = Conversation(
-                user_id=current_user.id,
-                user_message=request.message,
-                tool_selected=None,
-                tool_result=None,
-                final_response=final_response
-            )
-            db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
-            
-            return AgentChatResponse(
-                response=final_response,
-                conversation_id=conversation.id
-            )
-        
-        # Step 3: Format tools for LLM
-        tools_json = format_tools_for_llm(tools)
-        
-        # Step 4: Call Gemini for tool selection
-        print(f"\n=== Tool Selection Debug ===")
-        print(f"User message: {request.message}")
-        print(f"Available tools: {[t.name for t in tools]}")
-        
-        selection = call_gemini_for_tool_selection(
-            user_message=request.message,
-            tools_json=tools_json,
-            encrypted_api_key=current_user.groq_api_key,
-            encryption_key=encryption_key,
-            model=request.model
-        )
-        
-        print(f"Gemini selection result: {selection}")
-        print(f"===========================\n")
-        
-        # Check if tool was selected
-        tool_id = selection.get("tool_id")
-        tool_name = selection.get("tool_name")
-        parameters = selection.get("parameters", {})
-        
-        tool_result = None
-        error_message = None
-        price_paid = None
-        tx_hash = None
-        
-        if tool_id:
-            # Step 5: Execute tool
-            print(f"\n=== Tool Execution ===")
-            print(f"Selected tool_id: {tool_id}")
-            print(f"Parameters from Gemini: {parameters}")
-            
-            tool = db.query(Tool).filter(Tool.id == tool_id).first()
-            
-            if not tool:
-                error_message = f"Tool {tool_name} not found"
-                print(f"ERROR: Tool not found in database")
-            else:
-                print(f"Executing tool: {tool.name}")
-                tool_result, error_message = await execute_tool(tool, parameters, current_user, db)
-                
-                if not error_message:
-                    price_paid = tool.price_mnee
-                    # Get the transaction hash from the last transaction
-                    last_tx = db.query(Transaction).filter(
-                        Transaction.from_user_id == current_user.id,
-                        Transaction.tool_id == tool.id
-                    ).order_by(Transaction.created_at.desc()).first()
-                    
-                    if last_tx:
-                        tx_hash = last_tx.tx_hash
-        else:
-            # No tool selected
-            tool_name = None
-            error_message = selection.get("reasoning", "No appropriate tool found")
-        
-        # Step 6: Generate final response
-        final_response = generate_final_response(
-            user_message=request.message,
-            tool_name=tool_name,
-            tool_result=tool_result,
-            encrypted_api_key=current_user.groq_api_key,
-            encryption_key=encryption_key,
-            error_message=error_message,
-            model=request.model
-        )
-        
-        # Step 7: Save conversation
         conversation = Conversation(
             user_id=current_user.id,
             user_message=request.message,
-            tool_selected=tool_name,
-            tool_result=json.dumps(tool_result) if tool_result else None,
+            tool_selected=None,
+            tool_result=None,
             final_response=final_response
         )
         db.add(conversation)
         db.commit()
         db.refresh(conversation)
         
-        # Step 8: Return response
         return AgentChatResponse(
             response=final_response,
-            tool_used=tool_name,
-            tool_result=tool_result,
-            price_paid=price_paid,
-            transaction_hash=tx_hash,
             conversation_id=conversation.id
         )
+    
+    print(f"\n=== Tool Selection Debug ===")
+    print(f"User message: {request.message}")
+    print(f"Available tools: {[t.name for t in tools]}")
+    
+    routing_started = time.perf_counter()
+    
+    # Step 3: Deterministic fast path (exact names, trigger phrases, extractors)
+    route = None
+    prewarm = None
+    if settings.fast_path_enabled:
+        route = get_fast_path_router(tools).route(request.message, settings.fast_path_min_confidence)
+    
+    if route:
+        selection = {
+            "tool_id": route.tool_id,
+            "tool_name": route.tool_name,
+            "reasoning": f"Fast-path match ({route.matched_rule})",
+            "parameters": route.parameters
+        }
+        print(f"Fast-path selection result: {selection} (confidence {route.confidence})")
+    else:
+        # Step 4: Pre-warm likely tool hosts while Gemini selects a tool
+        prewarm = start_prewarm(tools, request.message)
+        tools_json = format_tools_for_llm(tools)
+        selection = await stream_tool_selection(
+            user_message=request.message,
+            tools_json=tools_json,
+            encrypted_api_key=current_user.groq_api_key,
+            encryption_key=encryption_key,
+            model=request.model,
+            client=llm_client
+        )
+        print(f"Gemini selection result: {selection}")
+    
+    routing_latency_ms = (time.perf_counter() - routing_started) * 1000
+    print(f"===========================\n")
+    
+    if on_event:
+        await on_event({
+            "type": "selection",
+            "strategy": "fast_path" if route else "llm",
+            "tool_id": selection.get("tool_id"),
+            "tool_name": selection.get("tool_name"),
+            "parameters": selection.get("parameters", {})
+        })
+    
+    # Check if tool was selected
+    tool_id = selection.get("tool_id")
+    tool_name = selection.get("tool_name")
+    parameters = selection.get("parameters", {})
+    
+    tool_result = None
+    error_message = None
+    price_paid = None
+    tx_hash = None
+    
+    if tool_id:
+        # Step 5: Execute tool
+        print(f"\n=== Tool Execution ===")
+        print(f"Selected tool_id: {tool_id}")
+        print(f"Parameters from Gemini: {parameters}")
         
+        tool = db.query(Tool).filter(Tool.id == tool_id).first()
+        
+        if not tool:
+            error_message = f"Tool {tool_name} not found"
+            print(f"ERROR: Tool not found in database")
+        else:
+            record_prewarm_outcome(prewarm, tool)
+            print(f"Executing tool: {tool.name}")
+            tool_result, error_message = await execute_tool(tool, parameters, current_user, db)
+            
+            if not error_message:
+                price_paid = tool.price_mnee
+                # Get the transaction hash from the last transaction
+                last_tx = db.query(Transaction).filter(
+                    Transaction.from_user_id == current_user.id,
+                    Transaction.tool_id == tool.id
+                ).order_by(Transaction.created_at.desc()).first()
+                
+                if last_tx:
+                    tx_hash = last_tx.tx_hash
+    else:
+        # No tool selected
+        tool_name = None
+        error_message = selection.get("reasoning", "No appropriate tool found")
+    
+    if on_event and tool_id:
+        await on_event({
+            "type": "tool_result",
+            "tool_name": tool_name,
+            "tool_result": tool_result,
+            "error": error_message,
+            "price_paid": price_paid,
+            "transaction_hash": tx_hash
+        })
+    
+    # Step 6: Generate final response (off the event loop; the SDK call blocks)
+    final_response = await asyncio.to_thread(
+        generate_final_response,
+        user_message=request.message,
+        tool_name=tool_name,
+        tool_result=tool_result,
+        encrypted_api_key=current_user.groq_api_key,
+        encryption_key=encryption_key,
+        error_message=error_message,
+        model=request.model,
+        client=llm_client
+    )
+    
+    # Step 7: Save conversation
+    conversation = Conversation(
+        user_id=current_user.id,
+        user_message=request.message,
+        tool_selected=tool_name,
+        tool_result=json.dumps(tool_result) if tool_result else None,
+        final_response=final_response
+    )
+    db.add(conversation)
+    db.commit()
+    db.refresh(conversation)
+    
+    # Log the routing decision so fast-path hit rate and accuracy can be measured
+    decision = RoutingDecision(
+        user_id=current_user.id,
+        conversation_id=conversation.id,
+        user_message=request.message,
+        strategy="fast_path" if route else "llm",
+        tool_id=selection.get("tool_id"),
+        confidence=route.confidence if route else None,
+        matched_rule=route.matched_rule if route else None,
+        latency_ms=routing_latency_ms
+    )
+    db.add(decision)
+    db.commit()
+    
+    if route and random.random() < settings.fast_path_shadow_rate:
+        asyncio.get_running_loop().run_in_executor(
+            None,
+            shadow_check_routing,
+            decision.id,
+            request.message,
+            format_tools_for_llm(tools),
+            current_user.groq_api_key,
+            request.model
+        )
+    
+    # Step 8: Return response
+    return AgentChatResponse(
+        response=final_response,
+        tool_used=tool_name,
+        tool_result=tool_result,
+        price_paid=price_paid,
+        transaction_hash=tx_hash,
+        conversation_id=conversation.id
+    )
+
+
+@router.post("/chat", response_model=AgentChatResponse)
+async def agent_chat(
+    request: AgentChatRequest,
+    async_mode: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Main AI agent chat endpoint
+    
+    With async_mode=true the turn runs on the job worker pool and a job id is
+    returned immediately (202). Poll /jobs/{job_id} or subscribe to
+    /jobs/{job_id}/events for the result.
+    """
+    if async_mode:
+        if not current_user.groq_api_key:
+            raise HTTPException(
+                status_code=400,
+                detail="Gemini API key not configured. Please set your API key in settings."
+            )
+        try:
+            job = job_runner.submit(db, current_user.id, "agent_chat", {
+                "user_id": current_user.id,
+                "message": request.message,
+                "model": request.model
+            })
+        except JobQueueFull:
+            raise HTTPException(status_code=503, detail="Job queue is full, try again later")
+        return JSONResponse(status_code=202, content=job_to_dict(job))
+    
+    try:
+        return await run_agent_chat(request, db, current_user)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Agent error: {str(e)}")
 
 
+async def agent_chat_job(payload: Dict[str, Any], db: Session) -> Dict[str, Any]:
+    """Job handler for async_mode chat requests"""
+    user = db.query(User).filter(User.id == payload["user_id"]).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    request = AgentChatRequest(message=payload["message"], model=payload["model"])
+    response = await run_agent_chat(request, db, user)
+    return response.model_dump()
+
+
+# A chat turn can pay for a tool call, so an interrupted job must not be re-run
+job_runner.register("agent_chat", agent_chat_job, retry_on_restart=False)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Poll the state of an async chat job"""
+    return job_to_dict(get_user_job(db, job_id, current_user.id))
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Subscribe to an async chat job via server-sent events"""
+    get_user_job(db, job_id, current_user.id)
+    return StreamingResponse(
+        job_event_stream(job_id, current_user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Cancel a queued or running async chat job"""
+    job = get_user_job(db, job_id, current_user.id)
+    return job_to_dict(job_runner.cancel(db, job))
+
+
+class AgentSession:
+    """Connection-scoped state for a WebSocket agent session"""
+    
+    def __init__(self, user: User, llm_client: GeminiClient):
+        self.user = user
+        self.llm_client = llm_client
+        self.tools: Optional[List[Tool]] = None
+        self.tools_loaded_at = 0.0
+    
+    def catalog(self, db: Session) -> List[Tool]:
+        """Approved tool snapshot, refreshed after ws_catalog_ttl_seconds"""
+        if self.tools is None or time.monotonic() - self.tools_loaded_at > settings.ws_catalog_ttl_seconds:
+            tools = db.query(Tool).filter(
+                Tool.approved == True,
+                Tool.active == True
+            ).all()
+            # Detach so the snapshot survives commits and closed sessions
+            for tool in tools:
+                db.expunge(tool)
+            self.tools = tools
+            self.tools_loaded_at = time.monotonic()
+        return self.tools
+
+
+async def open_agent_session(websocket: WebSocket, token: Optional[str]) -> Optional[AgentSession]:
+    """Authenticate the socket once and resolve the user and Gemini key"""
+    if not token:
+        try:
+            message = await asyncio.wait_for(websocket.receive_json(), timeout=settings.ws_auth_timeout_seconds)
+            token = message.get("token") if isinstance(message, dict) and message.get("type") == "auth" else None
+        except (asyncio.TimeoutError, ValueError):
+            token = None
+    
+    if not token:
+        await websocket.send_json({"type": "error", "detail": "Authentication required"})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return None
+    
+    db = SessionLocal()
+    try:
+        user = get_user_from_token(token, db)
+        db.expunge(user)
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "detail": e.detail})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return None
+    finally:
+        db.close()
+    
+    if not user.groq_api_key:
+        await websocket.send_json({
+            "type": "error",
+            "detail": "Gemini API key not configured. Please set your API key in settings."
+        })
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return None
+    
+    llm_client = GeminiClient.from_encrypted(user.groq_api_key, get_encryption_key())
+    await websocket.send_json({"type": "ready", "user_id": user.id})
+    return AgentSession(user, llm_client)
+
+
+@router.websocket("/ws")
+async def agent_websocket(websocket: WebSocket, token: Optional[str] = None):
+    """
+    Agent chat over a persistent WebSocket
+    
+    Authenticate once with ?token=<jwt> or a first {"type": "auth", "token": ...}
+    message, then send {"type": "chat", "id": ..., "message": ..., "model": ...}.
+    Each chat streams back selection, tool_result and response events tagged
+    with the client's id. At most ws_max_pending_messages chats are queued;
+    beyond that the server replies "busy" instead of buffering. The socket is
+    closed after ws_idle_timeout_seconds without traffic or work in flight.
+    """
+    await websocket.accept()
+    session = await open_agent_session(websocket, token)
+    if not session:
+        return
+    
+    inbox: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_max_pending_messages)
+    send_lock = asyncio.Lock()
+    in_flight = {"count": 0}
+    
+    async def send(event: Dict[str, Any]):
+        async with send_lock:
+            await websocket.send_json(event)
+    
+    async def reader():
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    websocket.receive_json(),
+                    timeout=settings.ws_idle_timeout_seconds
+                )
+            except asyncio.TimeoutError:
+                if in_flight["count"] or not inbox.empty():
+                    continue
+                await websocket.close(code=status.WS_1000_NORMAL_CLOSURE, reason="Idle timeout")
+                return
+            except WebSocketDisconnect:
+                return
+            except ValueError:
+                await send({"type": "error", "detail": "Messages must be JSON"})
+                continue
+            if not isinstance(message, dict):
+                await send({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            
+            message_type = message.get("type", "chat")
+            if message_type == "ping":
+                await send({"type": "pong"})
+            elif message_type == "chat" and message.get("message"):
+                try:
+                    inbox.put_nowait(message)
+                except asyncio.QueueFull:
+                    await send({"type": "busy", "id": message.get("id"), "detail": "Too many pending messages"})
+            else:
+                await send({"type": "error", "id": message.get("id"), "detail": "Unsupported message"})
+    
+    async def worker():
+        while True:
+            message = await inbox.get()
+            request_id = message.get("id")
+            in_flight["count"] += 1
+            
+            async def emit(event: Dict[str, Any]):
+                await send({**event, "id": request_id})
+            
+            db = SessionLocal()
+            try:
+                request = AgentChatRequest(
+                    message=message["message"],
+                    model=message.get("model") or "gemini-2.5-flash"
+                )
+                response = await run_agent_chat(
+                    request,
+                    db,
+                    session.user,
+                    tools=session.catalog(db),
+                    llm_client=session.llm_client,
+                    on_event=emit
+                )
+                await emit({"type": "response", **response.model_dump()})
+            except HTTPException as e:
+                await emit({"type": "error", "detail": e.detail})
+            except WebSocketDisconnect:
+                return
+            except Exception as e:
+                await emit({"type": "error", "detail": f"Agent error: {str(e)}"})
+            finally:
+                db.close()
+                in_flight["count"] -= 1
+                inbox.task_done()
+    
+    reader_task = asyncio.create_task(reader())
+    worker_task = asyncio.create_task(worker())
+    done, pending = await asyncio.wait([reader_task, worker_task], return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
 @router.get("/history")
 async def get_conversation_history(
     limit: int = 50,
@@ -371,3 +791,59 @@ async def get_conversation_history(
             for conv in conversations
         ]
     }
+
+
+@router.get("/history/export")
+async def export_conversation_history(
+    format: str = Query("ndjson", description="csv or ndjson"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[int] = Query(None, description="Last id received, to resume an interrupted export"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Stream the user's full conversation history as NDJSON or CSV, oldest first
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}"
+        )
+    
+    return StreamingResponse(
+        stream_export(conversation_export(current_user.id, start, end), Conversation.id, format, cursor),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename("conversations", format)}"'}
+    )
+
+
+@router.get("/history/search")
+async def search_conversation_history(
+    q: str = Query(..., min_length=1),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    tool: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Full-text search over the user's conversation history
+    
+    Results are ranked best match first with <mark> highlights; pass
+    next_cursor back as cursor to fetch the following page.
+    """
+    try:
+        return search_conversations(
+            db,
+            current_user.id,
+            q,
+            start=start,
+            end=end,
+            tool=tool,
+            limit=limit,
+            cursor=cursor
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
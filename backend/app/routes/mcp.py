@@ -1,43 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Header
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.orm import Session, joinedload
 from typing import Optional, Dict, Any
 import httpx
 import json
 from app.database import get_db
 from app.models import User, Tool, Transaction
-from app.crypto import decrypt_private_key, get_web3_instance, verify_metadata_hash
+from app.schemas import ToolHealthResponse
+from app.crypto import verify_metadata_hash
+from app.chain import InsufficientBalance
+from app.payment_service import charge_tool_call
+from app.payment_engine import PaymentQueueFull, PaymentPending, intent_to_dict
+from app.idempotency import IdempotentAttempt, run_idempotent
+from app.credit import refund_credit_charge
 from app.config import get_settings
-from web3 import Web3
-from eth_account import Account
+from app.http_client import get_http_client
+from app.job_service import job_runner, job_to_dict, get_user_job, job_event_stream, JobQueueFull
 
 router = APIRouter()
 settings = get_settings()
 
-# MNEE ERC-20 ABI
-MNEE_ABI = json.loads('''[
-    {
-        "constant": false,
-        "inputs": [
-            {"name": "_to", "type": "address"},
-            {"name": "_value", "type": "uint256"}
-        ],
-        "name": "transfer",
-        "outputs": [{"name": "", "type": "bool"}],
-        "type": "function"
-    },
-    {
-        "constant": true,
-        "inputs": [{"name": "_owner", "type": "address"}],
-        "name": "balanceOf",
-        "outputs": [{"name": "balance", "type": "uint256"}],
-        "type": "function"
-    }
-]''')
-
 @router.get("/tools")
 async def mcp_list_tools(db: Session = Depends(get_db)):
     """MCP endpoint: List all available tools for AI agents"""
-    tools = db.query(Tool).filter(
+    tools = db.query(Tool).options(joinedload(Tool.health)).filter(
         Tool.approved == True,
         Tool.active == True
     ).all()
@@ -62,7 +48,8 @@ async def mcp_list_tools(db: Session = Depends(get_db)):
                 "required": ["user_email"]
             },
             "tool_id": tool.id,
-            "price_mnee": tool.price_mnee
+            "price_mnee": tool.price_mnee,
+            "health": ToolHealthResponse.model_validate(tool.health).model_dump(mode="json") if tool.health else {"status": "unknown"}
         })
     
     return {
@@ -74,22 +61,24 @@ async def mcp_list_tools(db: Session = Depends(get_db)):
         }
     }
 
-@router.post("/execute/{tool_id}")
-async def mcp_execute_tool(
-    tool_id: int,
-    user_email: str = Header(..., alias="X-User-Email"),
-    parameters: Optional[Dict[str, Any]] = None,
-    db: Session = Depends(get_db)
-):
-    """MCP endpoint: Execute a tool and handle payment automatically"""
-    
-    # Get user
+def get_mcp_user(db: Session, user_email: str) -> User:
+    """Resolve the X-User-Email caller or raise 404"""
     user = db.query(User).filter(User.email == user_email).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
+    return user
+
+async def run_mcp_execution(
+    tool_id: int,
+    user: User,
+    parameters: Optional[Dict[str, Any]],
+    db: Session,
+    attempt: IdempotentAttempt
+) -> Dict[str, Any]:
+    """Pay for and execute a tool on behalf of an MCP caller"""
     
     # Get tool
     tool = db.query(Tool).filter(
@@ -119,58 +108,40 @@ async def mcp_execute_tool(
             detail="Tool metadata verification failed"
         )
     
+    # Reject a call that can never be made before charging for it
+    method = tool.api_method.upper()
+    if method not in ("GET", "POST"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported HTTP method: {tool.api_method}"
+        )
+    
     # Get tool owner
     tool_owner = db.query(User).filter(User.id == tool.owner_id).first()
     
     # Process payment
     try:
-        private_key = decrypt_private_key(user.encrypted_private_key)
-        w3 = get_web3_instance()
-        account = Account.from_key(private_key)
-        
-        mnee_contract = w3.eth.contract(
-            address=Web3.to_checksum_address(settings.mnee_contract_address),
-            abi=MNEE_ABI
-        )
-        
-        amount_wei = w3.to_wei(tool.price_mnee, 'ether')
-        
-        # Check balance
-        balance = mnee_contract.functions.balanceOf(user.public_key).call()
-        if balance < amount_wei:
+        try:
+            db_transaction = await charge_tool_call(db, user, tool, tool_owner)
+        except InsufficientBalance:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Insufficient MNEE balance"
             )
+        # From here on a failure is replayed for retries instead of paying again
+        attempt.commit()
+        tx_hash_hex = db_transaction.tx_hash
         
-        # Build and sign transaction
-        nonce = w3.eth.get_transaction_count(user.public_key)
-        transaction = mnee_contract.functions.transfer(
-            Web3.to_checksum_address(tool_owner.public_key),
-            amount_wei
-        ).build_transaction({
-            'from': user.public_key,
-            'nonce': nonce,
-            'gas': 100000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
-        signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        tx_hash_hex = tx_hash.hex()
-        
-        # Record transaction
-        db_transaction = Transaction(
-            from_user_id=user.id,
-            to_user_id=tool_owner.id,
-            tool_id=tool.id,
-            amount_mnee=tool.price_mnee,
-            tx_hash=tx_hash_hex,
-            status="pending"
+    except HTTPException:
+        raise
+    except PaymentPending:
+        attempt.commit()
+        raise
+    except PaymentQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Payment queue is full, try again later"
         )
-        db.add(db_transaction)
-        db.commit()
-        
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -181,37 +152,139 @@ async def mcp_execute_tool(
     try:
         headers = json.loads(tool.api_headers) if tool.api_headers else {}
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            if tool.api_method.upper() == "GET":
-                response = await client.get(tool.api_url, headers=headers, params=parameters or {})
-            elif tool.api_method.upper() == "POST":
-                # Merge parameters into body template if exists
-                body = json.loads(tool.api_body_template) if tool.api_body_template else {}
-                if parameters:
-                    body.update(parameters)
-                response = await client.post(tool.api_url, headers=headers, json=body)
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Unsupported HTTP method: {tool.api_method}"
-                )
-            
-            response.raise_for_status()
-            
-            return {
-                "success": True,
-                "tool_name": tool.name,
-                "price_paid": tool.price_mnee,
-                "tx_hash": tx_hash_hex,
-                "result": response.json() if response.headers.get('content-type', '').startswith('application/json') else response.text
-            }
-            
+        client = get_http_client()
+        if method == "GET":
+            response = await client.get(tool.api_url, headers=headers, params=parameters or {}, timeout=30.0)
+        else:
+            # Merge parameters into body template if exists
+            body = json.loads(tool.api_body_template) if tool.api_body_template else {}
+            if parameters:
+                body.update(parameters)
+            response = await client.post(tool.api_url, headers=headers, json=body, timeout=30.0)
+        
+        response.raise_for_status()
+        
+        return {
+            "success": True,
+            "tool_name": tool.name,
+            "price_paid": tool.price_mnee,
+            "tx_hash": tx_hash_hex,
+            "result": response.json() if response.headers.get('content-type', '').startswith('application/json') else response.text
+        }
+        
     except httpx.HTTPError as e:
+        # Credit charges are refunded, as on the agent path, and a retry may run
+        # again; a payment that stays made is replayed instead
+        if refund_credit_charge(db, db_transaction):
+            attempt.release()
         raise HTTPException(
             status_code=status.HTTP_502_BAD_GATEWAY,
             detail=f"Tool API call failed: {str(e)}"
         )
 
+@router.post("/execute/{tool_id}")
+async def mcp_execute_tool(
+    tool_id: int,
+    user_email: str = Header(..., alias="X-User-Email"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    parameters: Optional[Dict[str, Any]] = None,
+    async_mode: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    MCP endpoint: Execute a tool and handle payment automatically
+    
+    With async_mode=true the execution runs on the job worker pool and a job id
+    is returned immediately (202); poll /mcp/jobs/{job_id} or subscribe to
+    /mcp/jobs/{job_id}/events for the result.
+    
+    Retries with the same Idempotency-Key replay the first response (or job)
+    instead of paying and calling the tool again.
+    """
+    user = get_mcp_user(db, user_email)
+    
+    async def execute(attempt: IdempotentAttempt):
+        if async_mode:
+            try:
+                job = job_runner.submit(db, user.id, "mcp_execute", {
+                    "user_id": user.id,
+                    "tool_id": tool_id,
+                    "parameters": parameters
+                })
+            except JobQueueFull:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Job queue is full, try again later"
+                )
+            attempt.commit()
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job_to_dict(job))
+        
+        try:
+            return await run_mcp_execution(tool_id, user, parameters, db, attempt)
+        except PaymentPending as e:
+            # The payment is still being sent, so the tool was not called
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=payment_pending(e))
+    
+    return await run_idempotent(
+        user.id,
+        idempotency_key,
+        "mcp_execute",
+        {"tool_id": tool_id, "parameters": parameters, "async_mode": async_mode},
+        execute
+    )
+
+async def mcp_execute_job(payload: Dict[str, Any], db: Session) -> Dict[str, Any]:
+    """Job handler for async_mode executions"""
+    user = db.query(User).filter(User.id == payload["user_id"]).first()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    try:
+        return await run_mcp_execution(payload["tool_id"], user, payload["parameters"], db, IdempotentAttempt())
+    except PaymentPending as e:
+        return payment_pending(e)
+
+def payment_pending(e: PaymentPending) -> Dict[str, Any]:
+    return {"status": "payment_pending", "payment_intent": intent_to_dict(e.intent)}
+
+# Payment is broadcast before the tool call, so an interrupted job must not be re-run
+job_runner.register("mcp_execute", mcp_execute_job, retry_on_restart=False)
+
+@router.get("/jobs/{job_id}")
+async def mcp_get_job(
+    job_id: str,
+    user_email: str = Header(..., alias="X-User-Email"),
+    db: Session = Depends(get_db)
+):
+    """MCP endpoint: Poll the state of an async execution"""
+    user = get_mcp_user(db, user_email)
+    return job_to_dict(get_user_job(db, job_id, user.id))
+
+@router.get("/jobs/{job_id}/events")
+async def mcp_stream_job_events(
+    job_id: str,
+    user_email: str = Header(..., alias="X-User-Email"),
+    db: Session = Depends(get_db)
+):
+    """MCP endpoint: Subscribe to an async execution via server-sent events"""
+    user = get_mcp_user(db, user_email)
+    get_user_job(db, job_id, user.id)
+    return StreamingResponse(
+        job_event_stream(job_id, user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@router.delete("/jobs/{job_id}")
+async def mcp_cancel_job(
+    job_id: str,
+    user_email: str = Header(..., alias="X-User-Email"),
+    db: Session = Depends(get_db)
+):
+    """MCP endpoint: Cancel a queued or running async execution"""
+    user = get_mcp_user(db, user_email)
+    job = get_user_job(db, job_id, user.id)
+    return job_to_dict(job_runner.cancel(db, job))
+
 @router.get("/info")
 async def mcp_server_info():
     """MCP endpoint: Server information"""
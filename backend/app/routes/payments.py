@@ -1,48 +1,65 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, case, and_
+from typing import List, Optional, Tuple
+from datetime import datetime, timedelta
 from app.database import get_db
-from app.models import User, Tool, Transaction
-from app.schemas import TransactionResponse, EarningsResponse, SpendingResponse
+from app.models import User, Tool, Transaction, Settlement, CreditDeposit, CreditWithdrawal, ToolUsageRollup, PaymentIntent
+from app.schemas import (
+    TransactionResponse, EarningsResponse, SpendingResponse, BulkBalanceRequest, BulkBalanceResponse,
+    SettlementResponse, SettlementDetailResponse, CreditDepositRequest, CreditWithdrawalRequest,
+    CreditDepositResponse, CreditWithdrawalResponse, CreditAccountResponse, UsageSeriesResponse
+)
 from app.security import get_current_user
-from app.crypto import decrypt_private_key, get_web3_instance
+from app.chain import InsufficientBalance
+from app.payment_service import charge_tool_call
+from app.payment_engine import PaymentQueueFull, PaymentPending, payment_engine, intent_to_dict
+from app.idempotency import IdempotentAttempt, run_idempotent
+from app.credit import (
+    InsufficientCredit, EscrowNotConfigured, escrow_address, credit_balance, start_deposit, withdraw_credit
+)
+from app.balance_ledger import get_balance, STARTING_BALANCE_MNEE
+from app.balance_reader import get_mnee_balances
+from app.usage_rollups import GRANULARITIES, bucket_start
+from app.exports import EXPORT_FORMATS, stream_export, transaction_export, export_filename
 from app.config import get_settings
-from web3 import Web3
-from eth_account import Account
-import json
 
 router = APIRouter()
 settings = get_settings()
 
-# MNEE ERC-20 ABI (standard transfer function)
-MNEE_ABI = json.loads('''[
-    {
-        "constant": false,
-        "inputs": [
-            {"name": "_to", "type": "address"},
-            {"name": "_value", "type": "uint256"}
-        ],
-        "name": "transfer",
-        "outputs": [{"name": "", "type": "bool"}],
-        "type": "function"
-    },
-    {
-        "constant": true,
-        "inputs": [{"name": "_owner", "type": "address"}],
-        "name": "balanceOf",
-        "outputs": [{"name": "balance", "type": "uint256"}],
-        "type": "function"
-    }
-]''')
-
 @router.post("/pay/{tool_id}", response_model=TransactionResponse)
 async def pay_for_tool(
     tool_id: int,
+    async_mode: bool = False,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Execute payment for using a tool"""
+    """
+    Execute payment for using a tool
+    
+    With async_mode=true (onchain payment mode) the transfer is queued and a
+    payment intent is returned immediately (202); poll /payments/intents/{intent_id}
+    for its tx_hash and transaction. Retries with the same Idempotency-Key
+    replay the first response.
+    """
+    return await run_idempotent(
+        current_user.id,
+        idempotency_key,
+        "pay",
+        {"tool_id": tool_id, "async_mode": async_mode},
+        lambda attempt: run_payment(tool_id, db, current_user, attempt, async_mode)
+    )
+
+async def run_payment(
+    tool_id: int,
+    db: Session,
+    current_user: User,
+    attempt: IdempotentAttempt,
+    async_mode: bool = False
+):
+    """Charge the current user for one use of a tool"""
     
     # Get tool
     tool = db.query(Tool).filter(
@@ -68,103 +85,74 @@ async def pay_for_tool(
     tool_owner = db.query(User).filter(User.id == tool.owner_id).first()
     
     try:
-        # Decrypt sender's private key
-        private_key = decrypt_private_key(current_user.encrypted_private_key)
-        
-        # Setup Web3
-        w3 = get_web3_instance()
-        account = Account.from_key(private_key)
-        
-        # Get MNEE contract
-        mnee_contract = w3.eth.contract(
-            address=Web3.to_checksum_address(settings.mnee_contract_address),
-            abi=MNEE_ABI
-        )
+        if async_mode and settings.payment_mode == "onchain":
+            intent = payment_engine.submit(db, current_user, tool, tool_owner)
+            attempt.commit()
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=intent_to_dict(intent))
         
-        # Convert MNEE amount to wei (MNEE has 18 decimals like ETH)
-        amount_wei = w3.to_wei(tool.price_mnee, 'ether')
-        
-        # Check balance
-        balance = mnee_contract.functions.balanceOf(current_user.public_key).call()
-        if balance < amount_wei:
+        # Charge per the payment mode: an on-chain transfer (pending until the
+        # confirmation tracker finalizes it) or an instant off-chain accrual
+        try:
+            db_transaction = await charge_tool_call(db, current_user, tool, tool_owner)
+        except InsufficientBalance as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Insufficient MNEE balance. Required: {tool.price_mnee}, Available: {w3.from_wei(balance, 'ether')}"
+                detail=f"Insufficient MNEE balance. Required: {tool.price_mnee}, Available: {e.available_mnee}"
             )
-        
-        # Build transaction
-        nonce = w3.eth.get_transaction_count(current_user.public_key)
-        
-        transaction = mnee_contract.functions.transfer(
-            Web3.to_checksum_address(tool_owner.public_key),
-            amount_wei
-        ).build_transaction({
-            'from': current_user.public_key,
-            'nonce': nonce,
-            'gas': 100000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
-        # Sign transaction
-        signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
-        
-        # Send transaction
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        tx_hash_hex = tx_hash.hex()
-        
-        # Create transaction record
-        db_transaction = Transaction(
-            from_user_id=current_user.id,
-            to_user_id=tool_owner.id,
-            tool_id=tool.id,
-            amount_mnee=tool.price_mnee,
-            tx_hash=tx_hash_hex,
-            status="pending"
-        )
-        
-        db.add(db_transaction)
-        db.commit()
-        db.refresh(db_transaction)
-        
-        # Note: In production, you'd want to wait for confirmation or have a background job
-        # to update transaction status when confirmed on-chain
+        attempt.commit()
         
         return TransactionResponse.from_orm(db_transaction)
         
+    except HTTPException:
+        raise
+    except PaymentPending as e:
+        # Still being sent after the wait: hand back the intent to track, as async_mode does
+        attempt.commit()
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=intent_to_dict(e.intent))
+    except PaymentQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Payment queue is full, try again later"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Payment failed: {str(e)}"
         )
 
+@router.get("/intents/{intent_id}")
+async def get_payment_intent(
+    intent_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Status of a queued payment (queued, sending, sent or failed)"""
+    intent = db.query(PaymentIntent).filter(
+        PaymentIntent.id == intent_id,
+        PaymentIntent.payer_id == current_user.id
+    ).first()
+    if not intent:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Payment intent not found"
+        )
+    return intent_to_dict(intent)
+
 @router.get("/balance")
 async def get_mnee_balance(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get user's MNEE balance"""
-    blockchain_error = None
-    
     # For demo/hackathon: Always use simulated balance
     # In production, you would check blockchain first
     
-    # Calculate balance from transactions for demo purposes
-    # Total earned (received payments from OTHER users)
-    total_earned = db.query(func.sum(Transaction.amount_mnee)).filter(
-        Transaction.to_user_id == current_user.id,
-        Transaction.from_user_id != current_user.id,  # Exclude self-transactions
-        Transaction.status.in_(["confirmed", "completed", "pending"])
-    ).scalar() or 0.0
-    
-    # Total spent (sent payments to OTHER users)
-    total_spent = db.query(func.sum(Transaction.amount_mnee)).filter(
-        Transaction.from_user_id == current_user.id,
-        Transaction.to_user_id != current_user.id,  # Exclude self-transactions
-        Transaction.status.in_(["confirmed", "completed", "pending"])
-    ).scalar() or 0.0
+    # Earned/spent totals (excluding self-transactions) are maintained in the
+    # balance ledger as payments are recorded, so this is a single row lookup
+    balance = get_balance(db, current_user.id)
     
     # Mock balance = earned - spent + initial balance (1000 MNEE for demo)
-    mock_balance = 1000.0 + total_earned - total_spent
+    mock_balance = STARTING_BALANCE_MNEE + balance.earned_mnee - balance.spent_mnee
     
     return {
         "address": current_user.public_key,
@@ -174,85 +162,327 @@ async def get_mnee_balance(
         "note": "Using simulated balance for hackathon demo. Starting balance: 1000 MNEE"
     }
 
+@router.post("/balances/bulk", response_model=BulkBalanceResponse)
+async def get_bulk_mnee_balances(
+    request: BulkBalanceRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """On-chain MNEE balances for many addresses, read in batches at one block"""
+    if len(request.addresses) > settings.bulk_balance_max_addresses:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.bulk_balance_max_addresses} addresses per request"
+        )
+    
+    try:
+        snapshot = await get_mnee_balances(request.addresses)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid address: {str(e)}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Balance read failed: {str(e)}"
+        )
+    
+    return BulkBalanceResponse(
+        block_number=snapshot.block_number,
+        source=snapshot.source,
+        balances={address: float(balance) for address, balance in snapshot.balances.items()}
+    )
+
+# Columns of TransactionResponse, read in one query with the tool name joined in
+TRANSACTION_COLUMNS = (
+    Transaction.id,
+    Transaction.from_user_id,
+    Transaction.to_user_id,
+    Transaction.tool_id,
+    Transaction.amount_mnee,
+    Transaction.tx_hash,
+    Transaction.status,
+    Transaction.block_number,
+    Transaction.gas_used,
+    Transaction.confirmed_at,
+    Transaction.created_at,
+    Tool.name.label("tool_name")
+)
+
+def transaction_page(db: Session, condition, cursor: Optional[int], limit: int) -> Tuple[List[dict], Optional[int]]:
+    """
+    One page of transactions, newest first, using the id as a keyset cursor
+    
+    Returns:
+        Tuple of (rows as TransactionResponse dicts, cursor of the next page or None)
+    """
+    query = db.query(*TRANSACTION_COLUMNS).outerjoin(Tool, Transaction.tool_id == Tool.id).filter(condition)
+    if cursor is not None:
+        query = query.filter(Transaction.id < cursor)
+    rows = query.order_by(Transaction.id.desc()).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return [row._asdict() for row in rows[:limit]], next_cursor
+
+def transaction_totals(db: Session, condition) -> Tuple[int, float]:
+    """(matching transactions, confirmed amount) in one aggregate statement"""
+    count, total = db.query(
+        func.count(Transaction.id),
+        func.sum(case((Transaction.status == "confirmed", Transaction.amount_mnee), else_=0.0))
+    ).filter(condition).one()
+    return count, total or 0.0
+
 @router.get("/earnings", response_model=EarningsResponse)
 async def get_earnings(
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=500),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get user's earnings from their tools (excluding self-transactions)"""
-    transactions = db.query(Transaction).filter(
+    condition = and_(
         Transaction.to_user_id == current_user.id,
         Transaction.from_user_id != current_user.id  # Exclude self-transactions
-    ).order_by(Transaction.created_at.desc()).all()
+    )
+    transactions, next_cursor = transaction_page(db, condition, cursor, limit)
+    transaction_count, total_earned = transaction_totals(db, condition)
     
-    total_earned = db.query(func.sum(Transaction.amount_mnee)).filter(
-        Transaction.to_user_id == current_user.id,
-        Transaction.from_user_id != current_user.id,  # Exclude self-transactions
-        Transaction.status == "confirmed"
-    ).scalar() or 0.0
+    return {
+        "total_earned": total_earned,
+        "transaction_count": transaction_count,
+        "transactions": transactions,
+        "next_cursor": next_cursor
+    }
+
+@router.get("/earnings/series", response_model=UsageSeriesResponse)
+async def get_earnings_series(
+    granularity: str = Query("day", description="hour or day"),
+    start: Optional[datetime] = Query(None, description="UTC; defaults to 30 days (hourly: 2 days) before end"),
+    end: Optional[datetime] = Query(None, description="UTC, exclusive; defaults to now"),
+    tool_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Calls, revenue, unique payers and failures per owned tool and time bucket, from the usage rollups"""
+    if granularity not in GRANULARITIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"granularity must be one of: {', '.join(GRANULARITIES)}"
+        )
+    end = end or datetime.utcnow()
+    start = bucket_start(start or end - timedelta(days=2 if granularity == "hour" else 30), granularity)
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end"
+        )
+    if granularity == "hour" and end - start > timedelta(days=settings.rollup_max_hourly_range_days):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Hourly series cover at most {settings.rollup_max_hourly_range_days} days"
+        )
     
-    # Add tool names to transactions
-    tx_responses = []
-    for tx in transactions:
-        tx_dict = TransactionResponse.from_orm(tx).model_dump()
-        if tx.tool:
-            tx_dict['tool_name'] = tx.tool.name
-        tx_responses.append(TransactionResponse(**tx_dict))
+    query = db.query(
+        ToolUsageRollup.bucket_start,
+        ToolUsageRollup.tool_id,
+        ToolUsageRollup.calls,
+        ToolUsageRollup.gross_mnee,
+        ToolUsageRollup.unique_payers,
+        ToolUsageRollup.failures
+    ).filter(
+        ToolUsageRollup.owner_id == current_user.id,
+        ToolUsageRollup.granularity == granularity,
+        ToolUsageRollup.bucket_start >= start,
+        ToolUsageRollup.bucket_start < end
+    )
+    if tool_id is not None:
+        query = query.filter(ToolUsageRollup.tool_id == tool_id)
     
     return {
-        "total_earned": total_earned,
-        "transaction_count": len(transactions),
-        "transactions": tx_responses
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "points": [row._asdict() for row in query.order_by(ToolUsageRollup.bucket_start, ToolUsageRollup.tool_id)]
     }
 
 @router.get("/spending", response_model=SpendingResponse)
 async def get_spending(
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=500),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get user's spending on tools (excluding self-transactions)"""
-    transactions = db.query(Transaction).filter(
+    condition = and_(
         Transaction.from_user_id == current_user.id,
         Transaction.to_user_id != current_user.id  # Exclude self-transactions
-    ).order_by(Transaction.created_at.desc()).all()
-    
-    total_spent = db.query(func.sum(Transaction.amount_mnee)).filter(
-        Transaction.from_user_id == current_user.id,
-        Transaction.to_user_id != current_user.id,  # Exclude self-transactions
-        Transaction.status == "confirmed"
-    ).scalar() or 0.0
-    
-    # Add tool names to transactions
-    tx_responses = []
-    for tx in transactions:
-        tx_dict = TransactionResponse.from_orm(tx).model_dump()
-        if tx.tool:
-            tx_dict['tool_name'] = tx.tool.name
-        tx_responses.append(TransactionResponse(**tx_dict))
+    )
+    transactions, next_cursor = transaction_page(db, condition, cursor, limit)
+    transaction_count, total_spent = transaction_totals(db, condition)
     
     return {
         "total_spent": total_spent,
-        "transaction_count": len(transactions),
-        "transactions": tx_responses
+        "transaction_count": transaction_count,
+        "transactions": transactions,
+        "next_cursor": next_cursor
     }
 
 @router.get("/transactions", response_model=List[TransactionResponse])
 async def get_all_transactions(
+    response: Response,
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get all transactions (sent and received); the next page's cursor is in X-Next-Cursor"""
+    transactions, next_cursor = transaction_page(
+        db,
+        (Transaction.from_user_id == current_user.id) | (Transaction.to_user_id == current_user.id),
+        cursor,
+        limit
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    
+    return transactions
+
+@router.get("/transactions/export")
+async def export_transactions(
+    format: str = Query("csv", description="csv or ndjson"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[int] = Query(None, description="Last id received, to resume an interrupted export"),
+    current_user: User = Depends(get_current_user)
+):
+    """Stream every transaction the user sent or received as CSV or NDJSON, oldest first"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}"
+        )
+    
+    return StreamingResponse(
+        stream_export(transaction_export(current_user.id, start, end), Transaction.id, format, cursor),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename("transactions", format)}"'}
+    )
+
+@router.get("/settlements", response_model=List[SettlementResponse])
+async def list_settlements(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """On-chain settlements of the user's off-chain payments (as payer or payee)"""
+    settlements = db.query(Settlement).filter(
+        (Settlement.payer_id == current_user.id) | (Settlement.payee_id == current_user.id)
+    ).order_by(Settlement.created_at.desc()).limit(100).all()
+    return [SettlementResponse.from_orm(settlement) for settlement in settlements]
+
+@router.get("/settlements/{settlement_id}", response_model=SettlementDetailResponse)
+async def get_settlement(
+    settlement_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """A settlement with every off-chain payment it settled"""
+    settlement = db.query(Settlement).filter(Settlement.id == settlement_id).first()
+    
+    if not settlement or current_user.id not in (settlement.payer_id, settlement.payee_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Settlement not found"
+        )
+    
+    return SettlementDetailResponse(
+        **SettlementResponse.from_orm(settlement).model_dump(),
+        transactions=[TransactionResponse.from_orm(tx) for tx in settlement.transactions]
+    )
+
+def require_escrow() -> str:
+    try:
+        return escrow_address()
+    except EscrowNotConfigured as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+
+@router.get("/credits", response_model=CreditAccountResponse)
+async def get_credits(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all transactions (sent and received)"""
-    transactions = db.query(Transaction).filter(
-        (Transaction.from_user_id == current_user.id) | 
-        (Transaction.to_user_id == current_user.id)
-    ).order_by(Transaction.created_at.desc()).all()
+    """Prepaid credit balance with recent deposits and withdrawals"""
+    address = require_escrow()
+    deposits = db.query(CreditDeposit).filter(
+        CreditDeposit.user_id == current_user.id
+    ).order_by(CreditDeposit.created_at.desc()).limit(50).all()
+    withdrawals = db.query(CreditWithdrawal).filter(
+        CreditWithdrawal.user_id == current_user.id
+    ).order_by(CreditWithdrawal.created_at.desc()).limit(50).all()
+    
+    return CreditAccountResponse(
+        balance_mnee=credit_balance(db, current_user.id),
+        escrow_address=address,
+        deposits=[CreditDepositResponse.from_orm(deposit) for deposit in deposits],
+        withdrawals=[CreditWithdrawalResponse.from_orm(withdrawal) for withdrawal in withdrawals]
+    )
+
+@router.post("/credits/deposit", response_model=CreditDepositResponse)
+async def deposit_credits(
+    request: CreditDepositRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Move MNEE from the user's wallet into escrow; credited once the transfer is final"""
+    require_escrow()
+    if request.amount_mnee <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Deposit amount must be positive"
+        )
     
-    # Add tool names to transactions
-    tx_responses = []
-    for tx in transactions:
-        tx_dict = TransactionResponse.from_orm(tx).model_dump()
-        if tx.tool:
-            tx_dict['tool_name'] = tx.tool.name
-        tx_responses.append(TransactionResponse(**tx_dict))
+    try:
+        deposit = await start_deposit(db, current_user, request.amount_mnee)
+    except InsufficientBalance as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Insufficient MNEE balance. Required: {request.amount_mnee}, Available: {e.available_mnee}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Deposit failed: {str(e)}"
+        )
+    
+    return CreditDepositResponse.from_orm(deposit)
+
+@router.post("/credits/withdraw", response_model=CreditWithdrawalResponse)
+async def withdraw_credits(
+    request: CreditWithdrawalRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Pay prepaid credit back out of escrow (the whole balance unless an amount is given)"""
+    address = require_escrow()
+    to_address = request.to_address or current_user.public_key
+    if to_address.lower() == address.lower():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot withdraw to the escrow address"
+        )
+    
+    try:
+        withdrawal = await withdraw_credit(db, current_user, request.amount_mnee, to_address)
+    except InsufficientCredit as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Insufficient credit. Available: {e.available_mnee}"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid address: {str(e)}"
+        )
     
-    return tx_responses
+    return CreditWithdrawalResponse.from_orm(withdrawal)
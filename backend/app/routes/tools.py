@@ -1,13 +1,51 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional
 from app.database import get_db
 from app.models import User, Tool
 from app.schemas import ToolCreate, ToolUpdate, ToolResponse
 from app.security import get_current_user
 from app.crypto import calculate_metadata_hash
+from app.tool_router import validate_routing_rules
+from app.result_projection import compile_projection, ProjectionError
+from app.prewarm import on_tool_origin
+from app.config import get_settings
 
 router = APIRouter()
+settings = get_settings()
+
+def validate_result_projection(result_projection: Optional[str]):
+    """Reject projections that do not compile"""
+    if not result_projection:
+        return
+    try:
+        compile_projection(result_projection)
+    except ProjectionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+def validate_health_settings(health_interval_seconds: Optional[int], keep_warm_minutes: Optional[int]):
+    """Keep owner-chosen probe settings within limits"""
+    if health_interval_seconds is not None and health_interval_seconds < settings.health_min_interval_seconds:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"health_interval_seconds must be at least {settings.health_min_interval_seconds}"
+        )
+    if keep_warm_minutes is not None and keep_warm_minutes < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="keep_warm_minutes cannot be negative"
+        )
+
+def validate_tool_url(name: str, url: Optional[str], api_url: str):
+    """Owner-supplied URLs the server fetches must stay on the api_url origin the admin approved"""
+    if not on_tool_origin(url, api_url):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{name} must be on the same origin as api_url"
+        )
 
 @router.post("/", response_model=ToolResponse, status_code=status.HTTP_201_CREATED)
 async def create_tool(
@@ -17,6 +55,17 @@ async def create_tool(
 ):
     """Create a new tool (pending admin approval)"""
     
+    routing_error = validate_routing_rules(tool_data.trigger_phrases, tool_data.parameter_extractors)
+    if routing_error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=routing_error
+        )
+    validate_result_projection(tool_data.result_projection)
+    validate_health_settings(tool_data.health_interval_seconds, tool_data.keep_warm_minutes)
+    validate_tool_url("warmup_url", tool_data.warmup_url, tool_data.api_url)
+    validate_tool_url("health_url", tool_data.health_url, tool_data.api_url)
+    
     # Calculate metadata hash
     metadata_hash = calculate_metadata_hash(
         tool_data.api_url,
@@ -35,6 +84,13 @@ async def create_tool(
         api_body_template=tool_data.api_body_template,
         metadata_hash=metadata_hash,
         price_mnee=tool_data.price_mnee,
+        trigger_phrases=tool_data.trigger_phrases,
+        parameter_extractors=tool_data.parameter_extractors,
+        result_projection=tool_data.result_projection,
+        warmup_url=tool_data.warmup_url,
+        health_url=tool_data.health_url,
+        health_interval_seconds=tool_data.health_interval_seconds,
+        keep_warm_minutes=tool_data.keep_warm_minutes,
         owner_id=current_user.id,
         approved=False  # Requires admin approval
     )
@@ -51,7 +107,7 @@ async def list_tools(
     db: Session = Depends(get_db)
 ):
     """List all tools (approved by default)"""
-    query = db.query(Tool).filter(Tool.active == True)
+    query = db.query(Tool).options(joinedload(Tool.health)).filter(Tool.active == True)
     
     if approved_only:
         query = query.filter(Tool.approved == True)
@@ -65,7 +121,7 @@ async def list_my_tools(
     current_user: User = Depends(get_current_user)
 ):
     """List tools owned by current user"""
-    tools = db.query(Tool).filter(Tool.owner_id == current_user.id).all()
+    tools = db.query(Tool).options(joinedload(Tool.health)).filter(Tool.owner_id == current_user.id).all()
     return [ToolResponse.from_orm(tool) for tool in tools]
 
 @router.get("/{tool_id}", response_model=ToolResponse)
@@ -103,6 +159,17 @@ async def update_tool(
             detail="Not authorized to update this tool"
         )
     
+    routing_error = validate_routing_rules(tool_data.trigger_phrases, tool_data.parameter_extractors)
+    if routing_error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=routing_error
+        )
+    validate_result_projection(tool_data.result_projection)
+    validate_health_settings(tool_data.health_interval_seconds, tool_data.keep_warm_minutes)
+    validate_tool_url("warmup_url", tool_data.warmup_url, tool.api_url)
+    validate_tool_url("health_url", tool_data.health_url, tool.api_url)
+    
     # Update fields
     if tool_data.name is not None:
         tool.name = tool_data.name
@@ -112,6 +179,24 @@ async def update_tool(
         tool.price_mnee = tool_data.price_mnee
     if tool_data.active is not None:
         tool.active = tool_data.active
+    # Routing rules decide which users' messages are sent (and charged) to the
+    # tool without the LLM, so changing them needs admin approval again
+    if tool_data.trigger_phrases is not None and tool_data.trigger_phrases != tool.trigger_phrases:
+        tool.trigger_phrases = tool_data.trigger_phrases
+        tool.approved = False
+    if tool_data.parameter_extractors is not None and tool_data.parameter_extractors != tool.parameter_extractors:
+        tool.parameter_extractors = tool_data.parameter_extractors
+        tool.approved = False
+    if tool_data.result_projection is not None:
+        tool.result_projection = tool_data.result_projection
+    if tool_data.warmup_url is not None:
+        tool.warmup_url = tool_data.warmup_url
+    if tool_data.health_url is not None:
+        tool.health_url = tool_data.health_url
+    if tool_data.health_interval_seconds is not None:
+        tool.health_interval_seconds = tool_data.health_interval_seconds
+    if tool_data.keep_warm_minutes is not None:
+        tool.keep_warm_minutes = tool_data.keep_warm_minutes
     
     db.commit()
     db.refresh(tool)
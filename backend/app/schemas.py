@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, computed_field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
 # User Schemas
 class UserCreate(BaseModel):
@@ -17,6 +17,7 @@ class UserResponse(BaseModel):
     public_key: str
     is_admin: bool
     created_at: datetime
+    onchain_balance_mnee: Optional[float] = None
     
     class Config:
         from_attributes = True
@@ -30,12 +31,44 @@ class ToolCreate(BaseModel):
     api_headers: Optional[str] = None
     api_body_template: Optional[str] = None
     price_mnee: float
+    trigger_phrases: Optional[str] = None  # JSON list of phrases
+    parameter_extractors: Optional[str] = None  # JSON object {param: pattern}
+    result_projection: Optional[str] = None  # JSON object {fields, max_items, max_string_length}
+    warmup_url: Optional[str] = None
+    health_url: Optional[str] = None
+    health_interval_seconds: Optional[int] = None
+    keep_warm_minutes: Optional[int] = None
 
 class ToolUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     price_mnee: Optional[float] = None
     active: Optional[bool] = None
+    trigger_phrases: Optional[str] = None
+    parameter_extractors: Optional[str] = None
+    result_projection: Optional[str] = None
+    warmup_url: Optional[str] = None
+    health_url: Optional[str] = None
+    health_interval_seconds: Optional[int] = None
+    keep_warm_minutes: Optional[int] = None
+
+class ToolHealthResponse(BaseModel):
+    status: str
+    checks_total: int = 0
+    checks_failed: int = 0
+    last_checked_at: Optional[datetime] = None
+    last_latency_ms: Optional[float] = None
+    cold_start_latency_ms: Optional[float] = None
+    
+    @computed_field
+    @property
+    def availability(self) -> Optional[float]:
+        if not self.checks_total:
+            return None
+        return round((self.checks_total - self.checks_failed) / self.checks_total, 4)
+    
+    class Config:
+        from_attributes = True
 
 class ToolResponse(BaseModel):
     id: int
@@ -47,11 +80,28 @@ class ToolResponse(BaseModel):
     owner_id: int
     approved: bool
     active: bool
+    trigger_phrases: Optional[str] = None
+    parameter_extractors: Optional[str] = None
+    result_projection: Optional[str] = None
+    warmup_url: Optional[str] = None
+    health_url: Optional[str] = None
+    health_interval_seconds: Optional[int] = None
+    keep_warm_minutes: Optional[int] = None
+    health: Optional[ToolHealthResponse] = None
     created_at: datetime
     
     class Config:
         from_attributes = True
 
+# Balance Schemas
+class BulkBalanceRequest(BaseModel):
+    addresses: List[str]
+
+class BulkBalanceResponse(BaseModel):
+    block_number: int
+    source: str  # multicall, rpc_batch or cache
+    balances: Dict[str, float]  # Checksummed address -> MNEE
+
 # Transaction Schemas
 class TransactionResponse(BaseModel):
     id: int
@@ -61,22 +111,101 @@ class TransactionResponse(BaseModel):
     amount_mnee: float
     tx_hash: str
     status: str
+    block_number: Optional[int] = None
+    gas_used: Optional[int] = None
+    confirmed_at: Optional[datetime] = None
     created_at: datetime
     tool_name: str | None = None
     
     class Config:
         from_attributes = True
 
+# Settlement Schemas
+class SettlementResponse(BaseModel):
+    id: int
+    payer_id: int
+    payee_id: int
+    amount_mnee: float
+    transaction_count: int
+    tx_hash: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+    created_at: datetime
+    submitted_at: Optional[datetime] = None
+    confirmed_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class SettlementDetailResponse(SettlementResponse):
+    transactions: List[TransactionResponse]
+
+# Credit Schemas
+class CreditDepositRequest(BaseModel):
+    amount_mnee: float
+
+class CreditWithdrawalRequest(BaseModel):
+    amount_mnee: Optional[float] = None  # Whole balance if omitted
+    to_address: Optional[str] = None  # User's platform wallet if omitted
+
+class CreditDepositResponse(BaseModel):
+    id: int
+    tx_hash: str
+    amount_mnee: float
+    block_number: Optional[int] = None
+    status: str
+    created_at: datetime
+    confirmed_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class CreditWithdrawalResponse(BaseModel):
+    id: int
+    to_address: str
+    amount_mnee: float
+    tx_hash: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+    created_at: datetime
+    submitted_at: Optional[datetime] = None
+    confirmed_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class CreditAccountResponse(BaseModel):
+    balance_mnee: float
+    escrow_address: str
+    deposits: List[CreditDepositResponse]
+    withdrawals: List[CreditWithdrawalResponse]
+
 # Dashboard Schemas
 class EarningsResponse(BaseModel):
     total_earned: float
     transaction_count: int
     transactions: list[TransactionResponse]
+    next_cursor: Optional[int] = None  # Pass as cursor for the next (older) page
 
 class SpendingResponse(BaseModel):
     total_spent: float
     transaction_count: int
     transactions: list[TransactionResponse]
+    next_cursor: Optional[int] = None
+
+class UsagePoint(BaseModel):
+    bucket_start: datetime
+    tool_id: int
+    calls: int
+    gross_mnee: float
+    unique_payers: int
+    failures: int
+
+class UsageSeriesResponse(BaseModel):
+    granularity: str
+    start: datetime
+    end: datetime
+    points: List[UsagePoint]
 
 # Token Response
 class Token(BaseModel):
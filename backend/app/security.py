@@ -44,29 +44,32 @@ def decode_access_token(token: str) -> dict:
             detail="Could not validate credentials",
         )
 
+def get_user_from_token(token: str, db: Session) -> User:
+    """Resolve the user a JWT was issued for, raising 401 if it is invalid"""
+    payload = decode_access_token(token)
+    email: str = payload.get("sub")
+    
+    if email is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials - no email in token",
+        )
+    
+    user = db.query(User).filter(User.email == email).first()
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+        )
+    return user
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> User:
     try:
         print(f"Auth header received: {credentials.scheme} {credentials.credentials[:20]}...")
-        token = credentials.credentials
-        payload = decode_access_token(token)
-        email: str = payload.get("sub")
-        
-        if email is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials - no email in token",
-            )
-        
-        user = db.query(User).filter(User.email == email).first()
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found",
-            )
-        
+        user = get_user_from_token(credentials.credentials, db)
         print(f"User authenticated successfully: {user.email}")
         return user
     except Exception as e:
@@ -0,0 +1,153 @@
+"""
+Off-Chain Payment Settlement
+Periodically nets accrued off-chain payments per user pair and submits one
+on-chain transfer per net position. Every netted Transaction row links to
+its Settlement, and the confirmation tracker finalizes both.
+"""
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import Settlement, Transaction, User
+from app.signer import signer
+
+settings = get_settings()
+
+# Net positions smaller than this are treated as fully netted out
+NET_EPSILON = 1e-9
+
+# Transaction ids per settle UPDATE
+SETTLE_CHUNK = 1000
+
+
+def release_settlement(db: Session, settlement: Settlement, error: str):
+    """Mark a settlement failed and return its payments to the accrued pool for the next round"""
+    settlement.status = "failed"
+    settlement.error = error
+    db.query(Transaction).filter(Transaction.settlement_id == settlement.id).update(
+        {"settlement_id": None, "status": "accrued"}, synchronize_session=False
+    )
+
+
+def finalize_settlement(db: Session, settlement: Settlement):
+    settlement.status = "confirmed"
+    settlement.confirmed_at = datetime.utcnow()
+    db.query(Transaction).filter(Transaction.settlement_id == settlement.id).update(
+        {"status": "settled"}, synchronize_session=False
+    )
+
+
+def net_accrued_payments(db: Session) -> List[Settlement]:
+    """
+    Group accrued payments by unordered user pair and create one settlement per pair
+
+    Returns:
+        Settlements created (pairs that netted to zero are settled immediately)
+    """
+    # Lock the accrued rows once and settle exactly the set that was summed; payments
+    # accrued after this read wait for the next round
+    rows = db.query(
+        Transaction.id, Transaction.from_user_id, Transaction.to_user_id, Transaction.amount_mnee
+    ).filter(
+        Transaction.status == "accrued"
+    ).order_by(Transaction.id).with_for_update().all()
+    if not rows:
+        return []
+
+    # (low user id, high user id) -> [amount owed low -> high, transaction ids]
+    pairs: Dict[Tuple[int, int], list] = defaultdict(lambda: [0.0, []])
+    for transaction_id, from_user_id, to_user_id, amount in rows:
+        low, high = sorted((from_user_id, to_user_id))
+        sign = 1 if from_user_id == low else -1
+        pairs[(low, high)][0] += sign * (amount or 0.0)
+        pairs[(low, high)][1].append(transaction_id)
+
+    created = []
+    for (low, high), (net, transaction_ids) in pairs.items():
+        netted = abs(net) < NET_EPSILON
+        if not netted and abs(net) < settings.settlement_min_mnee:
+            continue  # Let small positions keep accruing
+        payer, payee = (low, high) if net >= 0 else (high, low)
+        settlement = Settlement(
+            payer_id=payer,
+            payee_id=payee,
+            amount_mnee=0.0 if netted else abs(net),
+            transaction_count=len(transaction_ids),
+            status="netted" if netted else "pending"
+        )
+        db.add(settlement)
+        db.flush()
+        for chunk_start in range(0, len(transaction_ids), SETTLE_CHUNK):
+            db.query(Transaction).filter(
+                Transaction.id.in_(transaction_ids[chunk_start:chunk_start + SETTLE_CHUNK])
+            ).update(
+                {"settlement_id": settlement.id, "status": "settled" if netted else "settling"},
+                synchronize_session=False
+            )
+        created.append(settlement)
+    db.commit()
+    return created
+
+
+async def submit_settlement(db: Session, settlement: Settlement):
+    """Broadcast the net transfer for one pending settlement"""
+    payer = db.get(User, settlement.payer_id)
+    payee = db.get(User, settlement.payee_id)
+    try:
+        settlement.tx_hash = await signer.sign_transfer(payer, payee.public_key, settlement.amount_mnee)
+        settlement.status = "submitted"
+        settlement.submitted_at = datetime.utcnow()
+    except Exception as e:
+        print(f"Settlement {settlement.id} failed to submit: {e}")
+        release_settlement(db, settlement, str(e))
+    db.commit()
+
+
+class SettlementScheduler:
+    """Nets and submits settlements on a fixed interval"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        if settings.payment_mode == "ledger":
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.settlement_interval_seconds)
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Settlement round failed: {e}")
+
+    async def run_once(self) -> Dict[str, int]:
+        """Net accrued payments, then submit every pending settlement"""
+        async with self.lock:
+            db = SessionLocal()
+            try:
+                created = net_accrued_payments(db)
+                pending = db.query(Settlement).filter(Settlement.status == "pending").order_by(Settlement.id).all()
+                # One at a time keeps each round's RPC load bounded
+                for settlement in pending:
+                    await submit_settlement(db, settlement)
+                return {
+                    "created": len(created),
+                    "submitted": sum(1 for settlement in pending if settlement.status == "submitted")
+                }
+            finally:
+                db.close()
+
+
+settlement_scheduler = SettlementScheduler()
@@ -0,0 +1,101 @@
+"""
+Transfer Signer
+Signs MNEE transfers for users' platform wallets. Decrypted accounts are
+kept in a bounded in-memory store with a TTL, so repeat payers skip
+decryption and key derivation. Decryption and signing run on a small worker
+pool off the event loop.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from eth_account import Account
+from eth_account.signers.local import LocalAccount
+from app.config import get_settings
+from app.crypto import decrypt_private_key
+from app.chain import send_transfer
+from app.models import User
+
+settings = get_settings()
+
+
+class Signer:
+    def __init__(self, workers: int, cache_size: int, ttl_seconds: float):
+        self.cache_size = cache_size
+        self.ttl_seconds = ttl_seconds
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.workers = workers
+        # user_id -> (encrypted key the account came from, account, monotonic expiry)
+        self.accounts: "OrderedDict[int, Tuple[str, LocalAccount, float]]" = OrderedDict()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="signer")
+        return self.executor
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool(), fn, *args)
+
+    async def account_for(self, user: User) -> LocalAccount:
+        """The user's decrypted account, from the cache when fresh"""
+        now = time.monotonic()
+        cached = self.accounts.get(user.id)
+        # A changed encrypted key (re-encryption or a new wallet) invalidates the entry
+        if cached and cached[0] == user.encrypted_private_key and cached[2] > now:
+            self.accounts.move_to_end(user.id)
+            return cached[1]
+
+        def load() -> LocalAccount:
+            return Account.from_key(decrypt_private_key(user.encrypted_private_key))
+
+        account = await self._run(load)
+        self.accounts[user.id] = (user.encrypted_private_key, account, now + self.ttl_seconds)
+        self.accounts.move_to_end(user.id)
+        while len(self.accounts) > self.cache_size:
+            self.accounts.popitem(last=False)
+        return account
+
+    def forget(self, user_id: int):
+        self.accounts.pop(user_id, None)
+
+    async def sign_transfer(
+        self,
+        from_user: User,
+        to: str,
+        amount_mnee: float,
+        tier: Optional[str] = None,
+        on_signed: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> str:
+        """
+        Sign and broadcast an MNEE transfer from a user's platform wallet
+
+        Args:
+            from_user: Paying user (their encrypted key is used)
+            to: Recipient address
+            amount_mnee: Amount in MNEE
+            tier: Fee speed tier (settings.fee_default_tier if omitted)
+            on_signed: Called with the transaction hash before it is broadcast
+
+        Returns:
+            Transaction hash (hex)
+
+        Raises:
+            InsufficientBalance: If the wallet cannot cover the amount
+        """
+        account = await self.account_for(from_user)
+
+        async def sign(transaction: Dict[str, Any]) -> bytes:
+            return (await self._run(account.sign_transaction, transaction)).rawTransaction
+
+        return await send_transfer(account.address, sign, to, amount_mnee, tier, on_signed)
+
+    def close(self):
+        self.accounts.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+signer = Signer(settings.signer_workers, settings.signer_cache_size, settings.signer_cache_ttl_seconds)
@@ -0,0 +1,161 @@
+"""
+Tool Health Prober
+Background scheduler that probes every approved, active tool's host on its
+own interval, records availability and cold-start latency, and keeps hosts
+of recently used or popular tools from spinning down
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import httpx
+from sqlalchemy import func, case
+from app.config import get_settings
+from app.database import SessionLocal
+from app.http_client import get_http_client
+from app.models import Tool, ToolHealth, Transaction
+from app.prewarm import tool_origin, mark_warm, on_tool_origin
+
+settings = get_settings()
+
+# Free-tier hosts (e.g. Render) spin down after ~15 minutes without traffic,
+# so a successful probe after a longer gap measured a cold start
+COLD_AFTER_SECONDS = 15 * 60
+
+
+def probe_url(tool: Tool) -> str:
+    # An off-origin health_url (saved before origins were enforced) is never fetched
+    if tool.health_url and on_tool_origin(tool.health_url, tool.api_url):
+        return tool.health_url
+    return tool_origin(tool.api_url) + "/"
+
+
+def recent_usage(db, now: datetime, tools: List[Tool]) -> Dict[int, Tuple[int, Optional[datetime]]]:
+    """tool_id -> (calls in the popularity window, last call time) from recent transactions"""
+    popular_since = now - timedelta(minutes=settings.keep_warm_popular_window_minutes)
+    longest_window = max([tool.keep_warm_minutes or 0 for tool in tools] + [settings.keep_warm_popular_window_minutes])
+    rows = db.query(
+        Transaction.tool_id,
+        func.sum(case((Transaction.created_at >= popular_since, 1), else_=0)),
+        func.max(Transaction.created_at)
+    ).filter(
+        Transaction.created_at >= now - timedelta(minutes=longest_window)
+    ).group_by(Transaction.tool_id).all()
+    return {tool_id: (int(calls or 0), last_call) for tool_id, calls, last_call in rows}
+
+
+def keep_warm(tool: Tool, usage: Tuple[int, Optional[datetime]], now: datetime) -> bool:
+    calls, last_call = usage
+    if calls >= settings.keep_warm_popular_min_calls:
+        return True
+    return bool(tool.keep_warm_minutes and last_call and now - last_call <= timedelta(minutes=tool.keep_warm_minutes))
+
+
+def probe_interval(tool: Tool, warm: bool) -> int:
+    interval = tool.health_interval_seconds or settings.health_default_interval_seconds
+    if warm:
+        interval = min(interval, settings.keep_warm_interval_seconds)
+    return interval
+
+
+class HealthProber:
+    """Periodically probes due tools, bounded by a concurrency limit"""
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if settings.health_probe_enabled:
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Health probe round failed: {e}")
+            await asyncio.sleep(settings.health_probe_tick_seconds)
+
+    async def _probe(self, tool: Tool) -> Tuple[bool, float, Optional[str]]:
+        async with self.semaphore:
+            url = probe_url(tool)
+            started = time.perf_counter()
+            try:
+                client = get_http_client()
+                if url == tool.health_url:
+                    response = await client.get(url, timeout=settings.health_probe_timeout_seconds)
+                else:
+                    response = await client.head(url, timeout=settings.health_probe_timeout_seconds)
+                latency_ms = (time.perf_counter() - started) * 1000
+                # Any non-5xx answer means the host is up, even if "/" is not a real route
+                if response.status_code >= 500:
+                    return False, latency_ms, f"HTTP {response.status_code}"
+                mark_warm(tool_origin(tool.api_url))
+                return True, latency_ms, None
+            except httpx.HTTPError as e:
+                return False, (time.perf_counter() - started) * 1000, f"{type(e).__name__}: {e}"
+
+    async def run_once(self):
+        """Probe every tool whose interval has elapsed"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            tools = db.query(Tool).filter(Tool.approved == True, Tool.active == True).all()
+            if not tools:
+                return
+            usage = recent_usage(db, now, tools)
+            health_rows = {
+                row.tool_id: row
+                for row in db.query(ToolHealth).filter(ToolHealth.tool_id.in_([tool.id for tool in tools]))
+            }
+
+            due = []
+            for tool in tools:
+                health = health_rows.get(tool.id)
+                interval = probe_interval(tool, keep_warm(tool, usage.get(tool.id, (0, None)), now))
+                if health is None or health.last_checked_at is None or \
+                        (now - health.last_checked_at).total_seconds() >= interval:
+                    due.append(tool)
+            if not due:
+                return
+
+            results = await asyncio.gather(*(self._probe(tool) for tool in due))
+
+            checked_at = datetime.utcnow()
+            for tool, (up, latency_ms, error) in zip(due, results):
+                health = health_rows.get(tool.id)
+                if health is None:
+                    health = ToolHealth(tool_id=tool.id, checks_total=0, checks_failed=0, consecutive_failures=0)
+                    db.add(health)
+                was_cold = health.last_up_at is None or health.status != "up" or \
+                    (checked_at - health.last_up_at).total_seconds() >= COLD_AFTER_SECONDS
+
+                health.checks_total += 1
+                health.last_checked_at = checked_at
+                health.last_latency_ms = round(latency_ms, 2)
+                if up:
+                    if was_cold:
+                        health.cold_start_latency_ms = round(latency_ms, 2)
+                    health.status = "up"
+                    health.last_up_at = checked_at
+                    health.consecutive_failures = 0
+                    health.last_error = None
+                else:
+                    health.status = "down"
+                    health.checks_failed += 1
+                    health.consecutive_failures += 1
+                    health.last_error = error
+            db.commit()
+        finally:
+            db.close()
+
+
+health_prober = HealthProber(settings.health_probe_concurrency)
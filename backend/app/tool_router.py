@@ -0,0 +1,348 @@
+"""
+Deterministic Fast-Path Tool Router
+Selects a tool locally (exact tool names, owner trigger phrases and
+parameter extractors) before falling back to Gemini tool selection
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+from app.models import Tool
+
+# Confidence assigned to each kind of match. Contained matches stay below the
+# default fast_path_min_confidence: an owner's phrase found anywhere in someone
+# else's message is a hint for the LLM, not a reason to charge for the tool
+CONFIDENCE_PHRASE_PREFIX = 1.0
+CONFIDENCE_NAME_PREFIX = 0.95
+CONFIDENCE_PHRASE_CONTAINED = 0.8
+CONFIDENCE_NAME_CONTAINED = 0.75
+
+# Two tools scoring within this margin are treated as ambiguous
+AMBIGUITY_MARGIN = 0.05
+
+# Special extractor value: the text following the matched name/phrase
+REST_OF_MESSAGE = "$rest"
+
+# Owner regexes run on the event loop against user messages, so they are kept
+# short and free of repeated repetitions (catastrophic backtracking), and long
+# messages are left to the LLM
+MAX_PATTERN_LENGTH = 200
+MAX_ROUTED_MESSAGE_LENGTH = 1000
+EXTRACTOR_TYPES = ("str", "int", "float")
+
+
+@dataclass
+class ParameterExtractor:
+    name: str
+    pattern: Optional[re.Pattern]
+    value_type: str = "str"
+    required: bool = True
+    default: Any = None
+
+
+@dataclass
+class CompiledTool:
+    tool_id: int
+    tool_name: str
+    name_pattern: re.Pattern
+    phrase_patterns: List[Tuple[str, re.Pattern]] = field(default_factory=list)
+    extractors: List[ParameterExtractor] = field(default_factory=list)
+
+
+@dataclass
+class RouteMatch:
+    tool_id: int
+    tool_name: str
+    confidence: float
+    matched_rule: str
+    parameters: Dict[str, Any]
+
+
+def normalize_message(message: str) -> str:
+    """Collapse whitespace so phrase matching is stable (matching itself is case-insensitive)"""
+    return " ".join(message.split())
+
+
+def _phrase_pattern(phrase: str) -> re.Pattern:
+    words = [re.escape(word) for word in normalize_message(phrase).split()]
+    return re.compile(r"\b" + r"\s+".join(words) + r"\b", re.IGNORECASE)
+
+
+def _repeats_repetition(pattern: str) -> bool:
+    """Whether a repeated group contains a repetition itself, e.g. (a+)+ or (\\w*\\s)*"""
+    stack = [False]  # Per open group: does it contain a quantifier
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\":
+            index += 2
+            continue
+        if char == "[":
+            # Skip the character class; a ] right after [ or [^ is literal
+            index += 1
+            if pattern[index:index + 1] == "^":
+                index += 1
+            if pattern[index:index + 1] == "]":
+                index += 1
+            while index < len(pattern) and pattern[index] != "]":
+                index += 2 if pattern[index] == "\\" else 1
+        elif char == "(":
+            stack.append(False)
+        elif char == ")" and len(stack) > 1:
+            inner = stack.pop()
+            if inner and pattern[index + 1:index + 2] in ("*", "+", "{"):
+                return True
+            stack[-1] = stack[-1] or inner
+        elif char in "*+{":
+            stack[-1] = True
+        index += 1
+    return False
+
+
+def pattern_error(pattern: str) -> Optional[str]:
+    """Why an owner-supplied extractor pattern is refused, or None if it is usable"""
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        return f"longer than {MAX_PATTERN_LENGTH} characters"
+    if _repeats_repetition(pattern):
+        return "repeats a group that itself repeats"
+    if re.search(r"\\[1-9]|\(\?P=", pattern):
+        return "uses a backreference"
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        return str(e)
+    return None
+
+
+def _compile_extractors(raw: Optional[str], tool_name: str) -> List[ParameterExtractor]:
+    """
+    Parse a tool's parameter_extractors JSON
+
+    Accepted forms per parameter:
+        "query": "$rest"
+        "seats": "(\\d+) seats?"
+        "seats": {"pattern": "(\\d+) seats?", "type": "int", "required": false, "default": 1}
+    """
+    if not raw:
+        return []
+    try:
+        spec = json.loads(raw)
+    except json.JSONDecodeError as e:
+        print(f"Ignoring invalid parameter_extractors on tool {tool_name}: {e}")
+        return []
+
+    extractors = []
+    for param_name, rule in spec.items():
+        if isinstance(rule, str):
+            rule = {"pattern": rule}
+        pattern = rule.get("pattern")
+        if not isinstance(pattern, str):
+            print(f"Ignoring extractor {param_name} on tool {tool_name}: no pattern")
+            continue
+        error = None if pattern == REST_OF_MESSAGE else pattern_error(pattern)
+        if error:
+            # Rules stored before validation tightened are skipped, not run
+            print(f"Ignoring extractor {param_name} on tool {tool_name}: {error}")
+            continue
+        compiled = None if pattern == REST_OF_MESSAGE else re.compile(pattern, re.IGNORECASE)
+        extractors.append(ParameterExtractor(
+            name=param_name,
+            pattern=compiled,
+            value_type=rule.get("type", "str"),
+            required=rule.get("required", True),
+            default=rule.get("default")
+        ))
+    return extractors
+
+
+def compile_tool(tool: Tool) -> CompiledTool:
+    """Build the matching rules for a single tool"""
+    phrases = []
+    if tool.trigger_phrases:
+        try:
+            phrases = [p for p in json.loads(tool.trigger_phrases) if isinstance(p, str) and p.strip()]
+        except json.JSONDecodeError as e:
+            print(f"Ignoring invalid trigger_phrases on tool {tool.name}: {e}")
+
+    return CompiledTool(
+        tool_id=tool.id,
+        tool_name=tool.name,
+        name_pattern=_phrase_pattern(tool.name),
+        phrase_patterns=[(phrase, _phrase_pattern(phrase)) for phrase in phrases],
+        extractors=_compile_extractors(tool.parameter_extractors, tool.name)
+    )
+
+
+def _coerce(value: str, value_type: str) -> Any:
+    if value_type == "int":
+        return int(value)
+    if value_type == "float":
+        return float(value)
+    return value.strip()
+
+
+def extract_parameters(
+    compiled: CompiledTool,
+    original_message: str,
+    rest: str
+) -> Optional[Dict[str, Any]]:
+    """
+    Run a tool's extractors against the message
+
+    Returns:
+        Parameters dict, or None if a required parameter could not be extracted
+    """
+    parameters: Dict[str, Any] = {}
+    for extractor in compiled.extractors:
+        value = None
+        if extractor.pattern is None:
+            value = rest or None
+        else:
+            match = extractor.pattern.search(original_message)
+            if match:
+                value = match.groupdict().get(extractor.name) or (match.group(1) if match.groups() else match.group(0))
+
+        if value is None:
+            if extractor.required:
+                return None
+            if extractor.default is not None:
+                parameters[extractor.name] = extractor.default
+            continue
+
+        try:
+            parameters[extractor.name] = _coerce(value, extractor.value_type)
+        except ValueError:
+            if extractor.required:
+                return None
+    return parameters
+
+
+class FastPathRouter:
+    """Index over the tool catalog that answers routing queries without the LLM"""
+
+    def __init__(self, tools: List[Tool]):
+        self.tools = [compile_tool(tool) for tool in tools]
+
+    def _score(self, compiled: CompiledTool, normalized: str) -> Optional[Tuple[float, str, str]]:
+        """Best (confidence, rule, rest_of_message) for one tool, or None"""
+        candidates = []
+        for phrase, pattern in compiled.phrase_patterns:
+            match = pattern.search(normalized)
+            if match:
+                confidence = CONFIDENCE_PHRASE_PREFIX if match.start() == 0 else CONFIDENCE_PHRASE_CONTAINED
+                candidates.append((confidence, f"phrase:{phrase}", normalized[match.end():].strip()))
+
+        match = compiled.name_pattern.search(normalized)
+        if match:
+            confidence = CONFIDENCE_NAME_PREFIX if match.start() == 0 else CONFIDENCE_NAME_CONTAINED
+            candidates.append((confidence, "tool_name", normalized[match.end():].strip()))
+
+        if not candidates:
+            return None
+        return max(candidates, key=lambda c: c[0])
+
+    def route(self, message: str, min_confidence: float) -> Optional[RouteMatch]:
+        """
+        Pick a tool for the message if the local rules are confident enough
+
+        Args:
+            message: The user's query
+            min_confidence: Threshold below which the LLM should decide instead
+
+        Returns:
+            RouteMatch, or None to fall back to LLM selection
+        """
+        normalized = normalize_message(message)
+        if len(normalized) > MAX_ROUTED_MESSAGE_LENGTH:
+            return None
+        scored = []
+        for compiled in self.tools:
+            score = self._score(compiled, normalized)
+            if score:
+                scored.append((score, compiled))
+
+        if not scored:
+            return None
+
+        scored.sort(key=lambda item: item[0][0], reverse=True)
+        (confidence, rule, rest), best = scored[0]
+
+        # Two different tools matching equally well is not a deterministic decision
+        if len(scored) > 1 and confidence - scored[1][0][0] < AMBIGUITY_MARGIN:
+            return None
+        if confidence < min_confidence:
+            return None
+
+        # Without extractors the LLM is better at filling in parameters, so only
+        # route locally when the message is nothing more than the name/phrase
+        if not best.extractors and rest:
+            return None
+
+        parameters = extract_parameters(best, message, rest)
+        if parameters is None:
+            return None
+
+        return RouteMatch(
+            tool_id=best.tool_id,
+            tool_name=best.tool_name,
+            confidence=confidence,
+            matched_rule=rule,
+            parameters=parameters
+        )
+
+
+# Compiled router keyed by catalog version, rebuilt when any tool changes
+_router_cache: Dict[str, Any] = {"key": None, "router": None}
+
+
+def _catalog_key(tools: List[Tool]) -> tuple:
+    return tuple(sorted((tool.id, tool.updated_at.isoformat() if tool.updated_at else "") for tool in tools))
+
+
+def get_fast_path_router(tools: List[Tool]) -> FastPathRouter:
+    """Return a compiled router for this catalog, reusing the previous one if unchanged"""
+    key = _catalog_key(tools)
+    if _router_cache["key"] != key:
+        _router_cache["router"] = FastPathRouter(tools)
+        _router_cache["key"] = key
+    return _router_cache["router"]
+
+
+def validate_routing_rules(trigger_phrases: Optional[str], parameter_extractors: Optional[str]) -> Optional[str]:
+    """
+    Validate owner-supplied routing rules
+
+    Returns:
+        Error message, or None if the rules are usable
+    """
+    if trigger_phrases:
+        try:
+            phrases = json.loads(trigger_phrases)
+        except json.JSONDecodeError:
+            return "trigger_phrases must be a JSON list of strings"
+        if not isinstance(phrases, list) or not all(isinstance(p, str) for p in phrases):
+            return "trigger_phrases must be a JSON list of strings"
+
+    if parameter_extractors:
+        try:
+            spec = json.loads(parameter_extractors)
+        except json.JSONDecodeError:
+            return "parameter_extractors must be a JSON object"
+        if not isinstance(spec, dict):
+            return "parameter_extractors must be a JSON object"
+        for param_name, rule in spec.items():
+            pattern = rule.get("pattern") if isinstance(rule, dict) else rule
+            if not isinstance(pattern, str):
+                return f"Extractor for '{param_name}' needs a pattern"
+            if isinstance(rule, dict):
+                if rule.get("type", "str") not in EXTRACTOR_TYPES:
+                    return f"Extractor type for '{param_name}' must be one of {', '.join(EXTRACTOR_TYPES)}"
+                if not isinstance(rule.get("required", True), bool):
+                    return f"Extractor 'required' for '{param_name}' must be true or false"
+            if pattern == REST_OF_MESSAGE:
+                continue
+            error = pattern_error(pattern)
+            if error:
+                return f"Invalid pattern for '{param_name}': {error}"
+    return None
@@ -0,0 +1,181 @@
+"""
+Tool Usage Rollups
+Hourly and daily per-tool aggregates (calls, gross MNEE, unique payers,
+failures) kept in tool_usage_rollups by a background aggregator. Each run
+finds the tool-days touched since its watermark (new payments, or any
+status change recorded in updated_at) and rebuilds those days and their
+hours from the raw transactions, so a rerun is always safe. Every
+transaction of a run locks the watermark row first, so aggregators in
+several processes never interleave the rebuild of the same day.
+"""
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import RollupWatermark, ToolUsageRollup, Transaction
+
+settings = get_settings()
+
+GRANULARITIES = ("hour", "day")
+
+# Payments that moved no money
+FAILED_STATUSES = ("failed", "dropped", "refunded")
+
+# Re-examined on every run to catch rows committed late (out of id order or
+# with an updated_at older than the previous run); rebuilding is idempotent
+OVERLAP = timedelta(minutes=5)
+
+WATERMARK = "tool_usage"
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    hour = timestamp.replace(minute=0, second=0, microsecond=0)
+    return hour if granularity == "hour" else hour.replace(hour=0)
+
+
+def _dirty_days(db: Session, watermark: RollupWatermark, max_id: int) -> Dict[datetime, Set[int]]:
+    """day -> tool ids with payments added or changed since the watermark"""
+    changed = [Transaction.id.between(watermark.last_transaction_id + 1, max_id)]
+    if watermark.last_run_at:
+        changed.append(Transaction.updated_at >= watermark.last_run_at - OVERLAP)
+
+    days: Dict[datetime, Set[int]] = defaultdict(set)
+    rows = db.query(Transaction.tool_id, Transaction.created_at).filter(or_(*changed)).yield_per(5000)
+    for tool_id, created_at in rows:
+        days[bucket_start(created_at, "day")].add(tool_id)
+    return days
+
+
+def _rebuild_day(db: Session, day: datetime, tool_ids: Set[int], now: datetime) -> int:
+    """Recompute the day and hour rollups of one day for the given tools"""
+    # (tool_id, granularity, bucket) -> [owner, calls, gross, failures, payers]
+    buckets: Dict[Tuple[int, str, datetime], list] = {}
+    rows = db.query(
+        Transaction.tool_id, Transaction.to_user_id, Transaction.from_user_id,
+        Transaction.amount_mnee, Transaction.status, Transaction.created_at
+    ).filter(
+        Transaction.created_at >= day,
+        Transaction.created_at < day + timedelta(days=1),
+        Transaction.tool_id.in_(tool_ids),
+        Transaction.from_user_id != Transaction.to_user_id  # Self-payments are not revenue
+    ).yield_per(5000)
+    for tool_id, owner_id, payer_id, amount, status, created_at in rows:
+        for granularity in GRANULARITIES:
+            key = (tool_id, granularity, bucket_start(created_at, granularity))
+            bucket = buckets.setdefault(key, [owner_id, 0, 0.0, 0, set()])
+            bucket[1] += 1
+            if status in FAILED_STATUSES:
+                bucket[3] += 1
+            else:
+                bucket[2] += amount or 0.0
+            bucket[4].add(payer_id)
+
+    db.query(ToolUsageRollup).filter(
+        ToolUsageRollup.tool_id.in_(tool_ids),
+        ToolUsageRollup.bucket_start >= day,
+        ToolUsageRollup.bucket_start < day + timedelta(days=1)
+    ).delete(synchronize_session=False)
+    db.bulk_insert_mappings(ToolUsageRollup, [
+        {
+            "tool_id": tool_id,
+            "granularity": granularity,
+            "bucket_start": start,
+            "owner_id": owner_id,
+            "calls": calls,
+            "gross_mnee": gross,
+            "failures": failures,
+            "unique_payers": len(payers),
+            "updated_at": now
+        }
+        for (tool_id, granularity, start), (owner_id, calls, gross, failures, payers) in buckets.items()
+    ])
+    return len(buckets)
+
+
+def _lock_watermark(db: Session) -> RollupWatermark:
+    """Lock the watermark row until the current transaction ends, creating it on first use"""
+    def locked():
+        return db.query(RollupWatermark).filter(
+            RollupWatermark.name == WATERMARK
+        ).with_for_update().populate_existing().first()
+
+    watermark = locked()
+    if watermark is None:
+        try:
+            with db.begin_nested():
+                db.add(RollupWatermark(name=WATERMARK, last_transaction_id=0))
+        except IntegrityError:
+            pass  # Another process created it first
+        watermark = locked()
+    return watermark
+
+
+def refresh_rollups(db: Session) -> Dict[str, int]:
+    """
+    Bring tool_usage_rollups up to date with the transactions table
+
+    Returns:
+        Counts of days rebuilt and rollup rows written
+    """
+    now = datetime.utcnow()
+    watermark = _lock_watermark(db)
+    max_id = db.query(func.max(Transaction.id)).scalar() or 0
+
+    days = _dirty_days(db, watermark, max_id)
+    written = 0
+    for day in sorted(days):
+        # One commit per day keeps transactions short during a backfill; the
+        # lock is retaken each time so no other run deletes or inserts this day
+        _lock_watermark(db)
+        written += _rebuild_day(db, day, days[day], now)
+        db.commit()
+
+    # Never move the watermark back past a run that started later and finished first
+    watermark = _lock_watermark(db)
+    watermark.last_transaction_id = max(watermark.last_transaction_id, max_id)
+    watermark.last_run_at = max(watermark.last_run_at or now, now)
+    db.commit()
+    return {"days": len(days), "rows": written}
+
+
+class RollupAggregator:
+    """Refreshes the usage rollups on a fixed interval"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        if settings.rollup_interval_seconds > 0:
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Usage rollup refresh failed: {e}")
+            await asyncio.sleep(settings.rollup_interval_seconds)
+
+    async def run_once(self) -> Dict[str, int]:
+        async with self.lock:
+            db = SessionLocal()
+            try:
+                return await asyncio.to_thread(refresh_rollups, db)
+            finally:
+                db.close()
+
+
+rollup_aggregator = RollupAggregator()
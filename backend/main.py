@@ -1,16 +1,58 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.database import engine, Base
+from app.database import run_migrations
 from app.routes import auth, tools, payments, admin, mcp, settings as settings_router, agent, demo
 from app.config import get_settings
+from app.job_service import job_runner
+from app.http_client import close_http_client
+from app.tool_health import health_prober
+from app.chain import close_web3, fee_oracle
+from app.confirmation_tracker import confirmation_tracker
+from app.balance_ledger import balance_reconciler
+from app.settlement import settlement_scheduler
+from app.credit import deposit_watcher
+from app.usage_rollups import rollup_aggregator
+from app.signer import signer
+from app.payment_engine import payment_engine
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Create tables
-    Base.metadata.create_all(bind=engine)
+    # Startup: bring the schema up to date (Alembic owns it; see alembic/versions)
+    await asyncio.to_thread(run_migrations)
+    # Keep fee suggestions warm so transfers need no fee RPC
+    await fee_oracle.start()
+    # Requeue unsent on-chain payments and start the payment workers
+    await payment_engine.start()
+    # Resume unfinished async jobs and start the worker pool
+    await job_runner.start()
+    # Probe tool hosts and keep popular ones warm
+    await health_prober.start()
+    # Finalize pending payments from on-chain receipts
+    await confirmation_tracker.start()
+    # Periodically rebuild the balance ledger from the transaction log
+    await balance_reconciler.start()
+    # Net and settle off-chain payments (ledger payment mode only)
+    await settlement_scheduler.start()
+    # Credit escrow deposits and finalize withdrawals (credit payment mode only)
+    await deposit_watcher.start()
+    # Keep hourly/daily tool usage rollups current
+    await rollup_aggregator.start()
     yield
-    # Shutdown: cleanup if needed
+    # Shutdown: stop background workers (in-flight jobs are recovered on next start)
+    await rollup_aggregator.stop()
+    await deposit_watcher.stop()
+    await settlement_scheduler.stop()
+    await balance_reconciler.stop()
+    await confirmation_tracker.stop()
+    await health_prober.stop()
+    await job_runner.stop()
+    await payment_engine.stop()
+    await fee_oracle.stop()
+    await close_http_client()
+    await close_web3()
+    signer.close()
 
 app = FastAPI(
     title="StableTool API",
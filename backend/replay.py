@@ -0,0 +1,385 @@
+"""
+Trace replay harness for performance regression testing
+Replays a sample of recorded conversations against the app in-process,
+with Gemini, tool hosts and the chain replaced by local stand-ins, and
+compares the latency/throughput report with a saved baseline
+
+Usage:
+    python replay.py --source-url $DATABASE_URL --sample 200 --speed 10 --output report.json
+    python replay.py --trace trace.json --rate 20 --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from cryptography.fernet import Fernet
+from sqlalchemy import create_engine, text
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_ADDRESS = re.compile(r"0x[0-9a-fA-F]{8,}")
+_LONG_NUMBER = re.compile(r"\b\d{6,}\b")
+
+REPLAY_TOOL_HOST = "http://replay-tool.local"
+
+
+# ---------------------------------------------------------------------------
+# Trace capture
+# ---------------------------------------------------------------------------
+
+def anonymize(value: Optional[str]) -> Optional[str]:
+    """Strip emails, wallet/tx hashes and long digit runs from recorded text"""
+    if value is None:
+        return None
+    value = _EMAIL.sub("user@example.com", value)
+    value = _ADDRESS.sub(lambda m: "0x" + "0" * (len(m.group(0)) - 2), value)
+    return _LONG_NUMBER.sub(lambda m: "0" * len(m.group(0)), value)
+
+
+def load_trace(source_url: str, sample: int, since: Optional[str]) -> List[Dict[str, Any]]:
+    """Read an anonymized sample of conversations, in original arrival order"""
+    engine = create_engine(source_url)
+    query = """
+        SELECT user_id, user_message, tool_selected, tool_result, final_response, created_at
+        FROM conversations
+        {where}
+        ORDER BY created_at DESC
+        LIMIT :sample
+    """.format(where="WHERE created_at >= :since" if since else "")
+    params: Dict[str, Any] = {"sample": sample}
+    if since:
+        params["since"] = datetime.fromisoformat(since)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(query), params).mappings().all()
+    engine.dispose()
+
+    # Pseudonymous, stable user ids per trace
+    user_ids: Dict[int, int] = {}
+    trace = []
+    for row in reversed(rows):
+        created_at = row["created_at"]
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+        trace.append({
+            "user": user_ids.setdefault(row["user_id"], len(user_ids) + 1),
+            "message": anonymize(row["user_message"]),
+            "tool": row["tool_selected"],
+            "tool_result": anonymize(row["tool_result"]),
+            "final_response": anonymize(row["final_response"]),
+            "timestamp": created_at.timestamp()
+        })
+    return trace
+
+
+def arrival_offsets(trace: List[Dict[str, Any]], speed: float, rate: Optional[float], max_gap: float) -> List[float]:
+    """Seconds after start at which each request is sent"""
+    if rate:
+        # Poisson arrivals at a fixed rate
+        offsets, clock = [], 0.0
+        for _ in trace:
+            offsets.append(clock)
+            clock += random.expovariate(rate)
+        return offsets
+
+    offsets, clock = [], 0.0
+    previous = trace[0]["timestamp"] if trace else 0.0
+    for entry in trace:
+        clock += min(max(entry["timestamp"] - previous, 0.0), max_gap) / speed
+        offsets.append(clock)
+        previous = entry["timestamp"]
+    return offsets
+
+
+# ---------------------------------------------------------------------------
+# Local stand-ins
+# ---------------------------------------------------------------------------
+
+class StubChunk:
+    def __init__(self, text_value: str):
+        self.text = text_value
+
+
+class StubResponse(list):
+    """Looks like a Gemini response whether it is read whole or streamed"""
+
+    @property
+    def text(self) -> str:
+        return "".join(chunk.text for chunk in self)
+
+
+def install_stubs(trace: List[Dict[str, Any]], tool_ids: Dict[str, int], llm_latency: float, tool_latency: float):
+    """Replace Gemini, the shared tool HTTP client and the chain with local stand-ins"""
+    import httpx
+    from app import groq_service, http_client, chain
+
+    by_message = {entry["message"]: entry for entry in trace}
+    selection_prompt = re.compile(r"User Request: (.*?)\n\nAnalyze the user's request", re.S)
+    final_prompt = re.compile(r'The user asked: "(.*?)"\n', re.S)
+
+    def generate(self, model, generation_config, prompt, stream=False):
+        time.sleep(llm_latency)
+        match = selection_prompt.search(prompt)
+        if match:
+            entry = by_message.get(match.group(1), {})
+            tool = entry.get("tool")
+            selection = json.dumps({
+                "tool_id": tool_ids.get(tool),
+                "tool_name": tool,
+                "parameters": {},
+                "reasoning": "replayed selection"
+            })
+            # Split into a few chunks so the streaming parser is exercised
+            step = max(len(selection) // 4, 1)
+            return StubResponse(StubChunk(selection[i:i + step]) for i in range(0, len(selection), step))
+        match = final_prompt.search(prompt)
+        entry = by_message.get(match.group(1), {}) if match else {}
+        return StubResponse([StubChunk(entry.get("final_response") or "OK")])
+
+    groq_service.GeminiClient.generate = generate
+
+    results_by_tool = {}
+    for entry in trace:
+        if entry["tool"] and entry["tool_result"]:
+            results_by_tool.setdefault(entry["tool"], entry["tool_result"])
+    names_by_id = {tool_id: name for name, tool_id in tool_ids.items()}
+
+    async def tool_host(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(tool_latency)
+        tool_id = request.url.path.strip("/")
+        recorded = results_by_tool.get(names_by_id.get(int(tool_id))) if tool_id.isdigit() else None
+        return httpx.Response(200, content=recorded or '{"ok": true}', headers={"content-type": "application/json"})
+
+    http_client._client = httpx.AsyncClient(transport=httpx.MockTransport(tool_host))
+
+    async def no_chain(*args):
+        raise RuntimeError("Replay runs without a chain; this code path needs a chain stand-in")
+
+    # rpc_batch posts through _rpc_post, bypassing get_web3's provider
+    chain.get_web3 = no_chain
+    chain._rpc_post = no_chain
+
+
+# ---------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------
+
+def seed_database(trace: List[Dict[str, Any]]) -> tuple[Dict[int, str], Dict[str, int]]:
+    """Create synthetic users and tools matching the trace; return (tokens, tool ids)"""
+    from app.database import SessionLocal
+    from app.models import User, Tool
+    from app.crypto import encrypt_data, get_encryption_key, calculate_metadata_hash
+    from app.security import create_access_token
+
+    db = SessionLocal()
+    try:
+        tokens: Dict[int, str] = {}
+        encrypted_key = encrypt_data("replay-gemini-key", get_encryption_key())
+        for user_number in sorted({entry["user"] for entry in trace}):
+            email = f"replay-{user_number}@example.com"
+            user = User(
+                email=email,
+                hashed_password="replay",
+                public_key=f"0x{user_number:040x}",
+                encrypted_private_key="replay",
+                wallet_address=f"0x{user_number:040x}",
+                groq_api_key=encrypted_key
+            )
+            db.add(user)
+            tokens[user_number] = create_access_token({"sub": email})
+        db.commit()
+
+        owner = db.query(User).first()
+        tool_ids: Dict[str, int] = {}
+        for name in sorted({entry["tool"] for entry in trace if entry["tool"]}):
+            tool = Tool(
+                name=name,
+                description=f"Replay stand-in for {name}",
+                api_url=REPLAY_TOOL_HOST,
+                api_method="POST",
+                metadata_hash="replay",
+                price_mnee=0.1,
+                owner_id=owner.id,
+                approved=True
+            )
+            db.add(tool)
+            db.flush()
+            tool.api_url = f"{REPLAY_TOOL_HOST}/{tool.id}"
+            tool.metadata_hash = calculate_metadata_hash(tool.api_url, tool.api_method, "", "")
+            tool_ids[name] = tool.id
+        db.commit()
+        return tokens, tool_ids
+    finally:
+        db.close()
+
+
+async def replay(trace: List[Dict[str, Any]], offsets: List[float], tokens: Dict[int, str], concurrency: int) -> Dict[str, Any]:
+    import httpx
+    from main import app, lifespan
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    status_counts: Dict[str, int] = {}
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=300.0) as client:
+            started = time.perf_counter()
+
+            async def send(entry: Dict[str, Any], offset: float):
+                await asyncio.sleep(max(offset - (time.perf_counter() - started), 0.0))
+                async with semaphore:
+                    sent = time.perf_counter()
+                    try:
+                        response = await client.post(
+                            "/api/agent/chat",
+                            json={"message": entry["message"]},
+                            headers={"Authorization": f"Bearer {tokens[entry['user']]}"}
+                        )
+                        key = str(response.status_code)
+                    except Exception as e:
+                        key = type(e).__name__
+                    latencies.append((time.perf_counter() - sent) * 1000)
+                    status_counts[key] = status_counts.get(key, 0) + 1
+
+            await asyncio.gather(*(send(entry, offset) for entry, offset in zip(trace, offsets)))
+            duration = time.perf_counter() - started
+
+    return build_report(latencies, status_counts, duration)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def build_report(latencies: List[float], status_counts: Dict[str, int], duration: float) -> Dict[str, Any]:
+    errors = sum(count for key, count in status_counts.items() if key != "200")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 3) if duration else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 2),
+            "p90": round(percentile(latencies, 90), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(max(latencies), 2) if latencies else 0.0
+        },
+        "status_counts": status_counts
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """Print deltas against the baseline; return False on a regression beyond tolerance"""
+    ok = True
+    print("\nComparison with baseline:")
+    for metric in ("p50", "p95", "p99"):
+        current = report["latency_ms"][metric]
+        previous = baseline["latency_ms"][metric]
+        change = (current - previous) / previous if previous else 0.0
+        regressed = change > tolerance
+        ok = ok and not regressed
+        print(f"{'✗' if regressed else '✓'} {metric}: {previous} -> {current} ms ({change:+.1%})")
+
+    current, previous = report["throughput_rps"], baseline["throughput_rps"]
+    change = (current - previous) / previous if previous else 0.0
+    regressed = change < -tolerance
+    ok = ok and not regressed
+    print(f"{'✗' if regressed else '✓'} throughput: {previous} -> {current} req/s ({change:+.1%})")
+
+    if report["errors"] > baseline["errors"]:
+        ok = False
+        print(f"✗ errors: {baseline['errors']} -> {report['errors']}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded conversations against stubbed dependencies")
+    parser.add_argument("--source-url", default=os.getenv("DATABASE_URL"), help="Database holding the conversations table")
+    parser.add_argument("--trace", help="Replay a trace file written by --save-trace instead of reading the database")
+    parser.add_argument("--save-trace", help="Write the anonymized trace to this file")
+    parser.add_argument("--sample", type=int, default=200, help="Number of most recent conversations to replay")
+    parser.add_argument("--since", help="Only conversations created at or after this ISO timestamp")
+    parser.add_argument("--speed", type=float, default=1.0, help="Scale original arrival gaps (2 = twice as fast)")
+    parser.add_argument("--rate", type=float, help="Ignore recorded timing and send Poisson arrivals at this req/s")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="Cap on any single recorded gap, in seconds")
+    parser.add_argument("--concurrency", type=int, default=50, help="Maximum requests in flight")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Simulated Gemini latency per call, seconds")
+    parser.add_argument("--tool-latency", type=float, default=0.2, help="Simulated tool host latency, seconds")
+    parser.add_argument("--output", help="Write the report JSON here")
+    parser.add_argument("--baseline", help="Compare against this report JSON; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace) as f:
+            trace = json.load(f)
+    elif args.source_url:
+        trace = load_trace(args.source_url, args.sample, args.since)
+    else:
+        parser.error("--source-url (or DATABASE_URL) or --trace is required")
+
+    if not trace:
+        print("No conversations to replay")
+        return
+    if args.save_trace:
+        with open(args.save_trace, "w") as f:
+            json.dump(trace, f)
+    print(f"Replaying {len(trace)} conversations")
+
+    # The app reads settings at import time, so point it at a throwaway database first
+    replay_db = os.path.join(tempfile.mkdtemp(prefix="replay-"), "replay.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{replay_db}"
+    os.environ.setdefault("SECRET_KEY", "replay-secret")
+    os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+    os.environ.setdefault("ETHEREUM_RPC_URL", "http://127.0.0.1:8545")
+    os.environ.setdefault("ADMIN_EMAIL", "admin@example.com")
+    os.environ["FAST_PATH_SHADOW_RATE"] = "0"
+    os.environ["PREWARM_ENABLED"] = "false"
+    os.environ["HEALTH_PROBE_ENABLED"] = "false"
+    os.environ["CONFIRMATION_ENABLED"] = "false"
+    # No background service may poll the RPC or write to the database during a replay
+    os.environ["PAYMENT_MODE"] = "onchain"  # Keeps the settlement scheduler and deposit watcher off
+    os.environ["FEE_REFRESH_SECONDS"] = "0"
+    os.environ["PAYMENT_RECOVERY_SECONDS"] = "0"
+    os.environ["JOB_RECOVERY_SECONDS"] = "0"
+    os.environ["BALANCE_RECONCILE_INTERVAL_SECONDS"] = "0"
+    os.environ["ROLLUP_INTERVAL_SECONDS"] = "0"
+
+    from app.database import run_migrations
+    run_migrations()
+    tokens, tool_ids = seed_database(trace)
+    install_stubs(trace, tool_ids, args.llm_latency, args.tool_latency)
+
+    offsets = arrival_offsets(trace, args.speed, args.rate, args.max_gap)
+    report = asyncio.run(replay(trace, offsets, tokens, args.concurrency))
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()